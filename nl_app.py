@@ -13,9 +13,9 @@
 # limitations under the License.
 """Main entry module for NL app."""
 
-import sys
-
+import gc
 import logging
+import sys
 
 from nl_server.__init__ import create_app
 
@@ -28,6 +28,11 @@ logging.basicConfig(
 
 app = create_app()
 
+# Stop the GC from tracking the objects loaded so far. When gunicorn preloads
+# the app and forks workers from it, the GC would otherwise write to the pages
+# of these objects in each worker and undo the copy-on-write sharing.
+gc.freeze()
+
 if __name__ == '__main__':
   # This is used when running locally only. When deploying to GKE,
   # a webserver process such as Gunicorn will serve the app.
@@ -21,6 +21,7 @@ import torch
 import yaml
 
 import nl_server.loader as loader
+import nl_server.reloader as reloader
 import nl_server.routes as routes
 
 
@@ -62,12 +63,23 @@ def create_app():
 
   # Initialize the NL module.
   with open(app.config['EMBEDDINGS_CONFIG_PATH']) as f:
-    embeddings_map = yaml.full_load(f)
-    if not embeddings_map:
+    embeddings_config = yaml.full_load(f)
+    if not embeddings_config:
       logging.error("No configuration found for embeddings")
       return
 
+    embeddings_map, search_configs = loader.parse_embeddings_config(
+        embeddings_config)
     app.config['EMBEDDINGS_VERSION_MAP'] = embeddings_map
-    loader.load_embeddings(app, embeddings_map, models_downloaded_paths)
+    app.config['EMBEDDINGS_SEARCH_CONFIGS'] = search_configs
+    loader.load_embeddings(app, embeddings_map, models_downloaded_paths,
+                           search_configs)
+
+  # Swap in new embeddings versions without a restart, when the config changes.
+  if flask_env not in ['test', 'integration_test', 'webdriver']:
+    embeddings_reloader = reloader.Reloader(
+        app, app.config['EMBEDDINGS_CONFIG_PATH'],
+        app.config['MODELS_CONFIG_PATH'])
+    embeddings_reloader.start()
 
   return app
@@ -0,0 +1,183 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro-batching of concurrent requests.
+
+Concurrent callers submit items to a MicroBatcher, which groups them (up to a
+maximum batch size) and processes them with a single call, e.g. to run one model
+forward pass for the queries of many concurrent requests.
+
+A batch is dispatched as soon as it holds every item submitted so far, so an
+item submitted when the batcher is idle is processed right away, and the items
+submitted while a batch is being processed are grouped into the next one.
+"""
+
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+_QUEUE_WAIT_MS_BOUNDS = [0.5, 1, 2, 5, 10, 20, 50, 100]
+_BATCH_SIZE_BOUNDS = [1, 2, 4, 8, 16, 32, 64]
+
+
+class Histogram:
+  """Counts of observed values, bucketed by upper bounds."""
+
+  def __init__(self, bounds: List[float]):
+    self.bounds = bounds
+    self._counts = [0] * (len(bounds) + 1)
+    self._sum = 0.0
+    self._lock = threading.Lock()
+
+  def observe(self, value: float):
+    with self._lock:
+      i = 0
+      while i < len(self.bounds) and value > self.bounds[i]:
+        i += 1
+      self._counts[i] += 1
+      self._sum += value
+
+  def snapshot(self) -> Dict[str, Any]:
+    with self._lock:
+      buckets = {str(b): c for b, c in zip(self.bounds, self._counts)}
+      buckets['+Inf'] = self._counts[-1]
+      count = sum(self._counts)
+      return {
+          'buckets': buckets,
+          'count': count,
+          'mean': self._sum / count if count else 0.0,
+      }
+
+
+class MicroBatcher:
+  """Processes concurrently submitted items in batches.
+
+  `process_fn` takes a list of items and returns the list of their results, in
+  the same order. An exception raised by it is raised to every caller whose
+  item was in the batch.
+  """
+
+  def __init__(self,
+               process_fn: Callable[[List[Any]], List[Any]],
+               max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+               max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+    self.process_fn = process_fn
+    self.max_batch_size = max_batch_size
+    self.max_wait_ms = max_wait_ms
+    self.queue_wait_ms = Histogram(_QUEUE_WAIT_MS_BOUNDS)
+    self.batch_size = Histogram(_BATCH_SIZE_BOUNDS)
+    self._lock = threading.Lock()
+    self._queue = None
+    self._pid = None
+    self._closed = False
+    # Number of items submitted to the queue but not taken by the worker yet.
+    self._pending = 0
+
+  def submit(self, item: Any) -> Any:
+    """Blocks until `item` is processed and returns its result."""
+    future = Future()
+    # The item is queued under the lock, so that it is ahead of the stop
+    # sentinel of a concurrent close(), and so is processed.
+    with self._lock:
+      q = self._get_queue()
+      if q:
+        self._pending += 1
+        q.put((time.perf_counter(), item, future))
+    if not q:
+      # Closed, so process it on its own.
+      return self.process_fn([item])[0]
+    return future.result()
+
+  def close(self):
+    """Stops the worker thread once the items submitted so far are processed.
+
+    Items submitted after this are processed one at a time by their callers.
+    """
+    with self._lock:
+      self._closed = True
+      if self._queue and self._pid == os.getpid():
+        self._queue.put(None)
+      self._queue = None
+
+  def _get_queue(self) -> Optional[queue.Queue]:
+    # Called with the lock held.
+    # The worker thread is started on first use, and again in a process forked
+    # after that (e.g. a gunicorn worker of a preloaded app), since threads do
+    # not survive a fork.
+    if self._closed:
+      return None
+    if self._pid != os.getpid():
+      self._queue = queue.Queue()
+      self._pid = os.getpid()
+      self._pending = 0
+      threading.Thread(target=self._run, args=(self._queue,),
+                       daemon=True).start()
+    return self._queue
+
+  def _take(self, q: queue.Queue, timeout: Optional[float] = None):
+    item = q.get(timeout=timeout)
+    if item is not None:
+      with self._lock:
+        self._pending -= 1
+    return item
+
+  def _run(self, q: queue.Queue):
+    while True:
+      item = self._take(q)
+      if item is None:
+        return
+      batch = [item]
+      # Only wait (for at most max_wait_ms) for items that were submitted but
+      # are not in the queue yet, rather than for items that may come later.
+      deadline = time.perf_counter() + self.max_wait_ms / 1000
+      while len(batch) < self.max_batch_size:
+        with self._lock:
+          pending = self._pending
+        remaining = deadline - time.perf_counter()
+        if not pending or remaining <= 0:
+          break
+        try:
+          item = self._take(q, timeout=remaining)
+        except queue.Empty:
+          break
+        if item is None:
+          self._process(batch)
+          return
+        batch.append(item)
+      self._process(batch)
+
+  def _process(self, batch: List):
+    start = time.perf_counter()
+    for submitted, _, _ in batch:
+      self.queue_wait_ms.observe((start - submitted) * 1000)
+    self.batch_size.observe(len(batch))
+    try:
+      results = self.process_fn([item for _, item, _ in batch])
+    except Exception as e:
+      for _, _, future in batch:
+        future.set_exception(e)
+      return
+    for (_, _, future), result in zip(batch, results):
+      future.set_result(result)
+
+  def stats(self) -> Dict[str, Any]:
+    return {
+        'queue_wait_ms': self.queue_wait_ms.snapshot(),
+        'batch_size': self.batch_size.snapshot(),
+    }
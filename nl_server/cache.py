@@ -0,0 +1,60 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A bounded, thread-safe LRU cache that counts its hits and misses."""
+
+from collections import OrderedDict
+import threading
+from typing import Any, Dict, Hashable
+
+
+class LRUCache:
+
+  def __init__(self, max_size: int):
+    self.max_size = max_size
+    self._entries: OrderedDict = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key: Hashable) -> Any:
+    """Returns the value of `key`, or None if it is not cached."""
+    with self._lock:
+      value = self._entries.get(key)
+      if value is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return value
+
+  def put(self, key: Hashable, value: Any):
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      lookups = self.hits + self.misses
+      return {
+          'size': len(self._entries),
+          'max_size': self.max_size,
+          'hits': self.hits,
+          'misses': self.misses,
+          'hit_rate': self.hits / lookups if lookups else 0.0,
+      }
@@ -14,79 +14,167 @@
 """Managing the embeddings."""
 from dataclasses import dataclass
 import logging
-import os
-from typing import Dict, List, Union
+import threading
+import time
+from typing import Dict, List, Optional, Union
 
-from datasets import load_dataset
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import semantic_search
-import torch
+import numpy as np
 
+from nl_server import batcher
+from nl_server import embeddings_file
+from nl_server import models
 from nl_server import query_util
+from nl_server import search
 from shared.lib import constants
 from shared.lib import detected_variables as vars
 from shared.lib import utils
 
-MODEL_NAME = 'all-MiniLM-L6-v2'
-
 # A value higher than the highest score.
 _HIGHEST_SCORE = 1.0
 _INIT_SCORE = (_HIGHEST_SCORE + 0.1)
+# An upper bound on the score of a query part that wasn't searched yet. Cosine
+# scores of normalized float32 embeddings can be slightly above 1.
+_PART_SCORE_BOUND = _HIGHEST_SCORE + 1e-3
 
 # Scores below this are ignored.
 _SV_SCORE_THRESHOLD = 0.5
 
 _NUM_CANDIDATES_PER_NSPLIT = 3
 
+# Buckets of query length (in words, after removing stop words) that SV
+# detection stats are reported by.
+_QUERY_LENGTH_BOUNDS = [4, 8, 12]
+_LATENCY_MS_BOUNDS = [5, 10, 20, 50, 100, 200, 500, 1000]
+_NUM_PARTS_BOUNDS = [1, 5, 10, 20, 40, 80]
+
 # Number of matches to find within the SV index.
 _NUM_SV_INDEX_MATCHES = 40
 
 
+class QueryLengthStats:
+  """Histograms of the SV detection latency and of the number of queries and
+  query parts searched, by query length."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._latency_ms: Dict[str, batcher.Histogram] = {}
+    self._parts_searched: Dict[str, batcher.Histogram] = {}
+
+  def observe(self, num_words: int, latency_ms: float, parts_searched: int):
+    bucket = _query_length_bucket(num_words)
+    with self._lock:
+      if bucket not in self._latency_ms:
+        self._latency_ms[bucket] = batcher.Histogram(_LATENCY_MS_BOUNDS)
+        self._parts_searched[bucket] = batcher.Histogram(_NUM_PARTS_BOUNDS)
+    self._latency_ms[bucket].observe(latency_ms)
+    self._parts_searched[bucket].observe(parts_searched)
+
+  def snapshot(self) -> Dict[str, Dict]:
+    with self._lock:
+      buckets = list(self._latency_ms)
+    return {
+        b: {
+            'latency_ms': self._latency_ms[b].snapshot(),
+            'parts_searched': self._parts_searched[b].snapshot(),
+        }
+        # By the lower bound of the bucket, e.g. 5 for "5-8" and 13 for "13+".
+        for b in sorted(buckets, key=lambda b: int(b.rstrip('+').split('-')[0]))
+    }
+
+
+def _query_length_bucket(num_words: int) -> str:
+  lower = 0
+  for upper in _QUERY_LENGTH_BOUNDS:
+    if num_words <= upper:
+      return f'{lower}-{upper}'
+    lower = upper + 1
+  return f'{lower}+'
+
+
 class Embeddings:
   """Manages the embeddings."""
 
   def __init__(self,
                embeddings_path: str,
-               existing_model_path: str = "") -> None:
-    if existing_model_path:
-      assert os.path.exists(existing_model_path)
-      self.model = SentenceTransformer(existing_model_path)
-    else:
-      self.model = SentenceTransformer(MODEL_NAME)
-    self.dataset_embeddings: torch.Tensor = None
-    self.dcids: List[str] = []
-    self.sentences: List[str] = []
+               existing_model_path: str = "",
+               search_config: Dict = None) -> None:
+    # Shared with the other indices that use the same model.
+    self.model = models.get(existing_model_path)
 
-    logging.info('Loading embeddings file')
+    logging.info(f'Loading embeddings file {embeddings_path}')
     try:
-      ds = load_dataset('csv', data_files=embeddings_path)
+      if (search_config or {}).get('quantization'):
+        # A quantized index only reads the full precision rows it re-ranks, so
+        # keep them memory-mapped rather than in the heap next to the
+        # quantized copy.
+        data = embeddings_file.load_mapped(embeddings_path)
+      else:
+        data = embeddings_file.load(embeddings_path)
     except:
       error_str = "No embedding could be loaded."
       logging.error(error_str)
       raise Exception("No embedding could be loaded.")
 
-    self.df = ds["train"].to_pandas()
-    self.dcids = self.df['dcid'].values.tolist()
-    self.df = self.df.drop('dcid', axis=1)
-    # Also get the sentence mappings.
-    self.sentences = []
-    if 'sentence' in self.df:
-      self.sentences = self.df['sentence'].values.tolist()
-      self.df = self.df.drop('sentence', axis=1)
+    self.dcids: List[str] = data.dcids
+    self.sentences: List[str] = data.sentences
+    # The nearest-neighbour index over the sentence embeddings, either exact
+    # or approximate depending on `search_config`.
+    self.index = search.create(data.embeddings,
+                               search_config,
+                               normalized=data.normalized)
+    # Batches the queries of concurrent requests into one encode and search.
+    self.batcher = batcher.MicroBatcher(self._encode_and_search)
+    self.query_length_stats = QueryLengthStats()
+
+  def __getstate__(self):
+    # The batcher and stats hold locks (and threads), so they are recreated on
+    # unpickling.
+    state = self.__dict__.copy()
+    del state['batcher']
+    del state['query_length_stats']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.batcher = batcher.MicroBatcher(self._encode_and_search)
+    self.query_length_stats = QueryLengthStats()
+
+  def close(self):
+    """Stops the batcher, once this index is no longer served."""
+    self.batcher.close()
 
-    self.dataset_embeddings = torch.from_numpy(self.df.to_numpy()).to(
-        torch.float)
+  #
+  # Encodes and searches the queries of a batch of requests, returning the
+  # search hits of each query of each request.
+  #
+  def _encode_and_search(
+      self, query_lists: List[List[str]]) -> List[List[List[Dict]]]:
+    queries = [q for ql in query_lists for q in ql]
+    if not queries:
+      return [[] for _ in query_lists]
+    hits = self.index.search(self.model.encode(queries),
+                             top_k=_NUM_SV_INDEX_MATCHES)
+    result = []
+    start = 0
+    for ql in query_lists:
+      result.append(hits[start:start + len(ql)])
+      start += len(ql)
+    return result
 
   #
   # Given a list of queries, searches the in-memory embeddings index
   # and returns a map of candidates keyed by input queries.
+  # `query_embeddings` can be passed in if the queries were already encoded
+  # with this index's model.
   #
-  def _search_embeddings(self,
-                         queries: List[str]) -> Dict[str, vars.VarCandidates]:
-    query_embeddings = self.model.encode(queries, show_progress_bar=False)
-    hits = semantic_search(query_embeddings,
-                           self.dataset_embeddings,
-                           top_k=_NUM_SV_INDEX_MATCHES)
+  def _search_embeddings(
+      self,
+      queries: List[str],
+      query_embeddings: np.ndarray = None) -> Dict[str, vars.VarCandidates]:
+    if query_embeddings is None:
+      hits = self.batcher.submit(queries)
+    else:
+      hits = self.index.search(query_embeddings, top_k=_NUM_SV_INDEX_MATCHES)
 
     # A map from input query -> SV DCID -> matched sentence -> score for that match
     query2sv2sentence2score: Dict[str, Dict[str, Dict[str, float]]] = {}
@@ -144,52 +232,88 @@ class Embeddings:
   def detect_svs(self,
                  orig_query: str,
                  skip_multi_sv: bool = False) -> Dict[str, Union[Dict, List]]:
-    # Remove all stop-words.
-    query_monovar = utils.remove_stop_words(orig_query,
-                                            query_util.ALL_STOP_WORDS)
+    return self.detect_svs_many([orig_query], skip_multi_sv)[0]
 
-    # Search embeddings for a single SV.
-    result_monovar = self._search_embeddings([query_monovar])[query_monovar]
-
-    multi_sv = {}
+  #
+  # Detects SVs for each of the queries, searching the embeddings for all of
+  # them at once.
+  #
+  def detect_svs_many(
+      self,
+      orig_queries: List[str],
+      skip_multi_sv: bool = False) -> List[Dict[str, Union[Dict, List]]]:
+    start = time.perf_counter()
+    # Remove all stop-words.
+    queries_monovar = [
+        utils.remove_stop_words(q, query_util.ALL_STOP_WORDS)
+        for q in orig_queries
+    ]
+
+    # Prepare the query-sets to try to detect multiple SVs.  Use the original
+    # query so that the logic can rely on stop-words like `vs`, `and`, etc as
+    # hints for SV delimiters.
+    querysets_list = []
     if not skip_multi_sv:
-      # Try to detect multiple SVs.  Use the original query so that
-      # the logic can rely on stop-words like `vs`, `and`, etc as hints
-      # for SV delimiters.
-      result_multivar = self._detect_multiple_svs(orig_query)
-      multi_sv = vars.multivar_candidates_to_dict(result_multivar)
-
-    # TODO: Rename SV_to_Sentences for consistency.
-    return {
-        'SV': result_monovar.svs,
-        'CosineScore': result_monovar.scores,
-        'SV_to_Sentences': result_monovar.sv2sentences,
-        'MultiSV': multi_sv
-    }
+      querysets_list = [
+          query_util.prepare_multivar_querysets(q) for q in orig_queries
+      ]
+
+    # Search embeddings for the single SV queries and the parts of the
+    # query-sets needed to score any of their splits, together. Then search the
+    # rest of the parts, only of the splits that can still be a returned
+    # candidate: first of the few most promising splits per query-set, which
+    # raises the bar for the others, and then of any split still above it.
+    all_queries = set(queries_monovar)
+    for querysets in querysets_list:
+      all_queries.update(_first_stage_parts(querysets))
+    query2result = self._search_embeddings(sorted(all_queries))
+    for max_splits in [_NUM_CANDIDATES_PER_NSPLIT, None]:
+      rest = set()
+      for querysets in querysets_list:
+        rest.update(_promising_parts(querysets, query2result, max_splits))
+      rest -= query2result.keys()
+      if not rest:
+        break
+      query2result.update(self._search_embeddings(sorted(rest)))
+
+    latency_ms = (time.perf_counter() - start) * 1000
+    for i, query_monovar in enumerate(queries_monovar):
+      parts = {query_monovar}
+      if querysets_list:
+        parts.update(_queryset_parts(querysets_list[i]))
+      self.query_length_stats.observe(len(query_monovar.split()), latency_ms,
+                                      len(parts & query2result.keys()))
+
+    result = []
+    for i, query_monovar in enumerate(queries_monovar):
+      result_monovar = query2result[query_monovar]
+      multi_sv = {}
+      if not skip_multi_sv:
+        result_multivar = self._detect_multiple_svs(querysets_list[i],
+                                                    query2result)
+        multi_sv = vars.multivar_candidates_to_dict(result_multivar)
+
+      # TODO: Rename SV_to_Sentences for consistency.
+      result.append({
+          'SV': result_monovar.svs,
+          'CosineScore': result_monovar.scores,
+          'SV_to_Sentences': result_monovar.sv2sentences,
+          'MultiSV': multi_sv
+      })
+    return result
 
   #
-  # Detects one or more SVs from the query.
+  # Detects one or more SVs from the query-sets of a query, given the search
+  # results of their parts.
   # TODO: Fix the query upstream to ensure the punctuations aren't stripped.
   #
-  def _detect_multiple_svs(self, query: str) -> vars.MultiVarCandidates:
-    #
-    # Prepare a combination of query-sets.
-    #
-    querysets = query_util.prepare_multivar_querysets(query)
-
+  def _detect_multiple_svs(
+      self, querysets: List[query_util.QuerySet],
+      query2result: Dict[str, vars.VarCandidates]) -> vars.MultiVarCandidates:
     result = vars.MultiVarCandidates(candidates=[])
-
-    # Make a unique list of query strings
-    all_queries = set()
-    for qs in querysets:
-      for c in qs.combinations:
-        for p in c.parts:
-          all_queries.add(p)
-    if not all_queries:
+    if not _queryset_parts(querysets):
       return result
 
-    query2result = self._search_embeddings(list(all_queries))
-
     #
     # A queryset is the set of all combinations of query
     # splits of a given length. For example, a query like
@@ -214,41 +338,9 @@ class Embeddings:
         if not c or not c.parts:
           continue
 
-        total = 0
-        candidate = vars.MultiVarCandidate(parts=[],
-                                           delim_based=qs.delim_based,
-                                           aggregate_score=-1)
-        lowest = _INIT_SCORE
-        for q in c.parts:
-          r = query2result.get(
-              q, vars.VarCandidates(svs=[], scores=[], sv2sentences={}))
-          part = vars.MultiVarCandidatePart(query_part=q, svs=[], scores=[])
-          score = 0
-          if r.svs:
-            # Pick the top-K SVs.
-            limit = _pick_top_k(r)
-            if limit > 0:
-              part.svs = r.svs[:limit]
-              part.scores = [s for s in r.scores[:limit]]
-              score = r.scores[0]
-
-          if score < lowest:
-            lowest = score
-          total += score
-          candidate.parts.append(part)
-
-        if lowest < _SV_SCORE_THRESHOLD:
-          # A query-part's best SV did not cross our score threshold,
-          # so drop this candidate.
-          continue
-
-        # Avoid duplicate SVs across candidate parts.
-        if not vars.deduplicate_svs(candidate):
-          continue
-
-        # The candidate level score is the average.
-        candidate.aggregate_score = total / len(c.parts)
-        candidates.append(candidate)
+        candidate = _split_candidate(c, qs.delim_based, query2result)
+        if candidate:
+          candidates.append(candidate)
 
       if candidates:
         # Pick the top candidate.
@@ -262,6 +354,130 @@ class Embeddings:
     return result
 
 
+#
+# Returns the multi-SV candidate of a split of a query, given the search
+# results of its parts, or None if the split isn't a candidate.
+#
+def _split_candidate(
+    c: query_util.QuerySplit, delim_based: bool,
+    query2result: Dict[str, vars.VarCandidates]
+) -> Optional[vars.MultiVarCandidate]:
+  total = 0
+  candidate = vars.MultiVarCandidate(parts=[],
+                                     delim_based=delim_based,
+                                     aggregate_score=-1)
+  lowest = _INIT_SCORE
+  for q in c.parts:
+    r = query2result.get(q,
+                         vars.VarCandidates(svs=[], scores=[], sv2sentences={}))
+    part = vars.MultiVarCandidatePart(query_part=q, svs=[], scores=[])
+    score = 0
+    if r.svs:
+      # Pick the top-K SVs.
+      limit = _pick_top_k(r)
+      if limit > 0:
+        part.svs = r.svs[:limit]
+        part.scores = [s for s in r.scores[:limit]]
+        score = r.scores[0]
+
+    if score < lowest:
+      lowest = score
+    total += score
+    candidate.parts.append(part)
+
+  if lowest < _SV_SCORE_THRESHOLD:
+    # A query-part's best SV did not cross our score threshold,
+    # so drop this candidate.
+    return None
+
+  # Avoid duplicate SVs across candidate parts.
+  if not vars.deduplicate_svs(candidate):
+    return None
+
+  # The candidate level score is the average.
+  candidate.aggregate_score = total / len(c.parts)
+  return candidate
+
+
+#
+# Returns the query parts to search first: all the parts of delimiter based
+# and 2-way splits, and the first and last parts of the other splits (which
+# are the same as parts of 2-way splits). This is enough to score every
+# 2-way split, and to bound the score of the other splits.
+#
+def _first_stage_parts(querysets: List[query_util.QuerySet]) -> set:
+  parts = set()
+  for qs in querysets:
+    for c in qs.combinations:
+      if qs.delim_based or qs.nsplits == 2:
+        parts.update(c.parts)
+      else:
+        parts.update([c.parts[0], c.parts[-1]])
+  return parts
+
+
+#
+# Returns the parts missing from `query2result` of the splits that may still be
+# among the top _NUM_CANDIDATES_PER_NSPLIT candidates of their query-set, i.e.
+# those that detect_svs_many returns. A split is dropped if it repeats a part
+# (whose SVs are then dropped as duplicates), if a searched part is below the
+# score threshold, or if its score is below that of as many candidates whose
+# parts were all searched, even if the rest of its parts match perfectly. So
+# searching only the returned parts gives the same candidates as searching all
+# of them. If `max_splits` is set, only the parts of up to that many splits per
+# query-set with the highest score bound are returned.
+#
+def _promising_parts(querysets: List[query_util.QuerySet],
+                     query2result: Dict[str, vars.VarCandidates],
+                     max_splits: Optional[int] = None) -> set:
+  parts = set()
+  for qs in querysets:
+    scores = []
+    for c in qs.combinations:
+      if all(p in query2result for p in c.parts):
+        candidate = _split_candidate(c, qs.delim_based, query2result)
+        if candidate:
+          scores.append(candidate.aggregate_score)
+    scores.sort(reverse=True)
+    cutoff = -1
+    if len(scores) >= _NUM_CANDIDATES_PER_NSPLIT:
+      cutoff = scores[_NUM_CANDIDATES_PER_NSPLIT - 1]
+
+    bounded = []
+    for c in qs.combinations:
+      missing = [p for p in c.parts if p not in query2result]
+      if not missing or len(set(c.parts)) < len(c.parts):
+        continue
+      searched = [
+          query2result[p].scores[0] if query2result[p].svs else 0
+          for p in c.parts
+          if p in query2result
+      ]
+      if searched and min(searched) < _SV_SCORE_THRESHOLD:
+        continue
+      bound = (sum(searched) + len(missing) * _PART_SCORE_BOUND) / len(c.parts)
+      if bound < cutoff:
+        continue
+      bounded.append((bound, missing))
+
+    bounded.sort(key=lambda b: b[0], reverse=True)
+    for _, missing in bounded[:max_splits]:
+      parts.update(missing)
+  return parts
+
+
+#
+# Returns the unique query parts in all the combinations of the query-sets.
+#
+def _queryset_parts(querysets: List[query_util.QuerySet]) -> set:
+  parts = set()
+  for qs in querysets:
+    for c in qs.combinations:
+      for p in c.parts:
+        parts.add(p)
+  return parts
+
+
 #
 # Given a list of variables select only those SVs that do not deviate
 # from the best SV by more than a certain threshold.
@@ -0,0 +1,158 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reading and writing of embeddings index files.
+
+Besides the CSV files built by tools/nl/embeddings, an index can be stored in a
+binary file (with the EXTENSION suffix) laid out as:
+  - The 8 byte MAGIC string.
+  - The length of the JSON header as a little-endian uint64.
+  - The JSON header, with the `dtype` and `shape` of the embeddings matrix,
+    whether its rows are `normalized` to unit length, and the `dcids` and
+    `sentences` of each row. It is padded with spaces so that the matrix
+    starts at a multiple of _ALIGNMENT bytes.
+  - The row-major embeddings matrix.
+
+The matrix of a binary file is memory-mapped read-only, so loading it does not
+copy it into the process heap, and the OS shares its pages across all the
+processes (e.g. gunicorn workers) that load the same file.
+"""
+
+from dataclasses import dataclass
+import json
+import os
+import struct
+import tempfile
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+EXTENSION = '.emb'
+MAGIC = b'DCNLEMB1'
+
+_ALIGNMENT = 64
+_DTYPES = ['float32', 'float16']
+
+_DCID_COL = 'dcid'
+_SENTENCE_COL = 'sentence'
+
+
+@dataclass
+class EmbeddingsData:
+  # The (num sentences x dim) embeddings matrix.
+  embeddings: np.ndarray
+  # The comma-separated DCIDs of each row.
+  dcids: List[str]
+  # The sentence of each row. May be empty for older indices.
+  sentences: List[str]
+  # Whether the rows of `embeddings` have unit length.
+  normalized: bool = False
+
+
+def is_binary(path: str) -> bool:
+  return path.endswith(EXTENSION)
+
+
+def load(path: str) -> EmbeddingsData:
+  """Loads a binary or CSV embeddings file based on its extension."""
+  if is_binary(path):
+    return load_binary(path)
+  return load_csv(path)
+
+
+def load_mapped(path: str) -> EmbeddingsData:
+  """Loads an embeddings file with its matrix memory-mapped. A CSV file is
+  first converted to a binary file next to it, unless there already is one."""
+  if is_binary(path):
+    return load_binary(path)
+  bin_path = binary_path(path)
+  if not os.path.exists(bin_path):
+    write_binary(bin_path, load_csv(path))
+  return load_binary(bin_path)
+
+
+def load_csv(path: str) -> EmbeddingsData:
+  df = pd.read_csv(path,
+                   dtype={
+                       _DCID_COL: str,
+                       _SENTENCE_COL: str
+                   },
+                   keep_default_na=False)
+  dcids = df[_DCID_COL].values.tolist()
+  df = df.drop(_DCID_COL, axis=1)
+  sentences = []
+  if _SENTENCE_COL in df:
+    sentences = df[_SENTENCE_COL].values.tolist()
+    df = df.drop(_SENTENCE_COL, axis=1)
+  return EmbeddingsData(embeddings=df.to_numpy(dtype=np.float32),
+                        dcids=dcids,
+                        sentences=sentences)
+
+
+def load_binary(path: str) -> EmbeddingsData:
+  with open(path, 'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f'Not an embeddings file: {path}')
+    header_len, = struct.unpack('<Q', f.read(8))
+    header = json.loads(f.read(header_len))
+  offset = len(MAGIC) + 8 + header_len
+  embeddings = np.memmap(path,
+                         dtype=header['dtype'],
+                         mode='r',
+                         offset=offset,
+                         shape=tuple(header['shape']))
+  return EmbeddingsData(embeddings=embeddings,
+                        dcids=header['dcids'],
+                        sentences=header['sentences'],
+                        normalized=header['normalized'])
+
+
+def write_binary(path: str, data: EmbeddingsData, dtype: str = 'float32'):
+  """Writes `data` as a binary embeddings file, with its rows normalized to
+  unit length and stored as `dtype`."""
+  if dtype not in _DTYPES:
+    raise ValueError(f'Unsupported dtype: {dtype}')
+  embeddings = np.asarray(data.embeddings, dtype=np.float32)
+  embeddings = embeddings / np.maximum(
+      np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+  embeddings = np.ascontiguousarray(embeddings, dtype=dtype)
+  header = json.dumps({
+      'dtype': dtype,
+      'shape': list(embeddings.shape),
+      'normalized': True,
+      'dcids': data.dcids,
+      'sentences': data.sentences,
+  }).encode('utf-8')
+  prefix_len = len(MAGIC) + 8
+  header += b' ' * (-(prefix_len + len(header)) % _ALIGNMENT)
+
+  # Write to a temporary file and rename it, so that a process never maps a
+  # partially written file.
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(MAGIC)
+      f.write(struct.pack('<Q', len(header)))
+      f.write(header)
+      f.write(embeddings.tobytes())
+    os.replace(tmp_path, path)
+  except:
+    os.remove(tmp_path)
+    raise
+
+
+def binary_path(csv_path: str) -> str:
+  """Returns the binary file name corresponding to an embeddings CSV."""
+  base, _ = os.path.splitext(csv_path)
+  return base + EXTENSION
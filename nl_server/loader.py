@@ -36,6 +36,15 @@ def embeddings_config_key(index_type):
   return f'NL_EMBEDDINGS_{index_type.upper()}'
 
 
+def is_ready(app) -> bool:
+  """Whether every embeddings index in the config and the NER model are loaded
+  in `app`, i.e. the server can serve requests."""
+  embeddings_map = app.config.get('EMBEDDINGS_VERSION_MAP')
+  if not embeddings_map or not app.config.get('NL_NER_PLACES'):
+    return False
+  return all(app.config.get(embeddings_config_key(sz)) for sz in embeddings_map)
+
+
 def _use_cache(flask_env):
   return flask_env in ['local', 'integration_test', 'webdriver']
 
@@ -51,19 +60,76 @@ def download_models(models_map):
   return models_downloaded_paths
 
 
-def load_embeddings(app, embeddings_map, models_downloaded_paths):
+def parse_embeddings_config(embeddings_config):
+  """Splits the contents of embeddings.yaml into the map of index type to
+  embeddings file name and the map of index type to its search config.
+
+  An index is either configured with just the file name, which uses exact
+  search, or with a dict like:
+    medium_ft:
+      file: embeddings_medium_<version>.csv
+      search:
+        type: ivf
+        nlist: 1024
+        nprobe: 32
+  """
+  embeddings_map = {}
+  search_configs = {}
+  for sz, value in embeddings_config.items():
+    if isinstance(value, dict):
+      embeddings_map[sz] = value['file']
+      search_configs[sz] = value.get('search', {})
+    else:
+      embeddings_map[sz] = value
+      search_configs[sz] = {}
+  return embeddings_map, search_configs
+
+
+def check_embeddings_name(sz, embeddings_file):
+  if '_ft' in sz:
+    assert '.ft_final' in embeddings_file, f'ft_final not found {embeddings_file}'
+    size_str = sz.split("_ft")[0]
+    assert size_str in embeddings_file, f'{size_str} not found {embeddings_file}'
+  else:
+    assert sz in embeddings_file, f'{sz} not found in {embeddings_file}'
+
+
+def build_embeddings(sz,
+                     embeddings_file,
+                     models_downloaded_paths,
+                     search_config=None) -> Embeddings:
+  """Downloads `embeddings_file` for the index type `sz` and builds its
+  Embeddings object with the matching model."""
+  existing_model_path = ""
+  for model_key, model_path in models_downloaded_paths.items():
+    if model_key in embeddings_file:
+      existing_model_path = model_path
+      print(
+          f"Using existing model {model_key} for embeddings ({sz}) version: {embeddings_file}"
+      )
+      break
+
+  # Checking that the finetuned embeddings have the finetuned model.
+  if "_ft" in sz:
+    assert existing_model_path, f"Could not find a finetuned model for finetuned embeddings ({sz}) version: {embeddings_file}"
+
+  print(
+      f"Building an Embeddings object with the model: {existing_model_path} (empty means default) and embeddings file ({sz}) version: {embeddings_file}."
+  )
+  return Embeddings(gcs.download_embeddings(embeddings_file),
+                    existing_model_path, search_config)
+
+
+def load_embeddings(app,
+                    embeddings_map,
+                    models_downloaded_paths,
+                    search_configs=None):
+  search_configs = search_configs or {}
   flask_env = os.environ.get('FLASK_ENV')
 
   # Sanity check that file names aren't mispresented
   for sz in embeddings_map.keys():
-    if '_ft' in sz:
-      assert '.ft_final' in embeddings_map[
-          sz], f'ft_final not found {embeddings_map[sz]}'
-      size_str = sz.split("_ft")[0]
-      assert size_str in embeddings_map[
-          sz], f'{size_str} not found {embeddings_map[sz]}'
-    else:
-      assert sz in embeddings_map[sz], f'{sz} not found in {embeddings_map[sz]}'
+    check_embeddings_name(sz, embeddings_map[sz])
 
   # In local dev, cache the embeddings on disk so each hot reload won't download
   # the embeddings again.
@@ -90,26 +156,8 @@ def load_embeddings(app, embeddings_map, models_downloaded_paths):
   # Download the embeddings from GCS
   for sz in sorted(embeddings_map.keys()):
     assert sz in embeddings_map, f'{sz} missing from {embeddings_map}'
-
-    existing_model_path = ""
-    for model_key, model_path in models_downloaded_paths.items():
-      if model_key in embeddings_map[sz]:
-        existing_model_path = model_path
-        print(
-            f"Using existing model {model_key} for embeddings ({sz}) version: {embeddings_map[sz]}"
-        )
-        break
-
-    # Checking that the finetuned embeddings have the finetuned model.
-    if "_ft" in sz:
-      assert existing_model_path, f"Could not find a finetuned model for finetuned embeddings ({sz}) version: {embeddings_map[sz]}"
-
-    print(
-        f"Building an Embeddings object with the model: {existing_model_path} (empty means default) and embeddings file ({sz}) version: {embeddings_map[sz]}."
-    )
-    nl_embeddings = Embeddings(gcs.download_embeddings(embeddings_map[sz]),
-                               existing_model_path)
-    app.config[embeddings_config_key(sz)] = nl_embeddings
+    app.config[embeddings_config_key(sz)] = build_embeddings(
+        sz, embeddings_map[sz], models_downloaded_paths, search_configs.get(sz))
 
   nl_ner_places = NERPlaces()
   app.config["NL_NER_PLACES"] = nl_ner_places
@@ -0,0 +1,138 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Registry of the SentenceTransformer models used by the embeddings indices.
+
+Indices built with the same model (e.g. medium_ft and sdg_ft) share a single
+instance of it, so its weights are loaded once and the embeddings of recent
+queries are cached across all of them.
+
+Setting the NL_ENCODER_BACKEND environment variable to "onnx" makes the models
+encode queries with an int8-quantized ONNX Runtime export of the model instead
+of PyTorch (see onnx_encoder.py). The export is created on first use.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, List
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from nl_server import onnx_encoder
+from nl_server.cache import LRUCache
+
+DEFAULT_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+TORCH = 'torch'
+ONNX = 'onnx'
+_BACKEND_ENV = 'NL_ENCODER_BACKEND'
+_ONNX_DIR = os.path.join(tempfile.gettempdir(), 'nl_onnx')
+
+# Number of query embeddings cached per model.
+_MAX_CACHED_QUERIES = 10000
+
+
+class EmbeddingsModel:
+  """A SentenceTransformer model to encode queries with."""
+
+  def __init__(self, model_path: str = '', backend: str = ''):
+    # The path of a downloaded (e.g. finetuned) model, or empty for the
+    # default model.
+    self.path = model_path
+    if model_path:
+      assert os.path.exists(model_path)
+      self.model = SentenceTransformer(model_path)
+    else:
+      self.model = SentenceTransformer(DEFAULT_MODEL_NAME)
+
+    self.backend = backend or os.environ.get(_BACKEND_ENV, TORCH)
+    if self.backend == ONNX:
+      try:
+        self.model = _load_onnx(self.model, model_path)
+      except ImportError as e:
+        logging.error(f'Encoding with PyTorch, ONNX Runtime unavailable: {e}')
+        self.backend = TORCH
+    # Whether the model's tokenizer lowercases its input, in which case the
+    # cache can ignore case too.
+    self._uncased = getattr(self.model.tokenizer, 'do_lower_case', False)
+    self.cache = LRUCache(_MAX_CACHED_QUERIES)
+
+  def _normalize(self, text: str) -> str:
+    text = ' '.join(text.split())
+    return text.lower() if self._uncased else text
+
+  def encode(self, texts: List[str]) -> np.ndarray:
+    """Returns the embeddings of `texts`, only running the model on the ones
+    that are not cached."""
+    if not texts:
+      return self.model.encode(texts, show_progress_bar=False)
+
+    result = [None] * len(texts)
+    # Normalized text -> positions in texts.
+    missing: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+      key = self._normalize(text)
+      embedding = self.cache.get(key)
+      if embedding is None:
+        missing.setdefault(key, []).append(i)
+      else:
+        result[i] = embedding
+
+    if missing:
+      keys = list(missing.keys())
+      for key, embedding in zip(
+          keys, self.model.encode(keys, show_progress_bar=False)):
+        self.cache.put(key, embedding)
+        for i in missing[key]:
+          result[i] = embedding
+    return np.stack(result)
+
+  def __reduce__(self):
+    # Unpickle (e.g. from the local disk cache of the embeddings) through the
+    # registry, so indices loaded from the cache still share the model.
+    return (get, (self.path,))
+
+
+def _load_onnx(model: SentenceTransformer,
+               model_path: str) -> onnx_encoder.OnnxEncoder:
+  onnx_dir = os.path.join(_ONNX_DIR,
+                          os.path.basename(model_path) or DEFAULT_MODEL_NAME)
+  if not onnx_encoder.exists(onnx_dir):
+    onnx_encoder.export(model, onnx_dir)
+  logging.info(f'Encoding with the ONNX model in {onnx_dir}')
+  return onnx_encoder.OnnxEncoder(onnx_dir)
+
+
+_MODELS: Dict[str, EmbeddingsModel] = {}
+_LOCK = threading.Lock()
+
+
+def get(model_path: str = '') -> EmbeddingsModel:
+  """Returns the model at `model_path` (or the default model), loading it on
+  first use."""
+  with _LOCK:
+    if model_path not in _MODELS:
+      _MODELS[model_path] = EmbeddingsModel(model_path)
+    return _MODELS[model_path]
+
+
+def cache_stats() -> Dict[str, Dict]:
+  """Returns the query embeddings cache stats of each loaded model."""
+  with _LOCK:
+    return {
+        path or DEFAULT_MODEL_NAME: m.cache.stats()
+        for path, m in _MODELS.items()
+    }
@@ -11,17 +11,48 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Managing the NER model for place detection."""
+"""Managing the NER model for place detection.
 
+Only the entity recognizer is needed, so the other pipeline components are
+excluded at load time. The spaCy model can be overridden with the
+`NL_NER_MODEL` env var, e.g. to `en_core_web_sm` which has no word vectors and
+is much smaller than the default.
+"""
+
+import logging
+import os
 from typing import List
 
-import en_core_web_lg
+import spacy
+
+DEFAULT_MODEL_NAME = 'en_core_web_lg'
+
+_MODEL_ENV = 'NL_NER_MODEL'
+
+# Components of the en_core_web_* pipelines that place detection doesn't use.
+_UNUSED_COMPONENTS = [
+    'tagger', 'morphologizer', 'parser', 'senter', 'attribute_ruler',
+    'lemmatizer'
+]
+
+
+def load_model(model_name: str = ''):
+  """Loads the spaCy pipeline `model_name` with only what NER needs."""
+  model_name = model_name or os.environ.get(_MODEL_ENV, DEFAULT_MODEL_NAME)
+  nlp = spacy.load(model_name, exclude=_UNUSED_COMPONENTS)
+  # The shared tok2vec only feeds the excluded components in the en_core_web
+  # pipelines (NER has its own), but keep it if something still listens to it.
+  if 'tok2vec' in nlp.pipe_names and not nlp.get_pipe(
+      'tok2vec').listening_components:
+    nlp.remove_pipe('tok2vec')
+  logging.info(f'Loaded NER model {model_name} with pipes {nlp.pipe_names}')
+  return nlp
 
 
 class NERPlaces:
 
-  def __init__(self) -> None:
-    self.ner_model = en_core_web_lg.load()
+  def __init__(self, model_name: str = '') -> None:
+    self.ner_model = load_model(model_name)
 
   def detect_places_ner(self, query: str) -> List[str]:
     """Use the NER model to detect places in `query`.
@@ -32,19 +63,34 @@ class NERPlaces:
       doc = self.ner_model(query)
     except Exception as e:
       raise Exception(e)
+    return _places_in_doc(doc)
+
+  def detect_places_ner_many(self, queries: List[str]) -> List[List[str]]:
+    """Use the NER model to detect places in each of `queries`, processing
+    them together as a batch.
+
+    Raises an Exception if the NER model fails on the queries.
+    """
+    try:
+      docs = list(self.ner_model.pipe(queries))
+    except Exception as e:
+      raise Exception(e)
+    return [_places_in_doc(doc) for doc in docs]
+
+
+def _places_in_doc(doc) -> List[str]:
+  places_found_loc_gpe = []
+  places_found_fac = []
+  for e in doc.ents:
+    # Preference is given to LOC and GPE types over FAC.
+    # List of entity types recognized by the spaCy library
+    # is here: https://towardsdatascience.com/explorations-in-named-entity-recognition-and-was-eleanor-roosevelt-right-671271117218
+    # We only use the location/place types.
+    if e.label_ in ["GPE", "LOC"]:
+      places_found_loc_gpe.append(str(e).lower())
+    if e.label_ in ["FAC"]:
+      places_found_fac.append(str(e).lower())
 
-    places_found_loc_gpe = []
-    places_found_fac = []
-    for e in doc.ents:
-      # Preference is given to LOC and GPE types over FAC.
-      # List of entity types recognized by the spaCy library
-      # is here: https://towardsdatascience.com/explorations-in-named-entity-recognition-and-was-eleanor-roosevelt-right-671271117218
-      # We only use the location/place types.
-      if e.label_ in ["GPE", "LOC"]:
-        places_found_loc_gpe.append(str(e).lower())
-      if e.label_ in ["FAC"]:
-        places_found_fac.append(str(e).lower())
-
-    if places_found_loc_gpe:
-      return places_found_loc_gpe
-    return places_found_fac
+  if places_found_loc_gpe:
+    return places_found_loc_gpe
+  return places_found_fac
@@ -0,0 +1,187 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Encoding queries with an ONNX Runtime export of a SentenceTransformer.
+
+export() writes the transformer of a SentenceTransformer model as an ONNX graph
+with dynamically int8-quantized weights, along with its tokenizer and pooling
+config. OnnxEncoder then encodes texts with ONNX Runtime on CPU, applying the
+same pooling and normalization as the SentenceTransformer.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import List
+
+import numpy as np
+
+_MODEL_FILE = 'model.onnx'
+_QUANTIZED_MODEL_FILE = 'model_quantized.onnx'
+_CONFIG_FILE = 'encoder_config.json'
+
+_OPSET_VERSION = 14
+
+MEAN = 'mean'
+CLS = 'cls'
+
+
+def exists(onnx_dir: str) -> bool:
+  return os.path.exists(os.path.join(onnx_dir, _CONFIG_FILE))
+
+
+def export(model, onnx_dir: str):
+  """Exports a SentenceTransformer `model` to `onnx_dir`, unless another process
+  already has.
+
+  Processes sharing `onnx_dir` export one at a time, holding a lock file next to
+  it. The export is written to a temporary sibling directory that is renamed
+  into place once complete, so `onnx_dir` never holds a partial export.
+  """
+  parent = os.path.dirname(os.path.abspath(onnx_dir))
+  os.makedirs(parent, exist_ok=True)
+  with open(os.path.abspath(onnx_dir) + '.lock', 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    if exists(onnx_dir):
+      return
+    tmp_dir = tempfile.mkdtemp(dir=parent,
+                               prefix=os.path.basename(onnx_dir) + '.tmp')
+    try:
+      _export(model, tmp_dir)
+      # Left behind by an interrupted export before exports were atomic.
+      if os.path.exists(onnx_dir):
+        shutil.rmtree(onnx_dir)
+      os.rename(tmp_dir, onnx_dir)
+    except:
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+      raise
+
+
+def _export(model, onnx_dir: str):
+  from onnxruntime.quantization import quantize_dynamic
+  from onnxruntime.quantization import QuantType
+  from sentence_transformers import models as st_models
+  import torch
+
+  transformer, pooling = model[0], model[1]
+  pooling_config = pooling.get_config_dict()
+  if pooling_config.get('pooling_mode_mean_tokens'):
+    pooling_mode = MEAN
+  elif pooling_config.get('pooling_mode_cls_token'):
+    pooling_mode = CLS
+  else:
+    raise ValueError(f'Unsupported pooling: {pooling_config}')
+
+  tokenizer = transformer.tokenizer
+  sample = tokenizer(['population of california'], return_tensors='pt')
+  input_names = list(sample.keys())
+  dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+  dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+  model_path = os.path.join(onnx_dir, _MODEL_FILE)
+  logging.info(f'Exporting the model to {model_path}')
+  auto_model = transformer.auto_model.eval()
+  with torch.no_grad():
+    torch.onnx.export(auto_model,
+                      tuple(sample[name] for name in input_names),
+                      model_path,
+                      input_names=input_names,
+                      output_names=['last_hidden_state'],
+                      dynamic_axes=dynamic_axes,
+                      opset_version=_OPSET_VERSION)
+  quantize_dynamic(model_path,
+                   os.path.join(onnx_dir, _QUANTIZED_MODEL_FILE),
+                   weight_type=QuantType.QInt8)
+  os.remove(model_path)
+
+  tokenizer.save_pretrained(onnx_dir)
+  # Written last, since its presence marks a complete export.
+  with open(os.path.join(onnx_dir, _CONFIG_FILE), 'w') as f:
+    json.dump(
+        {
+            'pooling': pooling_mode,
+            'normalize': any(isinstance(m, st_models.Normalize) for m in model),
+            'max_seq_length': transformer.max_seq_length,
+        }, f)
+
+
+def pool(hidden: np.ndarray, attention_mask: np.ndarray,
+         pooling_mode: str) -> np.ndarray:
+  """Pools the token embeddings of each text into a sentence embedding."""
+  if pooling_mode == CLS:
+    return hidden[:, 0]
+  mask = attention_mask[:, :, np.newaxis].astype(hidden.dtype)
+  return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+class OnnxEncoder:
+  """Encodes texts with an exported model, as a drop-in replacement for
+  SentenceTransformer.encode()."""
+
+  def __init__(self, onnx_dir: str):
+    from transformers import AutoTokenizer
+
+    with open(os.path.join(onnx_dir, _CONFIG_FILE)) as f:
+      config = json.load(f)
+    self.pooling_mode = config['pooling']
+    self.normalize = config['normalize']
+    self.max_seq_length = config['max_seq_length']
+    self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+
+    self._model_file = os.path.join(onnx_dir, _QUANTIZED_MODEL_FILE)
+    self._session = None
+    self._pid = None
+    self._lock = threading.Lock()
+    self._input_names = [i.name for i in self._get_session().get_inputs()]
+
+  def _get_session(self):
+    # The session owns a thread pool, which does not survive a fork. So it is
+    # created again in a process forked after loading (e.g. a gunicorn worker
+    # of a preloaded app).
+    import onnxruntime as ort
+
+    with self._lock:
+      if self._pid != os.getpid():
+        options = ort.SessionOptions()
+        options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        self._session = ort.InferenceSession(self._model_file,
+                                             options,
+                                             providers=['CPUExecutionProvider'])
+        self._pid = os.getpid()
+      return self._session
+
+  def encode(self,
+             texts: List[str],
+             show_progress_bar: bool = False) -> np.ndarray:
+    # `show_progress_bar` is only accepted for compatibility with
+    # SentenceTransformer.encode().
+    del show_progress_bar
+    if not texts:
+      return np.zeros((0, 0), dtype=np.float32)
+    inputs = self.tokenizer(texts,
+                            padding=True,
+                            truncation=True,
+                            max_length=self.max_seq_length,
+                            return_tensors='np')
+    feeds = {name: inputs[name].astype(np.int64) for name in self._input_names}
+    hidden = self._get_session().run(['last_hidden_state'], feeds)[0]
+    embeddings = pool(hidden, inputs['attention_mask'], self.pooling_mode)
+    if self.normalize:
+      embeddings /= np.maximum(
+          np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings.astype(np.float32)
@@ -17,7 +17,7 @@ from dataclasses import dataclass
 import itertools
 import logging
 import re
-from typing import List
+from typing import List, Set
 
 from shared.lib import constants
 from shared.lib import utils
@@ -28,8 +28,17 @@ from shared.lib import utils
 # This may not always be the best thing to do.
 ALL_STOP_WORDS = utils.combine_stop_words()
 
+# Single word stop words, to cheaply check if a query part has only those.
+_STOP_WORDS_SINGLE = set(w for w in ALL_STOP_WORDS if ' ' not in w)
+
 _MAX_SVS = 4
 
+# Upper limit on the number of unique query parts across the query-sets of a
+# query, since the number of splits grows combinatorially with query length.
+# This covers all the splits of queries up to 9 words (after removing stop
+# words).
+MAX_QUERYSET_PARTS = 45
+
 # Use comma, "vs.", semi-colon, "and", ampersand as delimiters.
 _REGEX_DELIMITERS = r',|vs|;|and|&'
 # Regex to extract out substrings within double quotes.
@@ -54,12 +63,26 @@ class QuerySet:
   combinations: List[QuerySplit]
 
 
+#
+# Returns true if a part of a split of a query is made of stop words only, or is
+# the whole (mono-var) query.
+#
+def _is_useless_split(parts: List[str], query: str) -> bool:
+  for p in parts:
+    if p == query or all(w in _STOP_WORDS_SINGLE for w in p.split()):
+      return True
+  return False
+
+
 #
 # This returns multiple combinations of |nsplits| query-lets, represented
-# as a list of lists.
+# as a list of lists. Only the combinations whose new parts fit in the
+# remaining budget of |seen_parts| are included.
 #
-def _prepare_queryset(nsplits: int, query_parts: List[str]) -> QuerySet:
+def _prepare_queryset(nsplits: int, query_parts: List[str],
+                      seen_parts: Set[str]) -> QuerySet:
   result = QuerySet(nsplits=nsplits, delim_based=False, combinations=[])
+  query = ' '.join(query_parts)
 
   assert nsplits >= 2
   assert nsplits <= len(query_parts)
@@ -85,6 +108,12 @@ def _prepare_queryset(nsplits: int, query_parts: List[str]) -> QuerySet:
       qs.parts.append(' '.join(query_parts[start:last + 1]))
       start = last + 1
     qs.parts.append(' '.join(query_parts[start:]))
+    if _is_useless_split(qs.parts, query):
+      continue
+    new_parts = set(qs.parts) - seen_parts
+    if len(seen_parts) + len(new_parts) > MAX_QUERYSET_PARTS:
+      continue
+    seen_parts.update(new_parts)
     result.combinations.append(qs)
   return result
 
@@ -125,12 +154,18 @@ def _prepare_queryset_via_delimiters(query: str,
 
 
 #
-# Returns combinations of |query| string parts of upto _MAX_SVS splits.
+# Returns combinations of |query| string parts of upto _MAX_SVS splits, with
+# up to MAX_QUERYSET_PARTS unique parts in all. Splits with fewer parts are
+# preferred within that budget.
 #
 def prepare_multivar_querysets(query: str) -> List[QuerySet]:
   querysets: List[QuerySet] = []
 
   delim_nsplits = _prepare_queryset_via_delimiters(query, querysets)
+  seen_parts = set()
+  for qs in querysets:
+    for c in qs.combinations:
+      seen_parts.update(c.parts)
 
   query = utils.remove_punctuations(query)
   query = utils.remove_stop_words(query, ALL_STOP_WORDS)
@@ -140,7 +175,7 @@ def prepare_multivar_querysets(query: str) -> List[QuerySet]:
   for nsplits in range(2, max_splits + 1):
     if delim_nsplits == nsplits:
       continue
-    queryset = _prepare_queryset(nsplits, query_parts)
+    queryset = _prepare_queryset(nsplits, query_parts, seen_parts)
     if queryset.combinations:
       querysets.append(queryset)
 
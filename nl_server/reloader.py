@@ -0,0 +1,167 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Hot-swapping of embeddings indices when their config changes.
+
+The process that creates the app polls the embeddings config file, which is
+mounted from a ConfigMap in GKE. When the version or search config of an index
+changes, the new version is loaded in the background and checked with smoke
+queries. Only then does it replace the index in the app config, and the old
+index is freed. EMBEDDINGS_VERSION_MAP always has the versions being served.
+
+Under gunicorn with --preload, that process is the master, which does not serve
+requests. After a swap, it sends itself a SIGHUP, so gunicorn forks new workers
+from it and gracefully stops the old ones once their requests in flight are
+done. So a new index is loaded once per server rather than once per worker, it
+is shared copy-on-write by all the workers like the index loaded at startup,
+and all the new workers serve the same version. During the restart the old
+workers still hold the old index, so there is room for one more index
+(~2 x size of the embeddings file) until they exit.
+
+Without --preload (e.g. the flask dev server), each process polls and swaps in
+its own copy of the index instead, so every worker needs the memory for a
+second index while reloading.
+"""
+
+import logging
+import os
+import signal
+import threading
+import time
+
+import yaml
+
+from nl_server import loader
+from nl_server.embeddings import Embeddings
+
+_POLL_SECONDS = 30
+
+# Queries that every SV index should find SVs for.
+_SMOKE_QUERIES = [
+    'population of california',
+    'unemployment rate',
+    'median household income',
+    'life expectancy in africa',
+]
+
+
+def _read(path: str) -> str:
+  with open(path) as f:
+    return f.read()
+
+
+def validate(nl_embeddings: Embeddings):
+  """Raises an exception if `nl_embeddings` can't detect SVs for the smoke
+  queries."""
+  results = nl_embeddings.detect_svs_many(_SMOKE_QUERIES, skip_multi_sv=True)
+  for query, result in zip(_SMOKE_QUERIES, results):
+    if not result['SV']:
+      raise ValueError(f'No SVs detected for smoke query "{query}"')
+
+
+def _is_gunicorn_master() -> bool:
+  """Whether this process is a gunicorn master, which handles SIGHUP by
+  replacing its workers. Gunicorn workers reset the handler to the default."""
+  handler = getattr(signal.getsignal(signal.SIGHUP), '__self__', None)
+  return type(handler).__module__ == 'gunicorn.arbiter'
+
+
+class Reloader:
+  """Swaps in the indices of `app` whose config changes."""
+
+  def __init__(self,
+               app,
+               embeddings_config_path: str,
+               models_config_path: str,
+               poll_seconds: float = _POLL_SECONDS):
+    self.app = app
+    self.embeddings_config_path = embeddings_config_path
+    self.models_config_path = models_config_path
+    self.poll_seconds = poll_seconds
+    self._config = _read(embeddings_config_path)
+
+  def start(self):
+    """Starts polling in this process.
+
+    This is called when the app is created, so with a preloaded app only the
+    gunicorn master polls, since threads do not survive the fork of a worker.
+    """
+    threading.Thread(target=self._run, daemon=True).start()
+
+  def _run(self):
+    while True:
+      time.sleep(self.poll_seconds)
+      try:
+        self.check()
+      except Exception as e:
+        logging.error(f'Checking the embeddings config failed with error: {e}')
+
+  def check(self):
+    """Loads, validates and swaps in each index whose config changed since the
+    last check."""
+    config = _read(self.embeddings_config_path)
+    if config == self._config:
+      return
+    self._config = config
+
+    embeddings_map, search_configs = loader.parse_embeddings_config(
+        yaml.full_load(config))
+    with open(self.models_config_path) as f:
+      models_downloaded_paths = loader.download_models(yaml.full_load(f))
+
+    swapped = False
+    active_map = self.app.config['EMBEDDINGS_VERSION_MAP']
+    active_search_configs = self.app.config.get('EMBEDDINGS_SEARCH_CONFIGS', {})
+    for sz in sorted(embeddings_map):
+      if (active_map.get(sz) == embeddings_map[sz] and
+          active_search_configs.get(sz) == search_configs.get(sz)):
+        continue
+      logging.info(f'Loading embeddings ({sz}) version: {embeddings_map[sz]}')
+      try:
+        loader.check_embeddings_name(sz, embeddings_map[sz])
+        nl_embeddings = loader.build_embeddings(sz, embeddings_map[sz],
+                                                models_downloaded_paths,
+                                                search_configs.get(sz))
+        validate(nl_embeddings)
+      except Exception as e:
+        logging.error(f'Not swapping in embeddings ({sz}) version: '
+                      f'{embeddings_map[sz]}, since it failed with error: {e}')
+        continue
+      self._swap(sz, embeddings_map[sz], search_configs.get(sz), nl_embeddings)
+      swapped = True
+
+    for sz in sorted(set(active_map) - set(embeddings_map)):
+      logging.warning(f'Embeddings ({sz}) removed from the config are still '
+                      'served until restart')
+
+    if swapped and _is_gunicorn_master():
+      logging.info(
+          'Restarting the gunicorn workers to serve the new embeddings')
+      os.kill(os.getpid(), signal.SIGHUP)
+
+  def _swap(self, sz, embeddings_file, search_config, nl_embeddings):
+    key = loader.embeddings_config_key(sz)
+    old_embeddings = self.app.config.get(key)
+    self.app.config[key] = nl_embeddings
+    # The maps are replaced rather than updated, so that readers never see a
+    # partial update.
+    self.app.config['EMBEDDINGS_VERSION_MAP'] = {
+        **self.app.config['EMBEDDINGS_VERSION_MAP'], sz: embeddings_file
+    }
+    self.app.config['EMBEDDINGS_SEARCH_CONFIGS'] = {
+        **self.app.config.get('EMBEDDINGS_SEARCH_CONFIGS', {}), sz:
+            search_config
+    }
+    logging.info(f'Swapped in embeddings ({sz}) version: {embeddings_file}')
+    if old_embeddings:
+      old_embeddings.close()
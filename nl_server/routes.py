@@ -21,12 +21,17 @@ from flask import request
 from markupsafe import escape
 
 from nl_server import loader as ld
+from nl_server import models
 
 bp = Blueprint('main', __name__, url_prefix='/')
 
 
 @bp.route('/healthz')
 def healthz():
+  # Report not ready until all the embeddings and models are loaded, so that
+  # no traffic is routed to a server that can't answer it.
+  if not ld.is_ready(current_app):
+    return "Not ready", 503
   return ""
 
 
@@ -78,6 +83,91 @@ def search_places():
     return json.dumps({'places': []})
 
 
+@bp.route('/api/search_sv_batch/', methods=['POST'])
+def search_sv_batch():
+  """Detects SVs for each of the queries in the request body:
+
+  {
+    'queries': List[str],
+    'sz': str,  # Optional index type.
+    'skip_multi_sv': bool  # Optional.
+  }
+
+  Returns a dictionary with a 'results' list, with the same response as
+  /api/search_sv/ for each query.
+  """
+  req = request.get_json()
+  queries = [str(escape(q)) for q in req.get('queries', [])]
+  sz = req.get('sz') or ld.DEFAULT_INDEX_TYPE
+  skip_multi_sv = bool(req.get('skip_multi_sv'))
+  try:
+    nl_embeddings = current_app.config[ld.embeddings_config_key(sz)]
+    results = nl_embeddings.detect_svs_many(queries, skip_multi_sv)
+  except Exception as e:
+    logging.error(f'Embeddings-based SV detection failed with error: {e}')
+    results = [{
+        'SV': [],
+        'CosineScore': [],
+        'SV_to_Sentences': {},
+        'MultiSV': {}
+    } for _ in queries]
+  return json.dumps({'results': results})
+
+
+@bp.route('/api/search_places_batch/', methods=['POST'])
+def search_places_batch():
+  """Detects places in each of the queries in the request body:
+
+  {
+    'queries': List[str]
+  }
+
+  Returns a dictionary with the places detected in each query:
+
+  {
+    'places': List[List[str]]
+  }
+  """
+  queries = [str(escape(q)) for q in request.get_json().get('queries', [])]
+  nl_ner_places = current_app.config['NL_NER_PLACES']
+  try:
+    res = nl_ner_places.detect_places_ner_many(queries)
+  except Exception as e:
+    logging.error(f'NER place detection failed with error: {e}')
+    res = [[] for _ in queries]
+  return json.dumps({'places': res})
+
+
 @bp.route('/api/embeddings_version_map/', methods=['GET'])
 def embeddings_version_map():
-  return json.dumps(current_app.config['EMBEDDINGS_VERSION_MAP'])
\ No newline at end of file
+  return json.dumps(current_app.config['EMBEDDINGS_VERSION_MAP'])
+
+
+@bp.route('/api/model_cache_stats/', methods=['GET'])
+def model_cache_stats():
+  """Returns the query embeddings cache hits, misses and hit rate per model."""
+  return json.dumps(models.cache_stats())
+
+
+@bp.route('/api/sv_detection_stats/', methods=['GET'])
+def sv_detection_stats():
+  """Returns the SV detection latency and number of query parts searched of
+  each index, by query length."""
+  result = {}
+  for sz in current_app.config['EMBEDDINGS_VERSION_MAP']:
+    nl_embeddings = current_app.config.get(ld.embeddings_config_key(sz))
+    if nl_embeddings:
+      result[sz] = nl_embeddings.query_length_stats.snapshot()
+  return json.dumps(result)
+
+
+@bp.route('/api/batching_stats/', methods=['GET'])
+def batching_stats():
+  """Returns the queue wait and batch size histograms of the SV search batcher
+  of each index."""
+  result = {}
+  for sz in current_app.config['EMBEDDINGS_VERSION_MAP']:
+    nl_embeddings = current_app.config.get(ld.embeddings_config_key(sz))
+    if nl_embeddings:
+      result[sz] = nl_embeddings.batcher.stats()
+  return json.dumps(result)
@@ -0,0 +1,268 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Nearest-neighbour search backends over the embeddings index.
+
+Every backend takes the index embeddings as a (num sentences x dim) matrix and
+returns, for each query embedding, the top-K matches as a list of
+{'corpus_id': int, 'score': float} sorted by decreasing cosine score (the same
+format as sentence_transformers.util.semantic_search).
+
+A backend can optionally score candidates against a quantized (float16 or int8)
+copy of the embeddings, and then re-rank the best of them against the full
+precision rows. With a memory-mapped index file, only the rows being re-ranked
+are read from the full precision matrix. With an in-memory matrix that is not
+normalized, the backend keeps a normalized float32 copy for re-ranking, so
+quantization only saves memory for memory-mapped (normalized) matrices.
+"""
+
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+EXACT = 'exact'
+IVF = 'ivf'
+
+FLOAT16 = 'float16'
+INT8 = 'int8'
+
+# Number of candidates re-ranked at full precision is top-K * this.
+_RERANK_FACTOR = 4
+# Rows of the index converted to float32 at a time when scoring.
+_BLOCK_ROWS = 1024
+
+# Default number of IVF clusters is sqrt(num sentences) * this.
+_IVF_NLIST_FACTOR = 4
+_IVF_DEFAULT_NPROBE = 16
+_IVF_KMEANS_ITERS = 10
+_IVF_KMEANS_SAMPLE = 100000
+_IVF_SEED = 42
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+  m = np.asarray(m, dtype=np.float32)
+  norms = np.linalg.norm(m, axis=-1, keepdims=True)
+  return m / np.maximum(norms, 1e-12)
+
+
+def _prepare(embeddings: np.ndarray, normalized: bool,
+             quantization: str) -> np.ndarray:
+  if normalized and (embeddings.dtype == np.float32 or quantization):
+    # Use the matrix as is, so a memory-mapped file is not copied. When
+    # quantized, the matrix is only read to re-rank a few rows.
+    return embeddings
+  return _normalize(embeddings)
+
+
+def _blocked_scores(queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+  """Returns queries @ matrix.T in float32, converting only _BLOCK_ROWS rows of
+  a lower precision matrix to float32 at a time."""
+  if matrix.dtype == np.float32:
+    return queries @ matrix.T
+  scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+  for start in range(0, len(matrix), _BLOCK_ROWS):
+    block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+    scores[:, start:start + len(block)] = queries @ block.T
+  return scores
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+  """Returns the index of the closest centroid to each row of matrix."""
+  assignments = np.empty(len(matrix), dtype=np.int64)
+  for start in range(0, len(matrix), _BLOCK_ROWS):
+    block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+    assignments[start:start + len(block)] = np.argmax(block @ centroids.T,
+                                                      axis=1)
+  return assignments
+
+
+class _Quantized:
+  """A float16 or int8 copy of the normalized index embeddings.
+
+  int8 values are scaled per dimension, so the score of a query against a row
+  is (query * scale) . row, computed without dequantizing the row first.
+  """
+
+  def __init__(self, embeddings: np.ndarray, quantization: str):
+    self.scale = None
+    if quantization == FLOAT16:
+      self.matrix = np.empty(embeddings.shape, dtype=np.float16)
+      for start in range(0, len(embeddings), _BLOCK_ROWS):
+        end = start + _BLOCK_ROWS
+        self.matrix[start:end] = embeddings[start:end]
+    elif quantization == INT8:
+      max_abs = np.zeros(embeddings.shape[1], dtype=np.float32)
+      for start in range(0, len(embeddings), _BLOCK_ROWS):
+        block = np.abs(embeddings[start:start + _BLOCK_ROWS])
+        max_abs = np.maximum(max_abs, block.max(axis=0))
+      self.scale = np.maximum(max_abs, 1e-12) / 127
+      self.matrix = np.empty(embeddings.shape, dtype=np.int8)
+      for start in range(0, len(embeddings), _BLOCK_ROWS):
+        end = start + _BLOCK_ROWS
+        self.matrix[start:end] = np.rint(embeddings[start:end] / self.scale)
+    else:
+      raise ValueError(f'Unknown quantization: {quantization}')
+
+  def scores(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+    """Returns the approximate scores of queries against all rows, or only
+    against `rows` if set."""
+    if self.scale is not None:
+      queries = queries * self.scale
+    matrix = self.matrix if rows is None else self.matrix[rows]
+    return _blocked_scores(queries, matrix)
+
+
+def _rerank(embeddings: np.ndarray, query: np.ndarray, ids: np.ndarray,
+            approx_scores: np.ndarray, top_k: int) -> List[Dict]:
+  """Returns the top_k of ids by their full precision score, among the ones
+  with the highest approximate scores."""
+  num_candidates = top_k * _RERANK_FACTOR
+  if len(ids) > num_candidates:
+    ids = ids[np.argpartition(-approx_scores,
+                              num_candidates - 1)[:num_candidates]]
+  # Read the rows in order for better locality in a memory-mapped file.
+  ids = np.sort(ids)
+  scores = np.asarray(embeddings[ids], dtype=np.float32) @ query
+  return _top_k(scores, ids, top_k)
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, top_k: int) -> List[Dict]:
+  """Returns the top_k of scores (with ids being the corpus ids of scores) in
+  decreasing order of score."""
+  if len(scores) > top_k:
+    idx = np.argpartition(-scores, top_k - 1)[:top_k]
+  else:
+    idx = np.arange(len(scores))
+  idx = idx[np.argsort(-scores[idx], kind='stable')]
+  return [{'corpus_id': int(ids[i]), 'score': float(scores[i])} for i in idx]
+
+
+class ExactSearch:
+  """Brute-force cosine search against every sentence in the index."""
+
+  def __init__(self,
+               embeddings: np.ndarray,
+               normalized: bool = False,
+               quantization: str = ''):
+    # Normalize once, so a search is a single matrix product.
+    self.embeddings = _prepare(embeddings, normalized, quantization)
+    self.quantized = None
+    if quantization:
+      self.quantized = _Quantized(self.embeddings, quantization)
+    self._ids = np.arange(len(self.embeddings))
+
+  def search(self, query_embeddings: np.ndarray,
+             top_k: int) -> List[List[Dict]]:
+    queries = _normalize(np.atleast_2d(query_embeddings))
+    if not self.quantized:
+      scores = queries @ self.embeddings.T
+      return [_top_k(s, self._ids, top_k) for s in scores]
+    scores = self.quantized.scores(queries)
+    return [
+        _rerank(self.embeddings, q, self._ids, s, top_k)
+        for q, s in zip(queries, scores)
+    ]
+
+
+class IVFSearch:
+  """Inverted file index: sentences are clustered with spherical k-means, and a
+  query is only scored against the sentences in the nprobe clusters whose
+  centroids are closest to it.
+  """
+
+  def __init__(self,
+               embeddings: np.ndarray,
+               nlist: int = 0,
+               nprobe: int = 0,
+               normalized: bool = False,
+               quantization: str = ''):
+    self.embeddings = _prepare(embeddings, normalized, quantization)
+    self.quantized = None
+    if quantization:
+      self.quantized = _Quantized(self.embeddings, quantization)
+    n = len(self.embeddings)
+    if not nlist:
+      nlist = int(np.sqrt(n) * _IVF_NLIST_FACTOR)
+    self.nlist = max(1, min(nlist, n))
+    self.nprobe = min(nprobe or _IVF_DEFAULT_NPROBE, self.nlist)
+    self.centroids = self._train()
+    assignments = _assign(self.embeddings, self.centroids)
+    order = np.argsort(assignments, kind='stable')
+    bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+    # Sentence ids of each cluster.
+    self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+    logging.info(f'Built IVF index with {self.nlist} lists over {n} sentences')
+
+  def _train(self) -> np.ndarray:
+    rng = np.random.default_rng(_IVF_SEED)
+    sample = self.embeddings
+    if len(sample) > _IVF_KMEANS_SAMPLE:
+      sample = sample[np.sort(
+          rng.choice(len(sample), _IVF_KMEANS_SAMPLE, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), self.nlist, replace=False)]
+    for _ in range(_IVF_KMEANS_ITERS):
+      assignments = _assign(sample, centroids)
+      sums = np.zeros_like(centroids)
+      np.add.at(sums, assignments, sample)
+      empty = ~sums.any(axis=1)
+      # Keep the previous centroid for clusters that lost all their points.
+      sums[empty] = centroids[empty]
+      centroids = _normalize(sums)
+    return centroids
+
+  def search(self, query_embeddings: np.ndarray,
+             top_k: int) -> List[List[Dict]]:
+    queries = _normalize(np.atleast_2d(query_embeddings))
+    centroid_scores = queries @ self.centroids.T
+    probes = np.argpartition(-centroid_scores, self.nprobe - 1,
+                             axis=1)[:, :self.nprobe]
+    result = []
+    for query, query_probes in zip(queries, probes):
+      ids = np.concatenate([self.lists[c] for c in query_probes])
+      if self.quantized:
+        scores = self.quantized.scores(query[np.newaxis], rows=ids)[0]
+        result.append(_rerank(self.embeddings, query, ids, scores, top_k))
+      else:
+        scores = self.embeddings[ids] @ query
+        result.append(_top_k(scores, ids, top_k))
+    return result
+
+
+def create(embeddings: np.ndarray,
+           config: Dict = None,
+           normalized: bool = False):
+  """Creates the search backend for an index.
+
+  Args:
+    embeddings: the (num sentences x dim) index embeddings.
+    config: the `search` config of the index in embeddings.yaml, e.g.
+      {'type': 'ivf', 'nlist': 1024, 'nprobe': 32, 'quantization': 'int8'}.
+      Defaults to exact search at full precision.
+    normalized: whether the rows of `embeddings` already have unit length.
+  """
+  config = config or {}
+  search_type = config.get('type', EXACT)
+  quantization = config.get('quantization', '')
+  if search_type == EXACT:
+    return ExactSearch(embeddings,
+                       normalized=normalized,
+                       quantization=quantization)
+  if search_type == IVF:
+    return IVFSearch(embeddings,
+                     nlist=config.get('nlist', 0),
+                     nprobe=config.get('nprobe', 0),
+                     normalized=normalized,
+                     quantization=quantization)
+  raise ValueError(f'Unknown search type: {search_type}')
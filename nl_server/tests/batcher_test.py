@@ -0,0 +1,133 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for batcher."""
+
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+import unittest
+from unittest import mock
+
+from nl_server.batcher import Histogram
+from nl_server.batcher import MicroBatcher
+
+
+class TestHistogram(unittest.TestCase):
+
+  def test_snapshot(self):
+    h = Histogram([1, 10])
+    for v in [0.5, 1, 3, 10, 50]:
+      h.observe(v)
+    self.assertEqual(h.snapshot(), {
+        'buckets': {
+            '1': 2,
+            '10': 2,
+            '+Inf': 1
+        },
+        'count': 5,
+        'mean': 12.9,
+    })
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+  def test_batches_concurrent_submits(self):
+    batches = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(items):
+      # Hold the first batch until the other items are queued.
+      if not started.is_set():
+        started.set()
+        release.wait()
+      batches.append(items)
+      return [i * 10 for i in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=60000)
+    with ThreadPoolExecutor(max_workers=9) as executor:
+      first = executor.submit(batcher.submit, -1)
+      started.wait()
+      results = executor.map(batcher.submit, range(8))
+      while batcher._queue.qsize() < 8:
+        time.sleep(0.001)
+      release.set()
+      results = list(results)
+
+    self.assertEqual(first.result(), -10)
+    self.assertEqual(results, [i * 10 for i in range(8)])
+    # The items submitted while the first one was processed are batched, by
+    # size.
+    self.assertEqual([len(b) for b in batches], [1, 4, 4])
+    self.assertEqual(sorted(i for b in batches[1:] for i in b), list(range(8)))
+    stats = batcher.stats()
+    self.assertEqual(stats['batch_size']['count'], 3)
+    self.assertEqual(stats['batch_size']['buckets']['4'], 2)
+    self.assertEqual(stats['queue_wait_ms']['count'], 9)
+
+  def test_single_item_does_not_wait_for_batch(self):
+    # The wait is far longer than the test, but an item submitted when there
+    # is nothing else pending is processed right away.
+    batcher = MicroBatcher(lambda items: [i + 1 for i in items],
+                           max_batch_size=100,
+                           max_wait_ms=60000)
+    start = time.perf_counter()
+    self.assertEqual(batcher.submit(1), 2)
+    self.assertEqual(batcher.submit(2), 3)
+    self.assertLess(time.perf_counter() - start, 5)
+    self.assertEqual(batcher.stats()['batch_size']['buckets']['1'], 2)
+
+  def test_exception_raised_to_callers(self):
+
+    def process(items):
+      raise ValueError('bad batch')
+
+    batcher = MicroBatcher(process)
+    with self.assertRaises(ValueError):
+      batcher.submit(1)
+
+  def test_close(self):
+    batcher = MicroBatcher(lambda items: [i + 1 for i in items], max_wait_ms=1)
+    self.assertEqual(batcher.submit(1), 2)
+    batcher.close()
+    # Items are still processed after the batcher is closed, just unbatched.
+    self.assertEqual(batcher.submit(2), 3)
+    self.assertEqual(batcher.stats()['batch_size']['count'], 1)
+
+  def test_close_while_submitting(self):
+    batcher = MicroBatcher(lambda items: [i + 1 for i in items], max_wait_ms=1)
+
+    class ClosingQueue(queue.Queue):
+      """Closes the batcher while an item is being submitted."""
+
+      def put(self, item, *args, **kwargs):
+        if item is not None:
+          closer = threading.Thread(target=batcher.close)
+          closer.start()
+          # Give close() the chance to queue its sentinel first.
+          closer.join(timeout=0.2)
+        super().put(item, *args, **kwargs)
+
+    results = []
+    with mock.patch.object(queue, 'Queue', ClosingQueue):
+      # A daemon thread, so that the test fails rather than hangs if the item
+      # is never processed.
+      submitter = threading.Thread(
+          target=lambda: results.append(batcher.submit(1)), daemon=True)
+      submitter.start()
+      submitter.join(timeout=5)
+    # The item is processed, though the batcher was closed meanwhile.
+    self.assertEqual(results, [2])
+    self.assertEqual(batcher.submit(2), 3)
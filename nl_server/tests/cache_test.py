@@ -0,0 +1,60 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for LRUCache."""
+
+import unittest
+
+from nl_server.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+  def test_get_put(self):
+    cache = LRUCache(max_size=2)
+    self.assertIsNone(cache.get('a'))
+    cache.put('a', 1)
+    cache.put('b', 2)
+    self.assertEqual(cache.get('a'), 1)
+    self.assertEqual(cache.get('b'), 2)
+    self.assertEqual(cache.stats(), {
+        'size': 2,
+        'max_size': 2,
+        'hits': 2,
+        'misses': 1,
+        'hit_rate': 2 / 3,
+    })
+
+  def test_evicts_least_recently_used(self):
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Touch 'a' so that 'b' is evicted next.
+    cache.get('a')
+    cache.put('c', 3)
+    self.assertEqual(len(cache), 2)
+    self.assertIsNone(cache.get('b'))
+    self.assertEqual(cache.get('a'), 1)
+    self.assertEqual(cache.get('c'), 3)
+
+  def test_put_existing(self):
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.put('a', 3)
+    cache.put('c', 4)
+    self.assertEqual(cache.get('a'), 3)
+    self.assertIsNone(cache.get('b'))
+
+  def test_empty_stats(self):
+    self.assertEqual(LRUCache(max_size=1).stats()['hit_rate'], 0.0)
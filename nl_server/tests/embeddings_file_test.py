@@ -0,0 +1,103 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for embeddings_file."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from nl_server import embeddings_file
+
+_CSV = """0,1,2,dcid,sentence
+3.0,0.0,4.0,Count_Person,population
+0.0,2.0,0.0,"Count_Person_Male,Count_Person_Female",number of men and women
+1.0,1.0,1.0,Median_Age_Person,
+"""
+
+
+class TestEmbeddingsFile(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.csv_path = os.path.join(self.tmp.name,
+                                 'embeddings_small_2023_01_01.ft.model.csv')
+    with open(self.csv_path, 'w') as f:
+      f.write(_CSV)
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_load_csv(self):
+    data = embeddings_file.load(self.csv_path)
+    self.assertEqual(data.dcids, [
+        'Count_Person', 'Count_Person_Male,Count_Person_Female',
+        'Median_Age_Person'
+    ])
+    self.assertEqual(data.sentences,
+                     ['population', 'number of men and women', ''])
+    self.assertEqual(data.embeddings.dtype, np.float32)
+    np.testing.assert_array_equal(data.embeddings[0], [3, 0, 4])
+    self.assertFalse(data.normalized)
+
+  def test_binary_round_trip(self):
+    path = embeddings_file.binary_path(self.csv_path)
+    self.assertEqual(os.path.basename(path),
+                     'embeddings_small_2023_01_01.ft.model.emb')
+    csv_data = embeddings_file.load_csv(self.csv_path)
+    embeddings_file.write_binary(path, csv_data)
+
+    data = embeddings_file.load(path)
+    self.assertIsInstance(data.embeddings, np.memmap)
+    self.assertFalse(data.embeddings.flags.writeable)
+    self.assertEqual(data.embeddings.offset % 64, 0)
+    self.assertTrue(data.normalized)
+    self.assertEqual(data.dcids, csv_data.dcids)
+    self.assertEqual(data.sentences, csv_data.sentences)
+    np.testing.assert_allclose(data.embeddings[0], [0.6, 0, 0.8], rtol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(data.embeddings, axis=1),
+                               [1, 1, 1],
+                               rtol=1e-6)
+
+  def test_binary_float16(self):
+    path = embeddings_file.binary_path(self.csv_path)
+    embeddings_file.write_binary(path,
+                                 embeddings_file.load_csv(self.csv_path),
+                                 dtype='float16')
+    data = embeddings_file.load(path)
+    self.assertEqual(data.embeddings.dtype, np.float16)
+    self.assertEqual(data.embeddings.shape, (3, 3))
+    np.testing.assert_allclose(data.embeddings[1], [0, 1, 0])
+
+  def test_not_binary(self):
+    path = os.path.join(self.tmp.name, 'bad.emb')
+    with open(path, 'wb') as f:
+      f.write(b'0,1,2,dcid\n')
+    with self.assertRaises(ValueError):
+      embeddings_file.load(path)
+
+  def test_load_mapped(self):
+    data = embeddings_file.load_mapped(self.csv_path)
+    self.assertIsInstance(data.embeddings, np.memmap)
+    self.assertTrue(data.normalized)
+    self.assertEqual(data.dcids[0], 'Count_Person')
+    path = embeddings_file.binary_path(self.csv_path)
+    self.assertTrue(os.path.exists(path))
+
+    # The existing binary file is used as is.
+    mtime = os.stat(path).st_mtime_ns
+    data = embeddings_file.load_mapped(self.csv_path)
+    self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+    np.testing.assert_allclose(data.embeddings[0], [0.6, 0, 0.8], rtol=1e-6)
@@ -15,17 +15,22 @@
 
 import json
 import os
+import random
 import unittest
+from unittest import mock
 
 from diskcache import Cache
 from parameterized import parameterized
 from sklearn.metrics.pairwise import cosine_similarity
 import yaml
 
+from nl_server import embeddings
 from nl_server import gcs
 from nl_server import loader
+from nl_server import query_util
 from nl_server.embeddings import Embeddings
 from nl_server.loader import nl_cache_path
+from shared.lib import detected_variables as vars
 
 _root_dir = os.path.dirname(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -40,8 +45,8 @@ _tuned_model_key = "tuned_model"
 def _get_embeddings_file_path() -> str:
   embeddings_config_path = os.path.join(_root_dir, 'deploy/nl/embeddings.yaml')
   with open(embeddings_config_path) as f:
-    embeddings = yaml.full_load(f)
-    embeddings_file = embeddings[loader.DEFAULT_INDEX_TYPE]
+    embeddings_map, _ = loader.parse_embeddings_config(yaml.full_load(f))
+    embeddings_file = embeddings_map[loader.DEFAULT_INDEX_TYPE]
     return gcs.download_embeddings(embeddings_file)
 
 
@@ -187,3 +192,144 @@ class TestEmbeddings(unittest.TestCase):
     # Check all scores.
     for score in got['CosineScore']:
       self.assertLess(score, 0.45)
+
+
+def _split(parts):
+  return query_util.QuerySplit(parts=parts)
+
+
+def _result(score, sv):
+  return vars.VarCandidates(svs=[sv], scores=[score], sv2sentences={})
+
+
+class TestMultiSVPruning(unittest.TestCase):
+
+  def setUp(self):
+    self.two_way = query_util.QuerySet(nsplits=2,
+                                       delim_based=False,
+                                       combinations=[
+                                           _split(['a', 'b c']),
+                                           _split(['a b', 'c']),
+                                       ])
+    self.three_way = query_util.QuerySet(nsplits=3,
+                                         delim_based=False,
+                                         combinations=[
+                                             _split(['a', 'b', 'c']),
+                                             _split(['d', 'e', 'f']),
+                                             _split(['g', 'h', 'i']),
+                                             _split(['j', 'k', 'l']),
+                                         ])
+    # The parts of all the 3-way splits but "k".
+    self.query2result = {p: _result(0.9, f'sv_{p}') for p in 'abcdefghijl'}
+    self.query2result['j'] = _result(0.6, 'sv_j')
+
+  def test_first_stage_parts(self):
+    self.assertEqual(
+        embeddings._first_stage_parts([self.two_way, self.three_way]),
+        {'a', 'b c', 'a b', 'c', 'd', 'f', 'g', 'i', 'j', 'l'})
+
+  def test_promising_parts(self):
+    # The split with "k" can't make the top 3 splits, even if "k" matches
+    # perfectly.
+    self.assertEqual(
+        embeddings._promising_parts([self.three_way], self.query2result), set())
+
+    # Now it may, since only two other splits are candidates.
+    del self.query2result['i']
+    self.assertEqual(
+        embeddings._promising_parts([self.three_way], self.query2result),
+        {'i', 'k'})
+    # The split with "i" has a higher score bound.
+    self.assertEqual(
+        embeddings._promising_parts([self.three_way],
+                                    self.query2result,
+                                    max_splits=1), {'i'})
+
+  def test_promising_parts_per_queryset(self):
+    del self.query2result['i']
+    self.query2result.update({
+        'b c': _result(0.99, 'sv_bc'),
+        'a b': _result(0.99, 'sv_ab'),
+    })
+    # The 3-way splits are returned by the top 3 among themselves, so may be
+    # returned though the 2-way splits score higher.
+    self.assertEqual(
+        embeddings._promising_parts([self.two_way, self.three_way],
+                                    self.query2result), {'i', 'k'})
+
+  def test_promising_parts_score_above_one(self):
+    # Scores of normalized float32 embeddings can be slightly above 1.
+    above_one = 1.0000002
+    for p in 'abcdefghi':
+      self.query2result[p] = _result(1.0, f'sv_{p}')
+    self.query2result['j'] = _result(0.99999995, 'sv_j')
+    self.query2result['l'] = _result(1.0, 'sv_l')
+    self.assertEqual(
+        embeddings._promising_parts([self.three_way], self.query2result), {'k'})
+
+    # Which makes the split with "k" the top candidate.
+    self.query2result['k'] = _result(above_one, 'sv_k')
+    candidate = embeddings._split_candidate(self.three_way.combinations[3],
+                                            False, self.query2result)
+    self.assertGreater(candidate.aggregate_score, 1.0)
+
+  def test_promising_parts_below_threshold(self):
+    del self.query2result['i']
+    self.query2result['g'] = _result(0.3, 'sv_g')
+    self.assertEqual(
+        embeddings._promising_parts([self.three_way], self.query2result), {'k'})
+
+  def test_promising_parts_repeated_part(self):
+    queryset = query_util.QuerySet(nsplits=3,
+                                   delim_based=False,
+                                   combinations=[_split(['a', 'b', 'a'])])
+    self.assertEqual(embeddings._promising_parts([queryset], {}), set())
+
+
+class TestMultiSVPruningOutput(unittest.TestCase):
+  """Checks that multi-SV detection with pruned searches returns the same as
+  searching all the query parts, for random search results."""
+
+  _QUERIES = [
+      'poverty obesity asthma',
+      'poverty obesity asthma diabetes crime',
+      'median income of hispanic women with phd in california counties',
+      'unemployment rate vs rainfall, temperature and crime',
+      'male population female population',
+  ]
+  _SCORES = [0.3, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0, 1.0000002]
+
+  def setUp(self):
+    self.embeddings = Embeddings.__new__(Embeddings)
+    self.embeddings.query_length_stats = embeddings.QueryLengthStats()
+    self.embeddings._search_embeddings = self._search_embeddings
+    self.searched = []
+
+  def _search_embeddings(self, queries):
+    self.searched.extend(queries)
+    result = {}
+    for q in queries:
+      rng = random.Random(f'{self.seed}:{q}')
+      scores = sorted(rng.sample(self._SCORES, 3), reverse=True)
+      # Few SVs, so that the parts often share some.
+      svs = rng.sample([f'sv{i}' for i in range(6)], 3)
+      result[q] = vars.VarCandidates(svs=svs, scores=scores, sv2sentences={})
+    return result
+
+  def test_same_as_searching_all_parts(self):
+    num_pruned = 0
+    num_all = 0
+    for seed in range(50):
+      self.seed = seed
+      self.searched = []
+      got = self.embeddings.detect_svs_many(self._QUERIES)
+      num_pruned += len(self.searched)
+
+      self.searched = []
+      with mock.patch.object(embeddings, '_first_stage_parts',
+                             embeddings._queryset_parts):
+        want = self.embeddings.detect_svs_many(self._QUERIES)
+      num_all += len(self.searched)
+
+      self.assertEqual(got, want, f'seed: {seed}')
+    self.assertLess(num_pruned, num_all)
@@ -0,0 +1,87 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the shared model registry (in models.py)."""
+
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from nl_server import models
+from nl_server.embeddings import Embeddings
+
+_CSV = """0,1,dcid,sentence
+1.0,0.0,Count_Person,population
+0.0,1.0,Median_Age_Person,median age
+"""
+
+
+class FakeSentenceTransformer:
+
+  def __init__(self, path):
+    self.path = path
+    self.tokenizer = None
+
+  def encode(self, texts, show_progress_bar=False):
+    return np.ones((len(texts), 2), dtype=np.float32)
+
+
+@mock.patch.object(models, 'SentenceTransformer', FakeSentenceTransformer)
+class TestModels(unittest.TestCase):
+
+  def setUp(self):
+    patcher = mock.patch.object(models, '_MODELS', {})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    self.model_path = os.path.join(self.tmp.name, 'ft_final_model')
+    os.makedirs(self.model_path)
+    self.csv_paths = []
+    for name in ['medium_ft', 'sdg_ft']:
+      path = os.path.join(self.tmp.name, f'embeddings_{name}.csv')
+      with open(path, 'w') as f:
+        f.write(_CSV)
+      self.csv_paths.append(path)
+
+  def test_shared(self):
+    self.assertIs(models.get(self.model_path), models.get(self.model_path))
+    self.assertIsNot(models.get(self.model_path), models.get(''))
+
+    medium = Embeddings(self.csv_paths[0], self.model_path)
+    sdg = Embeddings(self.csv_paths[1], self.model_path)
+    default = Embeddings(self.csv_paths[1])
+    self.addCleanup(medium.close)
+    self.addCleanup(sdg.close)
+    self.addCleanup(default.close)
+    self.assertIs(medium.model, sdg.model)
+    self.assertIs(medium.model, models.get(self.model_path))
+    self.assertIsNot(medium.model, default.model)
+    self.assertEqual(list(models.cache_stats().keys()),
+                     [self.model_path, models.DEFAULT_MODEL_NAME])
+
+  def test_unpickled_through_registry(self):
+    model = models.get(self.model_path)
+    self.assertIs(pickle.loads(pickle.dumps(model)), model)
+
+    # Indices unpickled (e.g. from the local disk cache) share the model.
+    index = Embeddings(self.csv_paths[0], self.model_path)
+    self.addCleanup(index.close)
+    unpickled = pickle.loads(pickle.dumps(index))
+    self.addCleanup(unpickled.close)
+    self.assertIs(unpickled.model, model)
+    self.assertEqual(unpickled.dcids, index.dcids)
@@ -134,7 +134,7 @@ class TestNERPlaces(unittest.TestCase):
   ])
   def test_heuristic_detection(self, query_str, expected):
     got = nl_utils.place_detection_with_heuristics(
-        self.nl_ner_model.detect_places_ner, query_str)
+        self.nl_ner_model.detect_places_ner_many, query_str)
     self.assertEqual(expected, got)
 
   @parameterized.expand(
@@ -0,0 +1,133 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the ONNX Runtime encoder (in onnx_encoder.py)."""
+
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import importlib.util
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import yaml
+
+from nl_server import loader
+from nl_server import models
+from nl_server import onnx_encoder
+
+_root_dir = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_GOLDEN_CSV = os.path.join(_root_dir, 'tools/nl/validator/golden/palmnl.csv')
+# Every Nth query of the golden set is used for the parity test.
+_QUERY_STRIDE = 30
+
+_tuned_model_key = "tuned_model"
+
+
+def _get_tuned_model_path() -> str:
+  models_config_path = os.path.join(_root_dir, 'deploy/nl/models.yaml')
+  with open(models_config_path) as f:
+    models_map = yaml.full_load(f)
+    tuned_model_dict = {_tuned_model_key: models_map[_tuned_model_key]}
+    models_downloaded_paths = loader.download_models(tuned_model_dict)
+    return models_downloaded_paths[models_map[_tuned_model_key]]
+
+
+def _golden_queries():
+  with open(_GOLDEN_CSV) as f:
+    rows = list(csv.DictReader(f))
+  return [r['Query'] for r in rows[::_QUERY_STRIDE]]
+
+
+class TestPool(unittest.TestCase):
+
+  def test_mean_ignores_padding(self):
+    hidden = np.array([[[1, 2], [3, 4], [100, 100]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    np.testing.assert_array_equal(
+        onnx_encoder.pool(hidden, mask, onnx_encoder.MEAN), [[2, 3]])
+
+  def test_cls(self):
+    hidden = np.array([[[1, 2], [3, 4]]], dtype=np.float32)
+    np.testing.assert_array_equal(
+        onnx_encoder.pool(hidden, np.array([[1, 1]]), onnx_encoder.CLS),
+        [[1, 2]])
+
+
+def _fake_export(model, onnx_dir):
+  # Slow enough for concurrent exports to overlap.
+  time.sleep(0.1)
+  with open(os.path.join(onnx_dir, onnx_encoder._CONFIG_FILE), 'w') as f:
+    f.write('{}')
+
+
+class TestExport(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    self.onnx_dir = os.path.join(self.tmp.name, 'model')
+
+  @mock.patch.object(onnx_encoder, '_export', side_effect=_fake_export)
+  def test_concurrent(self, mock_export):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+      list(
+          executor.map(lambda _: onnx_encoder.export(None, self.onnx_dir),
+                       range(4)))
+    self.assertEqual(mock_export.call_count, 1)
+    self.assertTrue(onnx_encoder.exists(self.onnx_dir))
+    # No temporary directories are left behind.
+    self.assertEqual(sorted(os.listdir(self.tmp.name)), ['model', 'model.lock'])
+
+  @mock.patch.object(onnx_encoder, '_export', side_effect=ValueError('bad'))
+  def test_failed(self, _):
+    with self.assertRaises(ValueError):
+      onnx_encoder.export(None, self.onnx_dir)
+    self.assertFalse(os.path.exists(self.onnx_dir))
+    self.assertEqual(os.listdir(self.tmp.name), ['model.lock'])
+
+  @mock.patch.object(onnx_encoder, '_export', side_effect=_fake_export)
+  def test_replaces_partial_export(self, _):
+    os.makedirs(self.onnx_dir)
+    with open(os.path.join(self.onnx_dir, 'model.onnx'), 'w') as f:
+      f.write('partial')
+    onnx_encoder.export(None, self.onnx_dir)
+    self.assertEqual(os.listdir(self.onnx_dir), [onnx_encoder._CONFIG_FILE])
+
+
+@unittest.skipUnless(importlib.util.find_spec('onnxruntime'),
+                     'onnxruntime is not installed')
+class TestOnnxParity(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls) -> None:
+    model_path = _get_tuned_model_path()
+    cls.torch_model = models.EmbeddingsModel(model_path, models.TORCH)
+    cls.onnx_model = models.EmbeddingsModel(model_path, models.ONNX)
+
+  def test_golden_queries_cosine(self):
+    self.assertEqual(self.onnx_model.backend, models.ONNX)
+    queries = _golden_queries()
+    want = self.torch_model.model.encode(queries)
+    got = self.onnx_model.model.encode(queries)
+    self.assertEqual(got.shape, want.shape)
+
+    cosine = np.sum(want * got, axis=1) / (np.linalg.norm(want, axis=1) *
+                                           np.linalg.norm(got, axis=1))
+    self.assertGreater(np.mean(cosine), 0.99)
+    self.assertGreater(np.min(cosine), 0.95)
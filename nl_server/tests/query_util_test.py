@@ -18,6 +18,7 @@ import unittest
 from parameterized import parameterized
 
 from nl_server.query_util import get_parts_via_delimiters
+from nl_server.query_util import MAX_QUERYSET_PARTS
 from nl_server.query_util import prepare_multivar_querysets
 from nl_server.query_util import QuerySet
 from nl_server.query_util import QuerySplit
@@ -155,3 +156,19 @@ class TestPrepareMultivarQuerysets(unittest.TestCase):
   def test_prepare_multivar_querysets(self, query, expected):
     self.maxDiff = None
     self.assertEqual(prepare_multivar_querysets(query), expected)
+
+  def test_prepare_multivar_querysets_budget(self):
+    words = [
+        'hispanic', 'women', 'phd', 'income', 'poverty', 'obesity', 'asthma',
+        'diabetes', 'unemployment', 'crime', 'rainfall', 'temperature'
+    ]
+    querysets = prepare_multivar_querysets(' '.join(words))
+
+    parts = set()
+    for qs in querysets:
+      for c in qs.combinations:
+        parts.update(c.parts)
+    self.assertLessEqual(len(parts), MAX_QUERYSET_PARTS)
+    # All the 2-way splits fit in the budget, before any longer split.
+    self.assertEqual(querysets[0].nsplits, 2)
+    self.assertEqual(len(querysets[0].combinations), len(words) - 1)
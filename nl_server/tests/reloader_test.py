@@ -0,0 +1,180 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the embeddings Reloader (in reloader.py)."""
+
+import json
+import os
+import signal
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+from gunicorn import arbiter
+
+from nl_server import loader
+from nl_server import reloader
+
+_OLD_FILE = 'embeddings_small_2023_01_01_00_00_00.csv'
+_NEW_FILE = 'embeddings_small_2023_02_01_00_00_00.csv'
+
+
+class FakeEmbeddings:
+
+  def __init__(self, embeddings_file, svs):
+    self.embeddings_file = embeddings_file
+    self.svs = svs
+    self.closed = False
+
+  def detect_svs_many(self, queries, skip_multi_sv):
+    return [{'SV': self.svs} for _ in queries]
+
+  def close(self):
+    self.closed = True
+
+
+class TestReloader(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.embeddings_config_path = os.path.join(self.tmp_dir.name,
+                                               'embeddings.yaml')
+    models_config_path = os.path.join(self.tmp_dir.name, 'models.yaml')
+    with open(models_config_path, 'w') as f:
+      f.write('tuned_model: ft_final_v1\n')
+    self._write_config(_OLD_FILE)
+
+    self.old_embeddings = FakeEmbeddings(_OLD_FILE, ['Count_Person'])
+    self.app = Flask(__name__)
+    self.app.config['EMBEDDINGS_VERSION_MAP'] = {'small': _OLD_FILE}
+    self.app.config['EMBEDDINGS_SEARCH_CONFIGS'] = {'small': {}}
+    self.app.config[loader.embeddings_config_key('small')] = self.old_embeddings
+    self.reloader = reloader.Reloader(self.app, self.embeddings_config_path,
+                                      models_config_path)
+
+    patcher = mock.patch.object(loader, 'download_models', return_value={})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _write_config(self, embeddings_file):
+    with open(self.embeddings_config_path, 'w') as f:
+      f.write(f'small: {embeddings_file}\n')
+
+  @mock.patch.object(loader, 'build_embeddings')
+  def test_unchanged_config(self, mock_build):
+    self.reloader.check()
+    mock_build.assert_not_called()
+
+  @mock.patch.object(loader, 'build_embeddings')
+  def test_swap(self, mock_build):
+    new_embeddings = FakeEmbeddings(_NEW_FILE, ['Count_Person'])
+    mock_build.return_value = new_embeddings
+    self._write_config(_NEW_FILE)
+
+    self.reloader.check()
+
+    mock_build.assert_called_once_with('small', _NEW_FILE, {}, {})
+    self.assertIs(self.app.config[loader.embeddings_config_key('small')],
+                  new_embeddings)
+    self.assertEqual(self.app.config['EMBEDDINGS_VERSION_MAP'],
+                     {'small': _NEW_FILE})
+    self.assertTrue(self.old_embeddings.closed)
+
+  @mock.patch.object(loader, 'build_embeddings')
+  def test_failed_validation_keeps_old_version(self, mock_build):
+    mock_build.return_value = FakeEmbeddings(_NEW_FILE, [])
+    self._write_config(_NEW_FILE)
+
+    self.reloader.check()
+
+    self.assertIs(self.app.config[loader.embeddings_config_key('small')],
+                  self.old_embeddings)
+    self.assertEqual(self.app.config['EMBEDDINGS_VERSION_MAP'],
+                     {'small': _OLD_FILE})
+    self.assertFalse(self.old_embeddings.closed)
+
+  @mock.patch.object(os, 'kill')
+  @mock.patch.object(reloader, '_is_gunicorn_master', return_value=False)
+  @mock.patch.object(loader, 'build_embeddings')
+  def test_swap_without_gunicorn_does_not_restart(self, mock_build, _,
+                                                  mock_kill):
+    mock_build.return_value = FakeEmbeddings(_NEW_FILE, ['Count_Person'])
+    self._write_config(_NEW_FILE)
+
+    self.reloader.check()
+
+    self.assertEqual(self.app.config['EMBEDDINGS_VERSION_MAP'],
+                     {'small': _NEW_FILE})
+    mock_kill.assert_not_called()
+
+  @mock.patch.object(os, 'kill')
+  @mock.patch.object(reloader, '_is_gunicorn_master', return_value=True)
+  @mock.patch.object(loader, 'build_embeddings')
+  def test_gunicorn_workers_share_one_reload(self, mock_build, _, mock_kill):
+    new_embeddings = FakeEmbeddings(_NEW_FILE, ['Count_Person'])
+    mock_build.return_value = new_embeddings
+    self._write_config(_NEW_FILE)
+
+    # The master loads the new index once, and restarts the workers.
+    self.reloader.check()
+    self.reloader.check()
+    mock_build.assert_called_once()
+    mock_kill.assert_called_once_with(os.getpid(), signal.SIGHUP)
+
+    # The workers are forked from the master after the restart, like gunicorn
+    # does, and all serve the index loaded by the master.
+    workers = []
+    for _ in range(3):
+      read_fd, write_fd = os.pipe()
+      pid = os.fork()
+      if pid == 0:
+        os.close(read_fd)
+        nl_embeddings = self.app.config[loader.embeddings_config_key('small')]
+        with os.fdopen(write_fd, 'w') as f:
+          json.dump(
+              {
+                  'version_map': self.app.config['EMBEDDINGS_VERSION_MAP'],
+                  'embeddings_file': nl_embeddings.embeddings_file,
+                  'embeddings_id': id(nl_embeddings),
+              }, f)
+        os._exit(0)
+      os.close(write_fd)
+      workers.append((pid, read_fd))
+
+    for pid, read_fd in workers:
+      with os.fdopen(read_fd) as f:
+        worker_state = json.load(f)
+      os.waitpid(pid, 0)
+      self.assertEqual(
+          worker_state, {
+              'version_map': {
+                  'small': _NEW_FILE
+              },
+              'embeddings_file': _NEW_FILE,
+              'embeddings_id': id(new_embeddings),
+          })
+    mock_build.assert_called_once()
+
+  def test_is_gunicorn_master(self):
+    self.assertFalse(reloader._is_gunicorn_master())
+
+    master = arbiter.Arbiter.__new__(arbiter.Arbiter)
+    old_handler = signal.signal(signal.SIGHUP, master.signal)
+    try:
+      self.assertTrue(reloader._is_gunicorn_master())
+    finally:
+      signal.signal(signal.SIGHUP, old_handler)
@@ -0,0 +1,122 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the search backends (in search.py)."""
+
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from nl_server import search
+
+
+def _clustered(num_clusters, num_points, dim, seed=0):
+  rng = np.random.default_rng(seed)
+  centers = rng.normal(size=(num_clusters, dim))
+  points = centers[rng.integers(0, num_clusters, num_points)]
+  return points + 0.3 * rng.normal(size=(num_points, dim))
+
+
+def _ids(hits):
+  return [h['corpus_id'] for h in hits]
+
+
+class TestExactSearch(unittest.TestCase):
+
+  def test_cosine_order(self):
+    index = search.create(
+        np.array([[1, 0], [0, 1], [1, 1], [-1, 0]], dtype=np.float32))
+    hits = index.search(np.array([[2, 0.1]]), top_k=3)
+    self.assertEqual(len(hits), 1)
+    self.assertEqual(_ids(hits[0]), [0, 2, 1])
+    self.assertAlmostEqual(hits[0][1]['score'],
+                           (2.1 / np.sqrt(4.01)) / np.sqrt(2),
+                           places=5)
+
+  def test_top_k_larger_than_index(self):
+    index = search.create(np.eye(3))
+    hits = index.search(np.array([[0, 0, 1], [0, 1, 0]]), top_k=10)
+    self.assertEqual(_ids(hits[0]), [2, 0, 1])
+    self.assertEqual(_ids(hits[1]), [1, 0, 2])
+
+
+class TestIVFSearch(unittest.TestCase):
+
+  def test_matches_exact_when_probing_all_lists(self):
+    embeddings = _clustered(10, 500, 16)
+    queries = _clustered(10, 20, 16, seed=1)
+    exact = search.create(embeddings).search(queries, top_k=5)
+    ivf = search.create(embeddings, {'type': 'ivf', 'nlist': 8, 'nprobe': 8})
+    self.assertEqual(ivf.nlist, 8)
+    self.assertEqual(ivf.nprobe, 8)
+    self.assertEqual([_ids(h) for h in ivf.search(queries, top_k=5)],
+                     [_ids(h) for h in exact])
+
+  def test_recall(self):
+    embeddings = _clustered(50, 5000, 32)
+    queries = embeddings[:50] + 0.1
+    exact = search.create(embeddings).search(queries, top_k=10)
+    ivf = search.create(embeddings, {'type': 'ivf', 'nprobe': 8})
+    hits = ivf.search(queries, top_k=10)
+    recall = np.mean(
+        [len(set(_ids(a)) & set(_ids(b))) / 10 for a, b in zip(exact, hits)])
+    self.assertGreater(recall, 0.9)
+
+  def test_every_sentence_in_one_list(self):
+    ivf = search.create(_clustered(5, 300, 8), {'type': 'ivf', 'nlist': 7})
+    ids = np.sort(np.concatenate(ivf.lists))
+    self.assertEqual(ids.tolist(), list(range(300)))
+
+
+class TestQuantizedSearch(unittest.TestCase):
+
+  @parameterized.expand([
+      ('exact', 'float16'),
+      ('exact', 'int8'),
+      ('ivf', 'int8'),
+  ])
+  def test_matches_full_precision(self, search_type, quantization):
+    embeddings = _clustered(20, 3000, 32)
+    queries = embeddings[:30] + 0.05
+    config = {'type': search_type, 'nlist': 10, 'nprobe': 10}
+    want = search.create(embeddings, config).search(queries, top_k=10)
+    config['quantization'] = quantization
+    index = search.create(embeddings, config)
+    got = index.search(queries, top_k=10)
+    self.assertEqual(index.quantized.matrix.dtype, np.dtype(quantization))
+    self.assertEqual([_ids(h) for h in got], [_ids(h) for h in want])
+    # Scores come from the full precision re-ranking.
+    for w, g in zip(want, got):
+      np.testing.assert_allclose([h['score'] for h in g],
+                                 [h['score'] for h in w],
+                                 rtol=1e-5)
+
+  def test_uses_normalized_matrix_as_is(self):
+    embeddings = _clustered(5, 100, 8)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings.astype(np.float16)
+    index = search.create(embeddings, {'quantization': 'int8'}, normalized=True)
+    self.assertIs(index.embeddings, embeddings)
+    self.assertEqual(_ids(index.search(embeddings[3], top_k=1)[0]), [3])
+
+  def test_unknown_quantization(self):
+    with self.assertRaises(ValueError):
+      search.create(np.eye(2), {'quantization': 'int4'})
+
+
+class TestCreate(unittest.TestCase):
+
+  def test_unknown_type(self):
+    with self.assertRaises(ValueError):
+      search.create(np.eye(2), {'type': 'hnsw'})
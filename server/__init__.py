@@ -32,9 +32,11 @@ from opencensus.ext.flask.flask_middleware import FlaskMiddleware
 from opencensus.trace.propagation import google_cloud_format
 from opencensus.trace.samplers import AlwaysOnSampler
 
+from server.lib import existence_index
+from server.lib import sv_hierarchy
 from server.lib import topic_cache
 import server.lib.config as libconfig
-from server.lib.disaster_dashboard import get_disaster_dashboard_data
+import server.lib.disaster_dashboard as disaster_dashboard
 import server.lib.i18n as i18n
 from server.lib.nl.common import bad_words
 from server.lib.nl.detection import llm_prompt
@@ -46,9 +48,14 @@ from server.services.discovery import get_health_check_urls
 propagator = google_cloud_format.GoogleCloudFormatPropagator()
 
 BLOCKLIST_SVG_FILE = "/datacommons/svg/blocklist_svg.json"
+SV_HIERARCHY_FILE = "/datacommons/svg/sv_hierarchy.json.gz"
+EXISTENCE_INDEX_FILE = "/datacommons/existence/existence_index.bin"
 
 DEFAULT_NL_ROOT = "http://127.0.0.1:6060"
 
+# How often to check for updated disaster json data.
+DISASTER_DASHBOARD_REFRESH_SECS = 3600
+
 
 def createMiddleWare(app, exporter):
   # Configure a flask middleware that listens for each request and applies
@@ -129,9 +136,22 @@ def register_routes_disasters(app):
 
   # load disaster json data
   if os.environ.get('ENABLE_DISASTER_JSON') == 'true':
-    disaster_dashboard_data = get_disaster_dashboard_data(
-        app.config['GCS_BUCKET'])
+    loader = disaster_dashboard.DisasterDataLoader(
+        disaster_dashboard.GcsEventSource(app.config['GCS_BUCKET']),
+        os.environ.get('DISASTER_DASHBOARD_SNAPSHOT_DIR',
+                       disaster_dashboard.DEFAULT_SNAPSHOT_DIR))
+    disaster_dashboard_data = loader.load()
     app.config['DISASTER_DASHBOARD_DATA'] = disaster_dashboard_data
+    app.config[
+        'DISASTER_DASHBOARD_INDEX'] = disaster_dashboard.build_disaster_dashboard_index(
+            disaster_dashboard_data)
+    # Keep refreshing in the background so new events show up without a
+    # restart (and so data loaded from a stale snapshot gets updated).
+    disaster_dashboard.start_background_refresh(
+        app, loader,
+        int(
+            os.environ.get('DISASTER_DASHBOARD_REFRESH_SECS',
+                           DISASTER_DASHBOARD_REFRESH_SECS)))
 
 
 def register_routes_sustainability(app):
@@ -374,8 +394,11 @@ def create_app(nl_root=DEFAULT_NL_ROOT):
     app.config['NL_DISASTER_CONFIG'] = libutil.get_nl_disaster_config()
     if app.config['LOG_QUERY']:
       app.config['NL_TABLE'] = bt.get_nl_table()
+      app.config['NL_QUERY_LOGGER'] = bt.QueryLogger(app,
+                                                     app.config['NL_TABLE'])
     else:
       app.config['NL_TABLE'] = None
+      app.config['NL_QUERY_LOGGER'] = None
 
     # Get the API key from environment first.
     if cfg.USE_PALM:
@@ -407,6 +430,16 @@ def create_app(nl_root=DEFAULT_NL_ROOT):
       blocklist_svg = json.load(f) or []
   app.config['BLOCKLIST_SVG'] = blocklist_svg
 
+  # Load the stat var hierarchy snapshot, if there is one, to serve stat var
+  # group info locally.
+  app.config['SV_HIERARCHY'] = sv_hierarchy.load(
+      os.environ.get('SV_HIERARCHY_FILE', SV_HIERARCHY_FILE))
+
+  # Load the stat var existence index, if there is one, to answer existence
+  # checks for the indexed places locally.
+  app.config['EXISTENCE_INDEX'] = existence_index.load(
+      os.environ.get('EXISTENCE_INDEX_FILE', EXISTENCE_INDEX_FILE))
+
   if not cfg.TEST:
     urls = get_health_check_urls()
     libutil.check_backend_ready(urls)
@@ -13,9 +13,20 @@
 # limitations under the License.
 """Helper functions for getting disaster dashboard data for the app config"""
 
+from array import array
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import hashlib
 import json
 import logging
+import os
 import re
+import stat
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
 from google.cloud import storage
 
@@ -26,9 +37,266 @@ EVENT_TYPES = [
     "HeatTemperatureEvent"
 ]
 DISASTER_DATA_FOLDER = "disaster_dashboard/"
+EARTH_DCID = "Earth"
+# Directory for the local snapshots of the processed data, used so that
+# restarts don't need to download and parse every event file again. It must be
+# owned by the server user and not writable by anyone else.
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                    "datacommons", "disaster_dashboard")
+# Bump this when the processed data format changes so old snapshots are ignored.
+_SNAPSHOT_VERSION = 2
+# Held by the one process of a deployment that refreshes from the source.
+_REFRESH_LOCK_FILE = "refresh.lock"
+# How often other processes check whether the snapshot was refreshed.
+SNAPSHOT_CHECK_SECS = 60
+_NAN = float("nan")
+_YEAR_MONTH_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
 
 
-def get_disaster_dashboard_data(gcs_bucket):
+def _event_file_name(event_type: str) -> str:
+  return re.sub('(?!^)([A-Z]+)', r'_\1', event_type).lower() + ".json"
+
+
+class GcsEventSource:
+  """Reads the disaster event files from a GCS bucket.
+
+  A single storage client is shared by all the reads.
+  """
+
+  def __init__(self, gcs_bucket: str):
+    self._bucket = storage.Client().bucket(gcs_bucket)
+    # Identifies the source in the snapshot.
+    self.key = f'gs://{gcs_bucket}'
+
+  def generation(self, file_name: str) -> Optional[int]:
+    """Returns the generation of a file without downloading it, or None if the
+    file does not exist."""
+    blob = self._bucket.get_blob(DISASTER_DATA_FOLDER + file_name)
+    return blob.generation if blob else None
+
+  def read(self, file_name: str) -> Tuple[Optional[bytes], Optional[int]]:
+    """Returns the content and generation of a file, or (None, None) if the file
+    does not exist."""
+    blob = self._bucket.get_blob(DISASTER_DATA_FOLDER + file_name)
+    if not blob:
+      return None, None
+    return blob.download_as_bytes(), blob.generation
+
+
+class LocalEventSource:
+  """Reads the disaster event files from a local directory laid out like the
+  GCS bucket (i.e., with the files under `disaster_dashboard/`).
+
+  The file modification time is used as the generation.
+  """
+
+  def __init__(self, directory: str):
+    self._directory = directory
+    self.key = f'file://{os.path.abspath(directory)}'
+
+  def _path(self, file_name: str) -> str:
+    return os.path.join(self._directory, DISASTER_DATA_FOLDER, file_name)
+
+  def generation(self, file_name: str) -> Optional[int]:
+    try:
+      return os.stat(self._path(file_name)).st_mtime_ns
+    except FileNotFoundError:
+      return None
+
+  def read(self, file_name: str) -> Tuple[Optional[bytes], Optional[int]]:
+    generation = self.generation(file_name)
+    if generation is None:
+      return None, None
+    with open(self._path(file_name), 'rb') as f:
+      return f.read(), generation
+
+
+def _group_events_by_date(events_data: List[Dict]) -> Dict[str, List[Dict]]:
+  events_by_date = {}
+  for event_data in events_data:
+    start_date = event_data.get("startDate", "")
+    if not start_date:
+      continue
+    start_date_year_month = start_date[0:7]
+    if start_date_year_month not in events_by_date:
+      events_by_date[start_date_year_month] = []
+    events_by_date[start_date_year_month].append(event_data)
+  return events_by_date
+
+
+class DisasterDataLoader:
+  """Loads the disaster dashboard data from an event source.
+
+  Event files are downloaded concurrently. The processed data and the
+  generation of every file are saved as JSON to a local snapshot in
+  snapshot_dir, named after the source, which is used on the next load instead
+  of the event source. refresh() only downloads the files whose generation has
+  changed since they were last loaded.
+  """
+
+  def __init__(self, source, snapshot_dir: str = ''):
+    self._source = source
+    self._snapshot_dir = snapshot_dir if _private_dir(snapshot_dir) else ''
+    self._snapshot_path = ''
+    if self._snapshot_dir:
+      name = hashlib.sha256(source.key.encode('utf-8')).hexdigest()[:16]
+      self._snapshot_path = os.path.join(self._snapshot_dir,
+                                         f'snapshot_{name}.json')
+    # Modification time of the snapshot the current data matches.
+    self._snapshot_mtime = None
+    self._snapshot_checked = 0
+    self._refresh_lock_fd = None
+    # Event type -> generation of the file the current data was loaded from.
+    self._generations = {}
+    self.data = {}
+
+  def _fetch(self, event_type: str) -> Tuple[Optional[Dict], Optional[int]]:
+    content, generation = self._source.read(_event_file_name(event_type))
+    if content is None:
+      logging.info(f'file for {event_type} not found, skipping.')
+      return None, None
+    return _group_events_by_date(json.loads(content)), generation
+
+  def _fetch_all(self, event_types: List[str]):
+    """Downloads and processes the files for event_types concurrently, and
+    updates the loaded data with the results."""
+    if not event_types:
+      return
+    with ThreadPoolExecutor(max_workers=len(event_types)) as executor:
+      results = list(executor.map(self._fetch, event_types))
+    data = dict(self.data)
+    for event_type, (events_by_date, generation) in zip(event_types, results):
+      if events_by_date is None:
+        data.pop(event_type, None)
+        self._generations.pop(event_type, None)
+      else:
+        data[event_type] = events_by_date
+        self._generations[event_type] = generation
+    self.data = data
+
+  def _load_snapshot(self) -> bool:
+    if not self._snapshot_path or not os.path.exists(self._snapshot_path):
+      return False
+    try:
+      with open(self._snapshot_path, 'rb') as f:
+        mtime = os.fstat(f.fileno()).st_mtime_ns
+        snapshot = json.load(f)
+      if (snapshot.get('version') != _SNAPSHOT_VERSION or
+          snapshot.get('source') != self._source.key):
+        return False
+      self.data = snapshot['data']
+      self._generations = snapshot['generations']
+      self._snapshot_mtime = mtime
+      return True
+    except Exception as e:
+      logging.warning(
+          f'Could not load disaster data snapshot {self._snapshot_path}: {e}')
+      return False
+
+  def _save_snapshot(self):
+    if not self._snapshot_path:
+      return
+    snapshot = {
+        'version': _SNAPSHOT_VERSION,
+        'source': self._source.key,
+        'data': self.data,
+        'generations': self._generations
+    }
+    try:
+      # Write to a temp file and rename so that concurrent readers (e.g., other
+      # gunicorn workers) never see a partial snapshot.
+      fd, tmp_path = tempfile.mkstemp(dir=self._snapshot_dir)
+      with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+      os.replace(tmp_path, self._snapshot_path)
+      self._snapshot_mtime = os.stat(self._snapshot_path).st_mtime_ns
+    except Exception as e:
+      logging.warning(
+          f'Could not save disaster data snapshot {self._snapshot_path}: {e}')
+
+  def load(self) -> Dict:
+    """Loads the data from the snapshot if there is one, otherwise from the
+    event source. Returns the loaded data."""
+    if self._load_snapshot():
+      logging.info(f'Loaded disaster data snapshot {self._snapshot_path}')
+      return self.data
+    self._fetch_all(EVENT_TYPES)
+    self._save_snapshot()
+    return self.data
+
+  def refresh(self) -> bool:
+    """Reloads the event files that changed since they were last loaded.
+    Returns whether the data changed."""
+    with ThreadPoolExecutor(max_workers=len(EVENT_TYPES)) as executor:
+      generations = list(
+          executor.map(self._source.generation,
+                       [_event_file_name(t) for t in EVENT_TYPES]))
+    changed = [
+        event_type for event_type, generation in zip(EVENT_TYPES, generations)
+        if generation != self._generations.get(event_type)
+    ]
+    if not changed:
+      return False
+    logging.info(f'Refreshing disaster data for: {changed}')
+    self._fetch_all(changed)
+    self._save_snapshot()
+    return True
+
+  def reload_if_changed(self, min_interval_secs: float = 0) -> bool:
+    """Reloads the snapshot if another process has saved a newer one, checking
+    at most once every min_interval_secs. Returns whether the data changed."""
+    if not self._snapshot_path:
+      return False
+    now = time.monotonic()
+    if now - self._snapshot_checked < min_interval_secs:
+      return False
+    self._snapshot_checked = now
+    try:
+      mtime = os.stat(self._snapshot_path).st_mtime_ns
+    except FileNotFoundError:
+      return False
+    if mtime == self._snapshot_mtime:
+      return False
+    return self._load_snapshot()
+
+  def acquire_refresh_lock(self) -> bool:
+    """Returns whether this process is the one to refresh from the source, i.e.,
+    no other process sharing the snapshot directory is refreshing. The lock is
+    held until the process exits."""
+    if not self._snapshot_dir:
+      return True
+    fd = os.open(os.path.join(self._snapshot_dir, _REFRESH_LOCK_FILE),
+                 os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+      os.close(fd)
+      return False
+    # Keep the fd (and the lock) open for the lifetime of the process.
+    self._refresh_lock_fd = fd
+    return True
+
+
+def _private_dir(directory: str) -> bool:
+  """Creates the directory if needed, and returns whether it is owned by the
+  current user and not writable by others, so that its files can be trusted."""
+  if not directory:
+    return False
+  try:
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+  except OSError as e:
+    logging.warning(f'Can not use disaster data snapshot dir {directory}: {e}')
+    return False
+  if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+    logging.warning(f'Not using disaster data snapshot dir {directory}: it '
+                    'must be owned by the server user and not writable by '
+                    'others')
+    return False
+  return True
+
+
+def get_disaster_dashboard_data(gcs_bucket, snapshot_dir=''):
   """
   Gets and processes disaster data from gcs.
   Returns
@@ -54,24 +322,151 @@ def get_disaster_dashboard_data(gcs_bucket):
           ...
       }
   """
-  result = {}
-  for event_type in EVENT_TYPES:
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(gcs_bucket)
-    file_name = re.sub('(?!^)([A-Z]+)', r'_\1', event_type).lower() + ".json"
-    blob = bucket.get_blob(DISASTER_DATA_FOLDER + file_name)
-    if not blob:
-      logging.info(f'file for {event_type} not found, skipping.')
-      continue
-    events_data = json.loads(blob.download_as_bytes())
-    events_by_date = {}
-    for event_data in events_data:
-      start_date = event_data.get("startDate", "")
-      if not start_date:
+  return DisasterDataLoader(GcsEventSource(gcs_bucket), snapshot_dir).load()
+
+
+def _set_app_data(app, data: Dict):
+  app.config['DISASTER_DASHBOARD_INDEX'] = build_disaster_dashboard_index(data)
+  app.config['DISASTER_DASHBOARD_DATA'] = data
+
+
+def start_background_refresh(app, loader: DisasterDataLoader,
+                             interval_secs: int) -> Optional[threading.Event]:
+  """
+  Starts a daemon thread that refreshes the loader right away and then every
+  interval_secs, and swaps any new data and index into the app config.
+
+  Only one process sharing the snapshot directory refreshes from the source:
+  with `gunicorn --preload`, that is the master, otherwise the first worker.
+  The other processes pick up the refreshed snapshot through
+  sync_app_data(). Returns an event that stops the refresh when set, or None if
+  another process is refreshing.
+  """
+  app.config['DISASTER_DASHBOARD_LOADER'] = loader
+  if not loader.acquire_refresh_lock():
+    return None
+  stop = threading.Event()
+
+  def _run():
+    while True:
+      try:
+        if loader.refresh():
+          _set_app_data(app, loader.data)
+      except Exception as e:
+        logging.error(f'Failed to refresh disaster data: {e}')
+      if stop.wait(interval_secs):
+        return
+
+  threading.Thread(target=_run, name='disaster-data-refresh',
+                   daemon=True).start()
+  return stop
+
+
+def sync_app_data(app):
+  """Swaps the data refreshed by another process into the app config, if the
+  snapshot changed since it was last checked."""
+  loader = app.config.get('DISASTER_DASHBOARD_LOADER')
+  if not loader:
+    return
+  try:
+    if loader.reload_if_changed(SNAPSHOT_CHECK_SECS):
+      _set_app_data(app, loader.data)
+  except Exception as e:
+    logging.error(f'Failed to reload disaster data snapshot: {e}')
+
+
+class EventTypeIndex:
+  """Columnar index over the events of a single event type.
+
+  Events are stored sorted by their YYYY-MM start date, so a date range maps to
+  a contiguous slice of positions. Each affected place maps to the sorted list
+  of positions of the events affecting it, and filter prop values are parsed
+  into per-prop float columns the first time a (prop, unit) pair is queried.
+  """
+
+  def __init__(self, events_by_date: Dict[str, List[Dict]]):
+    self.events = []
+    self.dates = []
+    for date in sorted(events_by_date.keys()):
+      # Only YYYY-MM keys can be requested through get_date_list.
+      if not _YEAR_MONTH_RE.match(date):
         continue
-      start_date_year_month = start_date[0:7]
-      if start_date_year_month not in events_by_date:
-        events_by_date[start_date_year_month] = []
-      events_by_date[start_date_year_month].append(event_data)
-    result[event_type] = events_by_date
-  return result
+      for event in events_by_date[date]:
+        self.events.append(event)
+        self.dates.append(date)
+    self.place_postings = {}
+    for pos, event in enumerate(self.events):
+      for place in event.get("affectedPlaces", []):
+        postings = self.place_postings.setdefault(place, array('l'))
+        # An event may list the same place more than once.
+        if not postings or postings[-1] != pos:
+          postings.append(pos)
+    # (prop, unit) -> array of parsed values, NaN where the value is missing or
+    # can not be parsed.
+    self._prop_columns = {}
+
+  def _prop_column(self, prop: str, unit: str) -> array:
+    key = (prop, unit)
+    if key not in self._prop_columns:
+      column = array('d')
+      for event in self.events:
+        val = _NAN
+        if prop in event:
+          try:
+            val = float(event[prop][len(unit):].strip())
+          except:
+            logging.info(
+                f'Could not parse filter value for event: {event.get("eventId")}, filter prop: {prop}'
+            )
+        column.append(val)
+      self._prop_columns[key] = column
+    return self._prop_columns[key]
+
+  def query(
+      self,
+      place: str,
+      min_date: str,
+      max_date: str,
+      filter_prop: str = '',
+      filter_unit: str = '',
+      filter_upper_limit: float = float("inf"),
+      filter_lower_limit: float = -float("inf")
+  ) -> List[Dict]:
+    """Returns the events affecting place with a start month in
+    [min_date, max_date] (both YYYY-MM) and whose filter_prop value lies within
+    the filter limits. Events are returned in start month order.
+    """
+    lo = bisect.bisect_left(self.dates, min_date)
+    hi = bisect.bisect_right(self.dates, max_date)
+    if lo >= hi:
+      return []
+    if place == EARTH_DCID:
+      positions = range(lo, hi)
+    else:
+      postings = self.place_postings.get(place)
+      if not postings:
+        return []
+      start = bisect.bisect_left(postings, lo)
+      end = bisect.bisect_left(postings, hi)
+      positions = postings[start:end]
+    if filter_prop:
+      column = self._prop_column(filter_prop, filter_unit)
+      # NaN comparisons are always False, so unparseable values are dropped.
+      positions = [
+          pos for pos in positions
+          if filter_lower_limit <= column[pos] <= filter_upper_limit
+      ]
+    return [self.events[pos] for pos in positions]
+
+
+def build_disaster_dashboard_index(
+    disaster_data: Dict[str, Dict[str,
+                                  List[Dict]]]) -> Dict[str, EventTypeIndex]:
+  """
+  Builds an EventTypeIndex for every event type in the data returned by
+  get_disaster_dashboard_data.
+  """
+  return {
+      event_type: EventTypeIndex(events_by_date)
+      for event_type, events_by_date in disaster_data.items()
+  }
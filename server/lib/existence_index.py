@@ -0,0 +1,231 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local index of the stat vars with data for places, used to answer existence
+checks without a mixer call.
+
+The index is built offline by tools/existence_index and memory-mapped at
+startup. Stat vars are numbered, and for every indexed place the file has the
+sorted numbers of the stat vars with data for it, along with a flag for the
+ones whose series has a single data point. Checks binary search the numbers
+in the mapped file, so nothing is decoded or cached per place.
+
+The index also records the mixer tables it was built from. It is only used
+while the mixer serves the same tables, since its answers may be stale after
+a data update.
+
+File layout (little-endian):
+  8 bytes   magic
+  uint64    length of the json metadata
+  json      {"mixer_tables": ..., "variables": [sv dcid, ...],
+             "places": {place dcid: [start, count], ...},
+             "num_positions": total count}
+  padding   to a multiple of 4 bytes
+  body      num_positions uint32 stat var numbers, then as many uint8 single
+            data point flags. The ones of a place are at [start, start+count).
+"""
+
+from array import array
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+import server.services.datacommons as dc
+
+_MAGIC = b'DCEXIST2'
+_HEADER = struct.Struct('<8sQ')
+
+# How often to check that the mixer still serves the tables of the index.
+_VERSION_CHECK_SECS = 300
+
+
+class ExistenceIndex:
+
+  def __init__(self, path: str):
+    """
+    Args:
+      path: path of the index file.
+    """
+    with open(path, 'rb') as f:
+      self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, meta_len = _HEADER.unpack_from(self._mm, 0)
+    if magic != _MAGIC:
+      raise ValueError(f'{path} is not an existence index')
+    meta = json.loads(self._mm[_HEADER.size:_HEADER.size + meta_len])
+    self.mixer_tables = meta['mixer_tables']
+    # stat var dcid -> number
+    self._sv_bits = {sv: i for i, sv in enumerate(meta['variables'])}
+    # place dcid -> (start, count) in the body arrays
+    self._places = {p: tuple(v) for p, v in meta['places'].items()}
+    num_positions = meta['num_positions']
+    body_start = _body_start(meta_len)
+    flags_start = body_start + 4 * num_positions
+    view = memoryview(self._mm)
+    if sys.byteorder == 'little':
+      self._positions = view[body_start:flags_start].cast('I')
+    else:
+      self._positions = array('I')
+      self._positions.frombytes(view[body_start:flags_start])
+      self._positions.byteswap()
+    self._flags = view[flags_start:flags_start + num_positions]
+    # Whether the mixer serves the tables of the index, as of _checked_at.
+    self._current = False
+    self._checked_at = None
+    self._lock = threading.Lock()
+
+  def has_place(self, place: str) -> bool:
+    return place in self._places
+
+  def has_variable(self, sv: str) -> bool:
+    return sv in self._sv_bits
+
+  def is_current(self) -> bool:
+    """Returns whether the mixer serves the tables that the index was built
+    from, checking at most every _VERSION_CHECK_SECS."""
+    with self._lock:
+      last_checked_at = self._checked_at
+      if (last_checked_at is not None and
+          time.time() - last_checked_at < _VERSION_CHECK_SECS):
+        return self._current
+      # Claim the check, so that concurrent callers keep using the last result
+      # rather than all fetching the version.
+      self._checked_at = time.time()
+    # Fetch the version without holding the lock, which would block every
+    # other caller on the mixer.
+    try:
+      mixer_tables = dc.version().get('tables')
+    except Exception as e:
+      logging.warning(f'Failed to get the mixer version: {e}')
+      mixer_tables = None
+    current = mixer_tables == self.mixer_tables
+    with self._lock:
+      if not current and (self._current or last_checked_at is None):
+        logging.warning('Not using the existence index, which was built from '
+                        f'mixer tables {self.mixer_tables}, since the mixer '
+                        f'serves {mixer_tables}')
+      self._current = current
+      self._checked_at = time.time()
+    return current
+
+  def _find(self, place: str, bit: int) -> Optional[int]:
+    """Returns the body index of the stat var number `bit` of `place`, or None
+    if the stat var has no data for it."""
+    start, count = self._places[place]
+    i = bisect.bisect_left(self._positions, bit, start, start + count)
+    if i < start + count and self._positions[i] == bit:
+      return i
+    return None
+
+  def split(self, variables: List[str],
+            places: List[str]) -> Tuple[List[str], List[str]]:
+    """Returns the variables and places whose existence can not be answered
+    by the index, and so need a mixer call: all variables for the places that
+    are not indexed, and all places for the variables that are not indexed."""
+    other_vars = [v for v in variables if v not in self._sv_bits]
+    other_places = [p for p in places if p not in self._places]
+    return (variables if other_places else other_vars,
+            places if other_vars else other_places)
+
+  def existence(self, variables: List[str],
+                places: List[str]) -> Dict[str, Dict[str, bool]]:
+    """Returns whether each indexed variable has data for each indexed place,
+    in the format of fetch.observation_existence()."""
+    result = {}
+    places = [p for p in places if p in self._places]
+    for sv in variables:
+      bit = self._sv_bits.get(sv)
+      if bit is None:
+        continue
+      result[sv] = {p: self._find(p, bit) is not None for p in places}
+    return result
+
+  def single_point(self, variables: List[str],
+                   places: List[str]) -> Dict[str, Dict[str, bool]]:
+    """Returns whether the series of each indexed variable and place has a
+    single data point, for the pairs with data."""
+    result = {}
+    places = [p for p in places if p in self._places]
+    for sv in variables:
+      bit = self._sv_bits.get(sv)
+      if bit is None:
+        continue
+      for p in places:
+        i = self._find(p, bit)
+        if i is not None:
+          result.setdefault(sv, {})[p] = bool(self._flags[i])
+    return result
+
+
+def _body_start(meta_len: int) -> int:
+  # The body is aligned, to read the stat var numbers from the mapped file.
+  end = _HEADER.size + meta_len
+  return end + (-end % 4)
+
+
+def write(path: str, place_data: Dict[str, Dict[str, bool]],
+          mixer_tables: List[str]):
+  """Writes an index file, given place dcid to the stat vars with data for
+  it, each mapped to whether its series has a single data point, and the
+  mixer tables the data is from."""
+  variables = sorted(set(sv for svs in place_data.values() for sv in svs))
+  sv_bits = {sv: i for i, sv in enumerate(variables)}
+  places = {}
+  positions = array('I')
+  flags = bytearray()
+  for place in sorted(place_data):
+    svs = sorted(place_data[place], key=lambda sv: sv_bits[sv])
+    places[place] = [len(positions), len(svs)]
+    positions.extend(sv_bits[sv] for sv in svs)
+    flags += bytes(1 if place_data[place][sv] else 0 for sv in svs)
+  if sys.byteorder != 'little':
+    positions.byteswap()
+  meta = json.dumps({
+      'mixer_tables': mixer_tables,
+      'variables': variables,
+      'places': places,
+      'num_positions': len(positions),
+  }).encode()
+  with open(path, 'wb') as f:
+    f.write(_HEADER.pack(_MAGIC, len(meta)))
+    f.write(meta)
+    f.write(bytes(_body_start(len(meta)) - _HEADER.size - len(meta)))
+    f.write(positions.tobytes())
+    f.write(flags)
+
+
+def load(path: str) -> Optional[ExistenceIndex]:
+  """Loads the existence index at path, or returns None if there is none."""
+  if not path or not os.path.isfile(path):
+    return None
+  index = ExistenceIndex(path)
+  logging.info(f'Loaded existence index with {len(index._places)} places and '
+               f'{len(index._sv_bits)} stat vars')
+  return index
+
+
+def current() -> Optional[ExistenceIndex]:
+  """Returns the existence index of the app, if there is one and the mixer
+  serves the tables it was built from."""
+  index = current_app.config.get('EXISTENCE_INDEX')
+  if index and index.is_current():
+    return index
+  return None
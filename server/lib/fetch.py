@@ -19,6 +19,7 @@ import copy
 import re
 from typing import Dict, List
 
+from server.lib import existence_index
 import server.services.datacommons as dc
 
 COMPLEX_UNIT_REGEX = r'\[.+ [0-9]+\]'
@@ -313,10 +314,19 @@ def observation_existence(variables, entities):
     result[var] = {}
     for e in entities:
       result[var][e] = False
+  # Answer what we can from the local existence index, and fetch the rest.
+  mixer_vars, mixer_entities = variables, entities
+  index = existence_index.current()
+  if index:
+    mixer_vars, mixer_entities = index.split(variables, entities)
+    for var, entity_exists in index.existence(variables, entities).items():
+      result[var].update(entity_exists)
+  if not mixer_vars or not mixer_entities:
+    return result
   # Fetch existence check data
   resp = dc.v2observation(select=['variable', 'entity'],
-                          entity={'dcids': entities},
-                          variable={'dcids': variables})
+                          entity={'dcids': mixer_entities},
+                          variable={'dcids': mixer_vars})
   for var, entity_obs in resp.get('byVariable', {}).items():
     for e in entity_obs.get('byEntity', {}):
       result[var][e] = True
@@ -382,6 +392,32 @@ def property_values(nodes, prop, out=True, constraints=''):
   return result
 
 
+def multiple_property_values(nodes, props, out=True):
+  """Returns compact property values for several properties with a single REST
+  API call.
+
+  The response is the following format:
+  {
+    <node_dcid>: {
+      <prop>: [value list]
+    }
+  }
+  """
+  resp = dc.v2node(nodes, '{}[{}]'.format('->' if out else '<-',
+                                          ', '.join(props)))
+  result = {}
+  for node, node_arcs in resp.get('data', {}).items():
+    result[node] = {}
+    for prop in props:
+      result[node][prop] = []
+      for v in node_arcs.get('arcs', {}).get(prop, {}).get('nodes', []):
+        if 'dcid' in v:
+          result[node][prop].append(v['dcid'])
+        elif 'value' in v:
+          result[node][prop].append(v['value'])
+  return result
+
+
 def raw_property_values(nodes, prop, out=True, constraints=''):
   """Returns full property values data out of REST API response.
 
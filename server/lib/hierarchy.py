@@ -0,0 +1,173 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory caches of node hierarchies (e.g., diseases, stat vars) used to
+resolve the ancestor path of a node without a round-trip per level."""
+
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from server.lib import fetch
+import server.services.datacommons as dc
+
+# Maximum number of nodes to keep parent pointers for. The cache is reset when
+# it grows past this.
+DEFAULT_MAX_NODES = 200000
+# Maximum age of the cache, so that hierarchy changes in new mixer releases are
+# picked up. The cache is reset when it gets older than this.
+DEFAULT_TTL_SECS = 3600 * 24
+# Parent pointer of nodes that have no parent.
+_NO_PARENT = ''
+
+
+class Hierarchy:
+  """Parent pointers and names of the nodes of a hierarchy.
+
+  Each node points to its first parent. Ancestor paths are resolved by walking
+  the cached pointers; nodes whose parent is not cached yet are fetched
+  together with their names, one request for the whole frontier per round.
+  """
+
+  def __init__(self,
+               parent_prop: str = '',
+               max_nodes: int = DEFAULT_MAX_NODES,
+               ttl_secs: float = DEFAULT_TTL_SECS):
+    """
+    Args:
+      parent_prop: property from a node to its parent, used to fetch missing
+        parents in ancestors(). Can be empty for hierarchies that are only
+        filled with add_path().
+      max_nodes: maximum number of nodes to cache.
+      ttl_secs: maximum age of the cache in seconds.
+    """
+    self._parent_prop = parent_prop
+    self._max_nodes = max_nodes
+    self._ttl_secs = ttl_secs
+    self._lock = threading.Lock()
+    # node dcid -> parent dcid, or _NO_PARENT
+    self._parents = {}
+    # node dcid -> name
+    self._names = {}
+    # When the cache was last reset, from time.monotonic().
+    self._reset_time = time.monotonic()
+
+  def add_path(self, path: List[str]):
+    """Records a path that goes from a node to the root of the hierarchy.
+
+    Nodes can have several parents, so a node that already has a parent keeps
+    it; this keeps the paths already cached through that node unchanged.
+    """
+    with self._lock:
+      self._maybe_reset(len(path))
+      for child, parent in zip(path, path[1:]):
+        self._parents.setdefault(child, parent)
+      if path:
+        self._parents.setdefault(path[-1], _NO_PARENT)
+
+  def _maybe_reset(self, num_new_nodes: int = 0):
+    now = time.monotonic()
+    if (len(self._parents) + num_new_nodes > self._max_nodes or
+        now - self._reset_time > self._ttl_secs):
+      self._parents = {}
+      self._names = {}
+      self._reset_time = now
+
+  def _walk(self, dcid: str, stop_dcid: str) -> Tuple[List[str], str]:
+    """Walks the cached parent pointers up from dcid until stop_dcid or a node
+    without a parent.
+
+    Returns the ancestors of dcid that were found, and the node whose parent is
+    not cached yet (empty if the walk is complete).
+    """
+    path = []
+    seen = set([dcid])
+    curr = dcid
+    while curr != stop_dcid:
+      parent = self._parents.get(curr)
+      if parent is None:
+        return path, curr
+      # Stop at the root, and guard against cycles in the data.
+      if parent == _NO_PARENT or parent in seen:
+        break
+      path.append(parent)
+      seen.add(parent)
+      curr = parent
+    return path, ''
+
+  def cached_path(self, dcid: str, stop_dcid: str = '') -> Optional[List[str]]:
+    """Returns the cached path from dcid up to stop_dcid (or the root),
+    excluding dcid, or None if part of the path is not cached."""
+    with self._lock:
+      self._maybe_reset()
+      path, missing = self._walk(dcid, stop_dcid)
+    return None if missing else path
+
+  def _fetch(self, dcids: Set[str], with_parent: Set[str]):
+    """Fetches the names of dcids, and the parents of with_parent."""
+    values = fetch.multiple_property_values(list(dcids),
+                                            [self._parent_prop, 'name'])
+    with self._lock:
+      self._maybe_reset(len(dcids))
+      for dcid in dcids:
+        node_values = values.get(dcid, {})
+        names = node_values.get('name', [])
+        self._names[dcid] = names[0] if names else dcid
+        if dcid in with_parent:
+          parents = node_values.get(self._parent_prop, [])
+          self._parents[dcid] = parents[0] if parents else _NO_PARENT
+
+  def ancestors(self,
+                dcids: List[str],
+                stop_dcid: str = '') -> Dict[str, List[Tuple[str, str]]]:
+    """Returns the path from each node up to stop_dcid (or the root), as a dict
+    of node dcid to a list of (ancestor dcid, ancestor name), nearest ancestor
+    first. The node itself is not included.
+    """
+    while True:
+      paths = {}
+      missing_parents = set()
+      missing_names = set()
+      with self._lock:
+        self._maybe_reset()
+        for dcid in dcids:
+          path, missing = self._walk(dcid, stop_dcid)
+          paths[dcid] = path
+          if missing:
+            missing_parents.add(missing)
+          missing_names.update(a for a in path if a not in self._names)
+      if not missing_parents and not missing_names:
+        break
+      self._fetch(missing_parents | missing_names, missing_parents)
+    with self._lock:
+      return {
+          dcid: [(a, self._names.get(a, a)) for a in path]
+          for dcid, path in paths.items()
+      }
+
+
+# Diseases, where a disease points to its parent through specializationOf.
+DISEASES = Hierarchy('specializationOf')
+# The stat var hierarchy. Paths are computed by the mixer, and every path it
+# returns is cached, so the paths of all the ancestors are known too.
+VARIABLES = Hierarchy()
+
+
+def variable_ancestors(dcid: str) -> List[str]:
+  """Returns the path of a stat var to the root of the stat var hierarchy
+  (excluding the stat var itself)."""
+  path = VARIABLES.cached_path(dcid)
+  if path is None:
+    path = dc.get_variable_ancestors(dcid)
+    VARIABLES.add_path([dcid] + path)
+  return path
@@ -20,6 +20,7 @@ import random
 import time
 from typing import Any, Dict, List, Set
 
+from server.lib import existence_index
 import server.lib.fetch as fetch
 import server.lib.nl.common.constants as constants
 import server.lib.nl.common.counters as ctr
@@ -114,22 +115,33 @@ def sv_existence_for_places_check_single_point(
     return {}, {}
 
   start = time.time()
-  series_facet = fetch.series_facet(entities=places,
-                                    variables=svs,
-                                    all_facets=False)
+  # Answer what we can from the local existence index, and fetch the rest.
+  sv2place_single_point = {}
+  mixer_svs, mixer_places = svs, places
+  index = existence_index.current()
+  if index:
+    mixer_svs, mixer_places = index.split(svs, places)
+    sv2place_single_point = index.single_point(svs, places)
+  if mixer_svs and mixer_places:
+    series_facet = fetch.series_facet(entities=mixer_places,
+                                      variables=mixer_svs,
+                                      all_facets=False)
+    for sv, sv_data in series_facet.get('data', {}).items():
+      for pl, place_data in sv_data.items():
+        if not place_data.get('series'):
+          continue
+        num_series = place_data['series'][0]["value"]
+        sv2place_single_point.setdefault(sv, {})[pl] = (num_series == 1)
   counters.timeit('sv_existence_for_places_check_single_point', start)
 
   existing_svs = {}
   existsv2places = {}
-  for sv, sv_data in series_facet.get('data', {}).items():
-    for pl, place_data in sv_data.items():
-      if not place_data.get('series'):
-        continue
-      num_series = place_data['series'][0]["value"]
-      existing_svs[sv] = existing_svs.get(sv, False) | (num_series == 1)
+  for sv, place_single_point in sv2place_single_point.items():
+    for pl, single_point in place_single_point.items():
+      existing_svs[sv] = existing_svs.get(sv, False) | single_point
       if sv not in existsv2places:
         existsv2places[sv] = {}
-      existsv2places[sv][pl] = (num_series == 1)
+      existsv2places[sv][pl] = single_point
   return existing_svs, existsv2places
 
 
@@ -13,10 +13,13 @@
 # limitations under the License.
 """Router for detection."""
 
+import hashlib
+import json
 from typing import Dict, List
 
 from flask import current_app
 
+from server.cache import cache
 from server.lib.nl.common import serialize
 from server.lib.nl.common import utils
 from server.lib.nl.common.counters import Counters
@@ -33,6 +36,7 @@ from server.lib.nl.detection.types import PlaceDetection
 from server.lib.nl.detection.types import PlaceDetectorType
 from server.lib.nl.detection.types import RequestedDetectorType
 from server.lib.nl.detection.utils import get_multi_sv
+import server.lib.nl.fulfillment.utils as futils
 import shared.lib.detected_variables as dutils
 
 _PALM_API_DETECTORS = [
@@ -43,6 +47,12 @@ _PALM_API_DETECTORS = [
 
 MAX_CHILD_LIMIT = 50
 
+# Detections are cached for an hour, so that updates to the NL server's
+# embeddings indices are picked up soon after.
+DETECTION_CACHE_TIMEOUT = 3600
+
+_DETECTION_CACHE_PREFIX = 'nl_detection:'
+
 
 #
 # The main function that routes across Heuristic and LLM detectors.
@@ -56,6 +66,67 @@ def detect(detector_type: str, place_detector_type: PlaceDetectorType,
            query_detection_debug_logs: Dict,
            counters: Counters) -> types.Detection:
   #
+  # Repeated queries (sample queries, shared links, etc.) are served from the
+  # detection cache.  A detection of None (i.e., blocked) is cached too.
+  #
+  key = _detection_cache_key(detector_type, place_detector_type, original_query,
+                             prev_utterance, embeddings_index_type,
+                             llm_api_type)
+  cached = cache.get(key)
+  if cached:
+    detection, debug_logs = cached
+    counters.info('info_detection_cache_hit', 1)
+    query_detection_debug_logs.update(debug_logs)
+    return detection
+
+  debug_logs = {}
+  detection = _detect(detector_type, place_detector_type, original_query,
+                      no_punct_query, prev_utterance, embeddings_index_type,
+                      llm_api_type, debug_logs, counters)
+  query_detection_debug_logs.update(debug_logs)
+
+  # Don't cache the result of a failed LLM call, it could be transient.
+  if not any(c.startswith('failed_palm_api') for c in counters.get()['ERROR']):
+    cache.set(key, (detection, debug_logs), timeout=DETECTION_CACHE_TIMEOUT)
+  return detection
+
+
+#
+# Returns the detection cache key for the query and the parts of the
+# context that detection depends on.
+#
+def _detection_cache_key(detector_type: str,
+                         place_detector_type: PlaceDetectorType,
+                         original_query: str, prev_utterance: Utterance,
+                         embeddings_index_type: str,
+                         llm_api_type: LlmApiType) -> str:
+  # Heuristic detection doesn't look at the context.  LLM detection
+  # passes the queries and LLM responses of the context as history, and the
+  # LLM fallback checks for places and SVs in the context.
+  context = []
+  if detector_type != RequestedDetectorType.Heuristic.value:
+    u = prev_utterance
+    while u:
+      context.append((u.query, u.llm_resp))
+      u = u.prev_utterance
+    context.append(
+        (futils.has_sv(prev_utterance), futils.has_place(prev_utterance)))
+  parts = [
+      ' '.join(original_query.split()), detector_type,
+      str(place_detector_type), embeddings_index_type,
+      str(llm_api_type), context
+  ]
+  digest = hashlib.sha256(
+      json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+  return _DETECTION_CACHE_PREFIX + digest.hexdigest()
+
+
+def _detect(detector_type: str, place_detector_type: PlaceDetectorType,
+            original_query: str, no_punct_query: str, prev_utterance: Utterance,
+            embeddings_index_type: str, llm_api_type: LlmApiType,
+            query_detection_debug_logs: Dict,
+            counters: Counters) -> types.Detection:
+  #
   # In the absence of the PALM API key, fallback to heuristic.
   #
   if (detector_type in _PALM_API_DETECTORS and
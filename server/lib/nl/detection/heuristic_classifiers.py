@@ -39,6 +39,10 @@ from server.lib.nl.detection.types import SuperlativeType
 from server.lib.nl.detection.types import TimeDeltaClassificationAttributes
 from server.lib.nl.detection.types import TimeDeltaType
 import shared.lib.constants as constants
+from shared.lib.trigger_matcher import TriggerMatcher
+
+# Built once, with the trigger patterns of all the classifiers compiled.
+_TRIGGERS = TriggerMatcher(constants.QUERY_CLASSIFICATION_HEURISTICS)
 
 
 # TODO (juliawu): This function shares a lot of structure with the ranking
@@ -69,22 +73,12 @@ def event(query) -> Union[NLClassifier, None]:
       "ExtremeHeat": EventType.HEAT,
       "WetBulb": EventType.WETBULB,
   }
-  event_heuristics = constants.QUERY_CLASSIFICATION_HEURISTICS["Event"]
-  event_subtypes = event_heuristics.keys()
-
   event_types = []
   all_trigger_words = []
 
-  for subtype in event_subtypes:
-    subtype_trigger_words = []
-
-    for keyword in event_heuristics[subtype]:
-      # look for keyword surrounded by spaces or start/end delimiters
-      regex = r"(^|\W)" + keyword + r"($|\W)"
-      subtype_trigger_words += [w.group() for w in re.finditer(regex, query)]
-
-    if len(subtype_trigger_words) > 0:
-      event_types.append(subtype_map[subtype])
+  for subtype, subtype_trigger_words in _TRIGGERS.matches("Event",
+                                                          query).items():
+    event_types.append(subtype_map[subtype])
     all_trigger_words += subtype_trigger_words
 
   # If no matches, this query is not an event query
@@ -121,16 +115,9 @@ def ranking(query) -> Union[NLClassifier, None]:
   ranking_types = []
   all_trigger_words = []
 
-  for subtype in constants.QUERY_CLASSIFICATION_HEURISTICS["Ranking"].keys():
-    type_trigger_words = []
-
-    for keyword in constants.QUERY_CLASSIFICATION_HEURISTICS["Ranking"][
-        subtype]:
-      regex = r"(^|\W)" + keyword + r"($|\W)"
-      type_trigger_words += [w.group() for w in re.finditer(regex, query)]
-
-    if len(type_trigger_words) > 0:
-      ranking_types.append(subtype_map[subtype])
+  for subtype, type_trigger_words in _TRIGGERS.matches("Ranking",
+                                                       query).items():
+    ranking_types.append(subtype_map[subtype])
     all_trigger_words += type_trigger_words
 
   # If no matches, this query is not a ranking query
@@ -160,21 +147,12 @@ def time_delta(query: str) -> Union[NLClassifier, None]:
       "Decrease": TimeDeltaType.DECREASE,
       "Change": TimeDeltaType.CHANGE,
   }
-  time_delta_heuristics = constants.QUERY_CLASSIFICATION_HEURISTICS["TimeDelta"]
-  time_delta_subtypes = time_delta_heuristics.keys()
   query = query.lower()
   subtypes_matched = []
   trigger_words = []
-  for subtype in time_delta_subtypes:
-    type_trigger_words = []
-
-    for keyword in time_delta_heuristics[subtype]:
-      # look for keyword surrounded by spaces or start/end delimiters
-      regex = r"(^|\W)" + keyword + r"($|\W)"
-      type_trigger_words += [w.group() for w in re.finditer(regex, query)]
-
-    if len(type_trigger_words) > 0:
-      subtypes_matched.append(subtype_map[subtype])
+  for subtype, type_trigger_words in _TRIGGERS.matches("TimeDelta",
+                                                       query).items():
+    subtypes_matched.append(subtype_map[subtype])
     trigger_words += type_trigger_words
 
   # If no matches, this query is not a time-delta query
@@ -206,22 +184,12 @@ def superlative_type(query: str) -> Union[NLClassifier, None]:
       "Poor": SuperlativeType.POOR,
       "List": SuperlativeType.LIST
   }
-  superlative_heuristics = constants.QUERY_CLASSIFICATION_HEURISTICS[
-      "Superlative"]
-  superlative_subtypes = superlative_heuristics.keys()
   query = query.lower()
   subtypes_matched = []
   trigger_words = []
-  for subtype in superlative_subtypes:
-    type_trigger_words = []
-
-    for keyword in superlative_heuristics[subtype]:
-      # look for keyword surrounded by spaces or start/end delimiters
-      regex = r"(^|\W)" + keyword + r"($|\W)"
-      type_trigger_words += [w.group() for w in re.finditer(regex, query)]
-
-    if len(type_trigger_words) > 0:
-      subtypes_matched.append(subtype_map[subtype])
+  for subtype, type_trigger_words in _TRIGGERS.matches("Superlative",
+                                                       query).items():
+    subtypes_matched.append(subtype_map[subtype])
     trigger_words += type_trigger_words
 
   # If no matches, this query is not a size-type query
@@ -237,13 +205,7 @@ def superlative_type(query: str) -> Union[NLClassifier, None]:
 def comparison(query) -> Union[NLClassifier, None]:
   # make query lowercase for string matching
   query = query.lower()
-  comparison_heuristics = constants.QUERY_CLASSIFICATION_HEURISTICS[
-      "Comparison"]
-  trigger_words = []
-  for keyword in comparison_heuristics:
-    # look for keyword surrounded by spaces or start/end delimiters
-    regex = r"(^|\W)" + keyword + r"($|\W)"
-    trigger_words += [w.group() for w in re.finditer(regex, query)]
+  trigger_words = _TRIGGERS.trigger_words("Comparison", query)
 
   # If no matches, this query is not a comparison query
   if not trigger_words:
@@ -259,12 +221,7 @@ def general(query: str, subtype: ClassificationType,
   """Heuristic-based classifier for general pattern to type."""
   # make query lowercase for string matching
   query = query.lower()
-  heuristics = constants.QUERY_CLASSIFICATION_HEURISTICS[subtype_name]
-  trigger_words = []
-  for keyword in heuristics:
-    # look for keyword surrounded by spaces or start/end delimiters
-    regex = r"(^|\W)" + keyword + r"($|\W)"
-    trigger_words += [w.group() for w in re.finditer(regex, query)]
+  trigger_words = _TRIGGERS.trigger_words(subtype_name, query)
 
   # If no matches, this query is not an overview query
   if not trigger_words:
@@ -351,10 +308,7 @@ def correlation(query: str) -> Union[NLClassifier, None]:
     NLClassifier with CorrelationClassificationAttributes
   """
   query = query.lower()
-  matches = []
-  for keyword in constants.QUERY_CLASSIFICATION_HEURISTICS["Correlation"]:
-    regex = r"(?:^|\W)" + keyword + r"(?:$|\W)"
-    matches += [w.group() for w in re.finditer(regex, query)]
+  matches = _TRIGGERS.trigger_words("Correlation", query)
   if len(matches) == 0:
     return None
   attributes = CorrelationClassificationAttributes(
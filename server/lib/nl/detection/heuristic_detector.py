@@ -13,8 +13,13 @@
 # limitations under the License.
 """Heuristics based detector"""
 
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Dict
+import time
+from typing import Dict, List
+
+from flask import current_app
 
 import server.lib.nl.common.counters as ctr
 from server.lib.nl.detection import heuristic_classifiers
@@ -27,34 +32,127 @@ from server.lib.nl.detection.types import Detection
 from server.lib.nl.detection.types import NLClassifier
 from server.lib.nl.detection.types import PlaceDetectorType
 from server.lib.nl.detection.types import SimpleClassificationAttributes
+from shared.lib import utils as shared_utils
+
+# Runs SV detection and classification speculatively, while places are
+# detected. Shared by all requests.
+_SPECULATION_EXECUTOR = ThreadPoolExecutor(max_workers=16)
 
 
 def detect(place_detector_type: PlaceDetectorType, orig_query: str,
            cleaned_query: str, index_type: str,
            query_detection_debug_logs: Dict,
            counters: ctr.Counters) -> Detection:
+  # SV detection and classification use the query with places removed, which
+  # is only known after place detection. So speculate that no places will be
+  # removed and start both on that query while places are detected. The
+  # speculative results are used if the guess turns out right, otherwise only
+  # the step that depends on the query is redone.
+  speculative_query = _query_without_places(place_detector_type, orig_query,
+                                            cleaned_query)
+  app = current_app._get_current_object()
+  speculation_start = time.time()
+  speculative_svs_debug_logs = {}
+  speculative_svs = _SPECULATION_EXECUTOR.submit(_detect_svs, app,
+                                                 speculative_query, index_type,
+                                                 speculative_svs_debug_logs)
+  speculative_counters = ctr.Counters()
+  speculative_classifications = _SPECULATION_EXECUTOR.submit(
+      _classify, speculative_query, speculative_counters)
+
+  start = time.time()
   if place_detector_type == PlaceDetectorType.DC:
     place_detection = place.detect_from_query_dc(orig_query,
                                                  query_detection_debug_logs)
   else:
     place_detection = place.detect_from_query_ner(cleaned_query, orig_query,
                                                   query_detection_debug_logs)
+  counters.timeit('heuristic_detector_place_detection', start)
 
   query = place_detection.query_without_place_substr
+  speculation_hit = query == speculative_query
+  counters.info(
+      'heuristic_detector_speculation_hits'
+      if speculation_hit else 'heuristic_detector_speculation_misses', 1)
+  if not speculation_hit:
+    _cancel_speculation(
+        {
+            'sv_detection': speculative_svs,
+            'classification': speculative_classifications,
+        }, speculation_start, counters)
 
   # Step 3: Identify the SV matched based on the query.
-  svs_scores_dict = dutils.empty_svs_score_dict()
-  try:
-    svs_scores_dict = variable.detect_svs(
-        query, index_type, query_detection_debug_logs["query_transformations"])
-  except ValueError as e:
-    logging.info(e)
-    logging.info("Using an empty svs_scores_dict")
+  start = time.time()
+  sv_debug_logs = query_detection_debug_logs["query_transformations"]
+  if speculation_hit:
+    svs_scores_dict = speculative_svs.result()
+    sv_debug_logs.update(speculative_svs_debug_logs)
+  else:
+    svs_scores_dict = _detect_svs(app, query, index_type, sv_debug_logs)
+  counters.timeit('heuristic_detector_sv_detection', start)
 
   # Set the SVDetection.
   sv_detection = dutils.create_sv_detection(query, svs_scores_dict)
 
   # Step 4: find query classifiers.
+  start = time.time()
+  if speculation_hit:
+    classifications = speculative_classifications.result()
+    _merge_counters(speculative_counters, counters)
+  else:
+    classifications = _classify(query, counters)
+  counters.timeit('heuristic_detector_classification', start)
+
+  return Detection(original_query=orig_query,
+                   cleaned_query=cleaned_query,
+                   places_detected=place_detection,
+                   svs_detected=sv_detection,
+                   classifications=classifications,
+                   detector=ActualDetectorType.Heuristic,
+                   place_detector=place_detector_type)
+
+
+#
+# Returns what the query would be after place detection, if no places are
+# found in it.
+#
+def _query_without_places(place_detector_type: PlaceDetectorType,
+                          orig_query: str, cleaned_query: str) -> str:
+  if place_detector_type == PlaceDetectorType.DC:
+    # The query is rebuilt from the spans of the recognized query.
+    return ' '.join(
+        shared_utils.remove_punctuations(orig_query,
+                                         include_comma=True).lower().split())
+  return cleaned_query
+
+
+#
+# Cancels the speculative steps that haven't started. The others can't be
+# stopped, so the time they've had is accounted as wasted.
+#
+def _cancel_speculation(futures: Dict[str, Future], start: float,
+                        counters: ctr.Counters):
+  for step, future in futures.items():
+    if future.cancel():
+      counters.info(f'heuristic_detector_speculative_{step}_cancelled', 1)
+    else:
+      counters.info(f'heuristic_detector_speculative_{step}_wasted', 1)
+      counters.timeit(f'heuristic_detector_speculative_{step}_wasted', start)
+
+
+def _detect_svs(app, query: str, index_type: str, debug_logs: Dict) -> Dict:
+  # Also run from the speculation threads, which need the app context for the
+  # NL server calls.
+  with app.app_context():
+    try:
+      return variable.detect_svs(query, index_type, debug_logs)
+    except ValueError as e:
+      logging.info(e)
+      logging.info("Using an empty svs_scores_dict")
+      return dutils.empty_svs_score_dict()
+
+
+def _classify(query: str, counters: ctr.Counters) -> List[NLClassifier]:
   classifications = [
       heuristic_classifiers.ranking(query),
       heuristic_classifiers.comparison(query),
@@ -81,11 +179,23 @@ def detect(place_detector_type: PlaceDetectorType, orig_query: str,
     classifications.append(
         NLClassifier(type=ClassificationType.UNKNOWN,
                      attributes=SimpleClassificationAttributes()))
+  return classifications
 
-  return Detection(original_query=orig_query,
-                   cleaned_query=cleaned_query,
-                   places_detected=place_detection,
-                   svs_detected=sv_detection,
-                   classifications=classifications,
-                   detector=ActualDetectorType.Heuristic,
-                   place_detector=place_detector_type)
+
+#
+# Adds the counters from a speculative run, that turned out to be used, to
+# `counters`.
+#
+def _merge_counters(src: ctr.Counters, counters: ctr.Counters):
+  result = src.get()
+  for counter, values in result['INFO'].items():
+    for v in _counter_values(values):
+      counters.info(counter, v)
+  for counter, values in result['ERROR'].items():
+    for v in _counter_values(values):
+      counters.err(counter, v)
+
+
+def _counter_values(values) -> List:
+  # List counters have one value per update, numeric counters are their sum.
+  return values if isinstance(values, list) else [values]
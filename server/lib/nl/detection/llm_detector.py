@@ -14,10 +14,16 @@
 """LLM based detector."""
 
 import copy
+import functools
+import hashlib
+import json
 import logging
 import sys
 from typing import Dict, List
 
+from flask import current_app
+
+from server.cache import cache
 from server.lib.nl.common import counters
 from server.lib.nl.common import serialize
 from server.lib.nl.common import utterance
@@ -97,14 +103,27 @@ _LLM_OP_TO_QUANTITY_OP = {
     'LESSER_THAN_OR_EQUAL': types.QCmpType.LE,
 }
 
+# LLM responses are cached for a day.  The cache key includes the prompt, so
+# prompt changes take effect right away.
+LLM_CACHE_TIMEOUT = 3600 * 24
+
+# The safety check verdicts and the detection responses are cached under
+# separate keys, so that a safety check doesn't need the full response.
+_SAFETY_CACHE_PREFIX = 'nl_llm_safety:'
+_DETECTION_CACHE_PREFIX = 'nl_llm_detection:'
+
 
 # Returns False if the query fails safety check.
 def check_safety(query: str, llm_api_type: LlmApiType,
-                 ctr: counters.Counters) -> Detection:
-  if llm_api_type == LlmApiType.Text:
-    llm_resp = palm_api.detect_via_text(query, [], ctr)
-  else:
-    llm_resp = palm_api.detect_via_chat(query, [], ctr)
+                 ctr: counters.Counters) -> bool:
+  key = _llm_cache_key(_SAFETY_CACHE_PREFIX, query, [], llm_api_type)
+  is_safe = cache.get(key)
+  if is_safe is not None:
+    ctr.info('info_llm_safety_cache_hit', 1)
+    return is_safe
+
+  llm_resp = _call_llm(query, [], llm_api_type, ctr)
+  _cache_llm_resp(query, [], llm_api_type, llm_resp)
   if llm_resp.get('UNSAFE') == True:
     return False
   return True
@@ -120,10 +139,13 @@ def detect(query: str, prev_utterance: utterance.Utterance, index_type: str,
     history.append((u.query, u.llm_resp))
     u = u.prev_utterance
 
-  if llm_api_type == LlmApiType.Text:
-    llm_resp = palm_api.detect_via_text(query, history, ctr)
+  key = _llm_cache_key(_DETECTION_CACHE_PREFIX, query, history, llm_api_type)
+  llm_resp = cache.get(key)
+  if llm_resp:
+    ctr.info('info_llm_detection_cache_hit', 1)
   else:
-    llm_resp = palm_api.detect_via_chat(query, history, ctr)
+    llm_resp = _call_llm(query, history, llm_api_type, ctr)
+    _cache_llm_resp(query, history, llm_api_type, llm_resp)
 
   if llm_resp.get('UNSAFE') == True:
     return None
@@ -160,10 +182,9 @@ def detect(query: str, prev_utterance: utterance.Utterance, index_type: str,
 
   # SV Detection.
   svs_score_dicts = []
-  dummy_dict = {}
-  for sv in sv_list:
+  if sv_list:
     try:
-      svs_score_dicts.append(variable.detect_svs(sv, index_type, dummy_dict))
+      svs_score_dicts = variable.detect_svs_many(sv_list, index_type)
     except ValueError as e:
       logging.info(e)
   svs_scores_dict = _merge_sv_dicts(sv_list, svs_score_dicts)
@@ -181,6 +202,54 @@ def detect(query: str, prev_utterance: utterance.Utterance, index_type: str,
                    llm_api=llm_api_type)
 
 
+def _call_llm(query: str, history: List, llm_api_type: LlmApiType,
+              ctr: counters.Counters) -> Dict:
+  if llm_api_type == LlmApiType.Text:
+    return palm_api.detect_via_text(query, history, ctr)
+  return palm_api.detect_via_chat(query, history, ctr)
+
+
+#
+# Caches the LLM response for the query and history.  Without history, the
+# request is the same for the safety check and detection, so the response
+# answers both.  Failed calls (with an empty response) are not cached.
+#
+def _cache_llm_resp(query: str, history: List, llm_api_type: LlmApiType,
+                    llm_resp: Dict):
+  if not llm_resp:
+    return
+  cache.set(_llm_cache_key(_DETECTION_CACHE_PREFIX, query, history,
+                           llm_api_type),
+            llm_resp,
+            timeout=LLM_CACHE_TIMEOUT)
+  if not history:
+    cache.set(_llm_cache_key(_SAFETY_CACHE_PREFIX, query, history,
+                             llm_api_type),
+              llm_resp.get('UNSAFE') != True,
+              timeout=LLM_CACHE_TIMEOUT)
+
+
+def _llm_cache_key(prefix: str, query: str, history: List,
+                   llm_api_type: LlmApiType) -> str:
+  prompts = current_app.config['PALM_PROMPT_TEXT']
+  if llm_api_type == LlmApiType.Text:
+    prompt = prompts.detection_text
+  else:
+    prompt = prompts.detection_chat
+  parts = [
+      str(llm_api_type),
+      _prompt_version(prompt), ' '.join(query.split()), history
+  ]
+  digest = hashlib.sha256(
+      json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+  return prefix + digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=8)
+def _prompt_version(prompt: str) -> str:
+  return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
 def _build_classifications(llm_resp: Dict,
                            filter_type: str) -> List[types.NLClassifier]:
   # Handle other keys in LLM Response.
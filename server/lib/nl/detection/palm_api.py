@@ -13,21 +13,36 @@
 # limitations under the License.
 """Interface to PaLM API for detection"""
 
+import copy
 import json
 import logging
+import os
+import threading
 import time
 from typing import Dict, List
 
 from flask import current_app
 import json5
 import requests
+from requests.adapters import HTTPAdapter
 
 from server.lib.nl.common import counters
 
-_CHAT_API_URL_BASE = "https://generativelanguage.googleapis.com/v1beta2/models/chat-bison-001:generateMessage"
-_TEXT_API_URL_BASE = "https://generativelanguage.googleapis.com/v1beta2/models/text-bison-001:generateText"
+# Can be overridden with the PALM_API_URL_BASE config, e.g., to point to a
+# local stub server in tests.
+_API_URL_BASE = "https://generativelanguage.googleapis.com"
+_CHAT_API_PATH = "/v1beta2/models/chat-bison-001:generateMessage"
+_TEXT_API_PATH = "/v1beta2/models/text-bison-001:generateText"
 _API_HEADER = {'content-type': 'application/json'}
 
+# (connect, read) timeouts in seconds. LLM calls typically take a few seconds,
+# so the read timeout leaves plenty of room while not holding a server worker
+# forever on a stuck call.
+_API_TIMEOUT = (5, 30)
+
+# Maximum number of pooled connections to the API.
+_POOL_SIZE = 10
+
 _SUFFIX = '\n\nIn your response, include just the JSON adhering to the above schema. Do not add JSON keys outside the schema.  Also, explain why you set specific enum values.'
 
 # TODO: Consider tweaking this. And maybe consider passing as url param.
@@ -76,10 +91,53 @@ _TEXT_REQ_DATA = {
 
 _SKIP_BEGIN_CHARS = ['`', '*']
 
+# HTTP session with a connection pool, so that calls reuse connections instead
+# of paying for a new TCP and TLS handshake each time. Created lazily per
+# process, since with `gunicorn --preload` the module is imported before the
+# workers are forked.
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+  global _session, _session_pid
+  with _session_lock:
+    if _session is None or _session_pid != os.getpid():
+      session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_POOL_SIZE)
+      session.mount('https://', adapter)
+      session.mount('http://', adapter)
+      _session = session
+      _session_pid = os.getpid()
+    return _session
+
+
+# Posts the request to the API at `path` and returns the JSON response, or an
+# empty dict if the call fails.
+def _call_api(path: str, req_data: Dict, ctr: counters.Counters) -> Dict:
+  # NOTE: llm_detector.detect() caller checks this.
+  api_key = current_app.config['PALM_API_KEY']
+  url_base = current_app.config.get('PALM_API_URL_BASE', _API_URL_BASE)
+  try:
+    r = _get_session().post(f'{url_base}{path}',
+                            params={'key': api_key},
+                            data=json.dumps(req_data),
+                            headers=_API_HEADER,
+                            timeout=_API_TIMEOUT)
+    return r.json()
+  except requests.exceptions.Timeout as e:
+    logging.error(f'ERROR: PaLM API call timed out: {e}')
+    ctr.err('failed_palm_api_timeout', str(e))
+  except (requests.exceptions.RequestException, ValueError) as e:
+    logging.error(f'ERROR: PaLM API call failed: {e}')
+    ctr.err('failed_palm_api_request', str(e))
+  return {}
+
 
 def detect_via_text(query: str, history: List[List[str]],
                     ctr: counters.Counters) -> Dict:
-  req_data = _TEXT_REQ_DATA.copy()
+  req_data = copy.deepcopy(_TEXT_REQ_DATA)
 
   text = current_app.config['PALM_PROMPT_TEXT'].detection_text + '\n\n'
   if not history:
@@ -100,21 +158,17 @@ def detect_via_text(query: str, history: List[List[str]],
   req_data['prompt']['text'] = text
 
   start_time = time.time()
-  req = json.dumps(req_data)
-  # NOTE: llm_detector.detect() caller checks this.
-  api_key = current_app.config['PALM_API_KEY']
-  r = requests.post(f'{_TEXT_API_URL_BASE}?key={api_key}',
-                    data=req,
-                    headers=_API_HEADER)
-  resp = r.json()
+  resp = _call_api(_TEXT_API_PATH, req_data, ctr)
   ctr.timeit('palm_api_text_call', start_time)
+  if not resp:
+    return {}
 
   return parse_response(query, resp, field='output', ctr=ctr)
 
 
 def detect_via_chat(query: str, history: List[List[str]],
                     ctr: counters.Counters) -> Dict:
-  req_data = _CHAT_REQ_DATA.copy()
+  req_data = copy.deepcopy(_CHAT_REQ_DATA)
 
   req_data['prompt']['context'] = current_app.config[
       'PALM_PROMPT_TEXT'].detection_chat
@@ -137,14 +191,10 @@ def detect_via_chat(query: str, history: List[List[str]],
     })
 
   start_time = time.time()
-  req = json.dumps(req_data)
-  # NOTE: llm_detector.detect() caller checks this.
-  api_key = current_app.config['PALM_API_KEY']
-  r = requests.post(f'{_CHAT_API_URL_BASE}?key={api_key}',
-                    data=req,
-                    headers=_API_HEADER)
-  resp = r.json()
+  resp = _call_api(_CHAT_API_PATH, req_data, ctr)
   ctr.timeit('palm_api_chat_call', start_time)
+  if not resp:
+    return {}
 
   return parse_response(query, resp, field='content', ctr=ctr)
 
@@ -215,7 +215,8 @@ def detect_from_names(place_names: List[str], query_without_places: str,
 # Wrapper with NL Server API.
 #
 def _detect_places(query: str) -> List[str]:
-  return utils.place_detection_with_heuristics(dc.nl_detect_place_ner, query)
+  return utils.place_detection_with_heuristics(dc.nl_detect_place_ner_many,
+                                               query)
 
 
 #
@@ -46,3 +46,12 @@ def detect_svs(query: str, index_type: str,
 
   # Make API call to the NL models/embeddings server.
   return dc.nl_search_sv(query, index_type)
+
+
+#
+# Same as detect_svs() for each of the queries, with a single call to the NL
+# Server.
+#
+def detect_svs_many(queries: List[str],
+                    index_type: str) -> List[Dict[str, Union[Dict, List]]]:
+  return dc.nl_search_sv_many(queries, index_type)
@@ -31,6 +31,7 @@ from server.lib.nl.fulfillment.existence import chart_vars_fetch
 from server.lib.nl.fulfillment.existence import ExtensionExistenceCheckTracker
 from server.lib.nl.fulfillment.existence import get_places_to_check
 from server.lib.nl.fulfillment.existence import MainExistenceCheckTracker
+from server.lib.nl.fulfillment.existence import prefetch_existence
 from server.lib.nl.fulfillment.handlers import get_populate_handlers
 from server.lib.nl.fulfillment.types import PopulateState
 from server.lib.nl.fulfillment.utils import handle_contained_in_type
@@ -145,8 +146,7 @@ def _add_charts_with_place_fallback(state: PopulateState,
       state.place_type = parent_type
     else:
       # Pick parent place.
-      parents = utils.get_immediate_parent_places(place.dcid, parent_type,
-                                                  state.uttr.counters)
+      parents = _get_parent_places(state, place.dcid, parent_type)
       if not parents:
         state.uttr.counters.err('failed_get_parent_places', {
             'dcid': place.dcid,
@@ -204,6 +204,18 @@ def _add_charts_with_existence_check(state: PopulateState,
 
   # Avoid any mutations in existence tracker.
   chart_vars_map = copy.deepcopy(state.chart_vars_map)
+
+  # Check the SVs for the places we may fallback to along with these places,
+  # so that a fallback doesn't need another existence check call.
+  all_svs = set()
+  for chart_vars_list in chart_vars_map.values():
+    for chart_vars in chart_vars_list:
+      all_svs.update(chart_vars.svs)
+  prefetch_existence(
+      state,
+      list(state.places_to_check) + _get_fallback_place_dcids(state, places),
+      sorted(all_svs))
+
   tracker = MainExistenceCheckTracker(state, state.places_to_check,
                                       chart_vars_map)
   tracker.perform_existence_check()
@@ -350,6 +362,45 @@ def _add_charts_for_extended_svs(state: PopulateState, places: List[Place],
   return found
 
 
+#
+# Returns the DCIDs of the place that `_add_charts_with_place_fallback()`
+# falls back to first from `places`, if it falls back to a parent place.
+#
+def _get_fallback_place_dcids(state: PopulateState,
+                              places: List[Place]) -> List[str]:
+  if state.disable_fallback or len(places) != 1:
+    return []
+  place = places[0]
+  if place.place_type in constants.SUPER_NATIONAL_TYPES:
+    return ['Earth']
+  # With a child place type, the fallback is to parent place types, which
+  # needs the child places of those types.
+  if state.place_type:
+    return []
+  if place.place_type not in set([it.value for it in ContainedInPlaceType]):
+    return []
+  parent_type = utils.get_parent_place_type(
+      ContainedInPlaceType(place.place_type), place)
+  if not parent_type:
+    return []
+  # The fallback picks the first parent.
+  parents = _get_parent_places(state, place.dcid, parent_type)
+  return [parents[0].dcid] if parents else []
+
+
+#
+# Returns the immediate parent places of a place, memoized in `state` so that
+# the fallback reuses the lookup of the prefetch.
+#
+def _get_parent_places(state: PopulateState, place_dcid: str,
+                       parent_type: ContainedInPlaceType) -> List[Place]:
+  key = (place_dcid, parent_type)
+  if key not in state.parent_places:
+    state.parent_places[key] = utils.get_immediate_parent_places(
+        place_dcid, parent_type, state.uttr.counters)
+  return state.parent_places[key]
+
+
 def _get_place_names(places: List[Place]) -> List[str]:
   names = []
   for p in places:
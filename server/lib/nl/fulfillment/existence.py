@@ -15,7 +15,7 @@
 from collections import OrderedDict
 from dataclasses import dataclass
 import logging
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 
 from server.lib.nl.common import constants
 from server.lib.nl.common import utils
@@ -63,11 +63,10 @@ class ExistenceCheckTracker:
     self.existing_svs = {}
 
   def _run(self):
-    # Perform batch existence check.
-    # TODO: Optimize this!
-    self.existing_svs, existsv2places = \
-      utils.sv_existence_for_places_check_single_point(
-        self.places, list(self.all_svs), self.state.uttr.counters)
+    # Perform batch existence check.  This only fetches the pairs not
+    # already checked in this fulfillment.
+    self.existing_svs, existsv2places = check_existence(self.state, self.places,
+                                                        list(self.all_svs))
 
     # In `state`, set sv -> place Key -> is-single-point
     for sv, pl2sp in existsv2places.items():
@@ -185,6 +184,55 @@ class ExtensionExistenceCheckTracker(ExistenceCheckTracker):
         self.exist_sv_states.append(exist_state)
 
 
+#
+# Checks the existence of all the given SVs for all the given places, in one
+# batched call for the pairs not already checked in this fulfillment.
+#
+# Callers that know of places or SVs they may check later (e.g., the parent
+# places to fallback to) should include them, so that later checks are
+# answered from `state` instead of making another call.
+#
+def prefetch_existence(state: PopulateState, places: List[str], svs: List[str]):
+  missing_svs = set()
+  missing_places = set()
+  for sv in svs:
+    for pl in places:
+      if (sv, pl) not in state.existence_checked:
+        missing_svs.add(sv)
+        missing_places.add(pl)
+  if not missing_svs:
+    return
+
+  missing_svs = sorted(missing_svs)
+  missing_places = sorted(missing_places)
+  _, existsv2places = utils.sv_existence_for_places_check_single_point(
+      missing_places, missing_svs, state.uttr.counters)
+  for sv, pl2sp in existsv2places.items():
+    state.existence_results.setdefault(sv, {}).update(pl2sp)
+  state.existence_checked.update(
+      (sv, pl) for sv in missing_svs for pl in missing_places)
+  state.uttr.counters.info('existence_check_calls', 1)
+
+
+#
+# Same as `utils.sv_existence_for_places_check_single_point()`, but answered
+# from the memoized results in `state` where possible.
+#
+def check_existence(state: PopulateState, places: List[str],
+                    svs: List[str]) -> Tuple[Dict[str, bool], Dict]:
+  prefetch_existence(state, places, svs)
+  places = set(places)
+  existing_svs = {}
+  existsv2places = {}
+  for sv in svs:
+    for pl, is_singlepoint in state.existence_results.get(sv, {}).items():
+      if pl not in places:
+        continue
+      existing_svs[sv] = existing_svs.get(sv, False) | is_singlepoint
+      existsv2places.setdefault(sv, {})[pl] = is_singlepoint
+  return existing_svs, existsv2places
+
+
 # Returns a list of place as a map with place DCID as key, and the value for
 # grouping.
 def get_places_to_check(state: PopulateState,
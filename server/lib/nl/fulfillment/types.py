@@ -19,7 +19,7 @@
 from collections import OrderedDict
 from dataclasses import dataclass
 from dataclasses import field
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 
 from server.lib.nl.common.utterance import ChartOriginType
 from server.lib.nl.common.utterance import ChartType
@@ -112,6 +112,15 @@ class PopulateState:
   # SV -> Place Keys
   # Where Place Key may be the place DCID, or place DCID + child-type.
   exist_checks: Dict[str, Set[str]] = field(default_factory=dict)
+  # Memoized results of the existence checks of this fulfillment.
+  # SV -> Place DCID -> is-single-point, for the SVs that exist.
+  existence_results: Dict[str, Dict[str, bool]] = field(default_factory=dict)
+  # The (SV, Place DCID) pairs whose existence has been checked.
+  existence_checked: Set[Tuple[str, str]] = field(default_factory=set)
+  # Memoized immediate parent places of this fulfillment.
+  # (Place DCID, parent place type) -> parent places
+  parent_places: Dict[Tuple[str, str],
+                      List[Place]] = field(default_factory=dict)
   # Whether this is explore mode of fulfillment.
   explore_mode: bool = False
   # Set to true if utterance has overwritten SVs.  So they should
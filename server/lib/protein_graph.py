@@ -0,0 +1,158 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local cache of the bio protein-protein interaction graph."""
+
+from array import array
+from collections import OrderedDict
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from server.lib import fetch
+
+# Maximum number of proteins to keep adjacency lists for. When the cache grows
+# past this, the least recently used half of the proteins is evicted.
+DEFAULT_MAX_PROTEINS = 100000
+# Maximum age of a cached adjacency list, after which it is fetched again.
+DEFAULT_TTL_SECS = 3600 * 24
+
+
+class InteractionGraph:
+  """Adjacency cache for the protein-protein interaction graph.
+
+  Adjacency lists are stored CSR-style: the interactions of the protein in row
+  i are interactions[offsets[i]:offsets[i + 1]], and the interaction scores
+  are at the same positions of scores. Interactions without any confidence
+  score node have a score of None (stored as NaN). Proteins are added on
+  demand: a lookup fetches all the missing proteins of a frontier with one
+  interactor request and one confidence score request.
+
+  Rows are appended, so a protein that is fetched again after its row expired
+  leaves the old row unused; unused and least recently used rows are dropped
+  by compacting the arrays when the cache is full.
+  """
+
+  def __init__(self,
+               score_fn: Callable[[List[str]], float],
+               max_proteins: int = DEFAULT_MAX_PROTEINS,
+               ttl_secs: float = DEFAULT_TTL_SECS):
+    """
+    Args:
+      score_fn: converts the confidence score values of an interaction into
+        the single score to cache for it.
+      max_proteins: maximum number of proteins to cache.
+      ttl_secs: maximum age of a cached protein in seconds.
+    """
+    self._score_fn = score_fn
+    self._max_proteins = max_proteins
+    self._ttl_secs = ttl_secs
+    self._lock = threading.Lock()
+    self._reset()
+
+  def _reset(self):
+    # protein dcid -> row, least recently used first
+    self._rows = OrderedDict()
+    self._offsets = array('l', [0])
+    self._interactions = []
+    self._scores = array('d')
+    # When each row was fetched, from time.monotonic().
+    self._fetched_at = array('d')
+
+  def _num_rows(self) -> int:
+    return len(self._offsets) - 1
+
+  def _add_row(self, protein_dcid: str,
+               adjacency: List[Tuple[str, Optional[float]]], fetched_at: float):
+    self._rows[protein_dcid] = self._num_rows()
+    self._rows.move_to_end(protein_dcid)
+    for interaction_dcid, score in adjacency:
+      self._interactions.append(interaction_dcid)
+      self._scores.append(math.nan if score is None else score)
+    self._offsets.append(len(self._interactions))
+    self._fetched_at.append(fetched_at)
+
+  def _is_expired(self, row: int, now: float) -> bool:
+    return now - self._fetched_at[row] >= self._ttl_secs
+
+  def _evict(self, now: float):
+    """Keeps only the most recently used half of the unexpired rows, and
+    compacts the arrays."""
+    keep = [(dcid, row)
+            for dcid, row in self._rows.items()
+            if not self._is_expired(row, now)]
+    keep = keep[max(0, len(keep) - self._max_proteins // 2):]
+    old_rows = [
+        (dcid, self._row(row), self._fetched_at[row]) for dcid, row in keep
+    ]
+    self._reset()
+    for dcid, adjacency, fetched_at in old_rows:
+      self._add_row(dcid, adjacency, fetched_at)
+
+  def _row(self, row: int) -> List[Tuple[str, Optional[float]]]:
+    start, end = self._offsets[row], self._offsets[row + 1]
+    return [(dcid, None if math.isnan(score) else score) for dcid, score in zip(
+        self._interactions[start:end], self._scores[start:end])]
+
+  def _fetch(
+      self,
+      protein_dcids: List[str]) -> Dict[str, List[Tuple[str, Optional[float]]]]:
+    interactions = fetch.property_values(protein_dcids, "interactingProtein",
+                                         False)
+    interaction_dcids = list(
+        dict.fromkeys(
+            dcid for dcids in interactions.values() for dcid in dcids))
+    score_lists = {}
+    if interaction_dcids:
+      score_lists = fetch.property_values(interaction_dcids, "confidenceScore")
+    scores = {
+        dcid: self._score_fn(score_list)
+        for dcid, score_list in score_lists.items()
+    }
+    result = {}
+    for protein_dcid in protein_dcids:
+      result[protein_dcid] = [(dcid, scores.get(dcid))
+                              for dcid in interactions.get(protein_dcid, [])]
+    return result
+
+  def interactors(
+      self,
+      protein_dcids: List[str]) -> Dict[str, List[Tuple[str, Optional[float]]]]:
+    """Returns the interactions of each protein, as a dict of protein dcid to a
+    list of (interaction dcid, score) tuples, where the score is None for
+    interactions without confidence scores. Proteins that are not cached yet
+    are fetched in a single batch.
+    """
+    protein_dcids = list(dict.fromkeys(protein_dcids))
+    result = {}
+    with self._lock:
+      now = time.monotonic()
+      for protein_dcid in protein_dcids:
+        row = self._rows.get(protein_dcid)
+        if row is not None and not self._is_expired(row, now):
+          self._rows.move_to_end(protein_dcid)
+          result[protein_dcid] = self._row(row)
+    missing = [dcid for dcid in protein_dcids if dcid not in result]
+    if missing:
+      fetched = self._fetch(missing)
+      result.update(fetched)
+      with self._lock:
+        now = time.monotonic()
+        if self._num_rows() + len(fetched) > self._max_proteins:
+          self._evict(now)
+        for protein_dcid, adjacency in fetched.items():
+          row = self._rows.get(protein_dcid)
+          if row is None or self._is_expired(row, now):
+            self._add_row(protein_dcid, adjacency, now)
+    return {dcid: result[dcid] for dcid in protein_dcids}
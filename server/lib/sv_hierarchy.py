@@ -0,0 +1,165 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory snapshot of the stat var hierarchy, used to serve stat var group
+info without a mixer call per node.
+
+The snapshot is built offline by tools/sv_hierarchy and is a json object of stat
+var group dcid to its (unconstrained) info from /v1/bulk/info/variable-group.
+
+Stat vars are numbered, and both the descendent stat vars of every group and the
+stat vars that have data for a place are stored as bitmaps (python ints) over
+those numbers, so entity-constrained info is a few bitwise operations.
+"""
+
+from collections import OrderedDict
+import copy
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from server.lib import fetch
+
+# Maximum number of places to keep stat var bitmaps for.
+DEFAULT_MAX_PLACES = 20000
+
+
+def _to_bitmap(positions: List[int]) -> int:
+  if not positions:
+    return 0
+  bits = bytearray(max(positions) // 8 + 1)
+  for pos in positions:
+    bits[pos // 8] |= 1 << (pos % 8)
+  return int.from_bytes(bits, 'little')
+
+
+class StatVarHierarchy:
+
+  def __init__(self,
+               svg_info: Dict[str, Dict],
+               max_places: int = DEFAULT_MAX_PLACES):
+    """
+    Args:
+      svg_info: stat var group dcid to its unconstrained info.
+      max_places: maximum number of place bitmaps to cache.
+    """
+    self._svg_info = svg_info
+    self._max_places = max_places
+    # stat var dcid -> bit position
+    self._sv_bits = {}
+    for info in svg_info.values():
+      for sv in info.get('childStatVars', []):
+        self._sv_bits.setdefault(sv['id'], len(self._sv_bits))
+    # stat var group dcid -> bitmap of its descendent stat vars
+    self._descendents = {}
+    for svg in svg_info:
+      self._descendent_bitmap(svg, set())
+    # place dcid -> bitmap of the stat vars with data for the place, in least
+    # recently used order.
+    self._place_bitmaps = OrderedDict()
+    self._lock = threading.Lock()
+
+  def _descendent_bitmap(self, svg: str, visiting: set) -> int:
+    if svg in self._descendents:
+      return self._descendents[svg]
+    info = self._svg_info.get(svg, {})
+    bitmap = _to_bitmap(
+        [self._sv_bits[sv['id']] for sv in info.get('childStatVars', [])])
+    # Guard against cycles in the data.
+    visiting.add(svg)
+    for child in info.get('childStatVarGroups', []):
+      if child['id'] not in visiting:
+        bitmap |= self._descendent_bitmap(child['id'], visiting)
+    visiting.discard(svg)
+    self._descendents[svg] = bitmap
+    return bitmap
+
+  def place_bitmaps(self, places: List[str]) -> Dict[str, int]:
+    """Returns the bitmap of the stat vars with data for each place. Places that
+    are not cached are fetched with one request."""
+    result = {}
+    with self._lock:
+      for place in places:
+        if place in self._place_bitmaps:
+          self._place_bitmaps.move_to_end(place)
+          result[place] = self._place_bitmaps[place]
+    missing = [p for p in places if p not in result]
+    if missing:
+      positions = {p: [] for p in missing}
+      for sv, place_data in fetch.entity_variables(missing).items():
+        bit = self._sv_bits.get(sv)
+        if bit is None:
+          continue
+        for place in place_data:
+          if place in positions:
+            positions[place].append(bit)
+      with self._lock:
+        for place, place_positions in positions.items():
+          result[place] = self._place_bitmaps[place] = _to_bitmap(
+              place_positions)
+        while len(self._place_bitmaps) > self._max_places:
+          self._place_bitmaps.popitem(last=False)
+    return result
+
+  def info(self, svg: str, entities: List[str],
+           num_entities_existence: int) -> Optional[Dict]:
+    """Returns the info of a stat var group in the same format as
+    /v1/bulk/info/variable-group, or None if it can not be computed locally.
+
+    With entities, a child stat var has data if it has data for at least
+    num_entities_existence of the entities, and the descendentStatVarCount of a
+    child group only counts such stat vars.
+    """
+    if svg not in self._svg_info:
+      return None
+    result = copy.deepcopy(self._svg_info[svg])
+    if not entities:
+      return result
+    bitmaps = self.place_bitmaps(entities)
+    # Entities without any data are likely not places (e.g. data sources),
+    # which can not be answered from the place bitmaps.
+    if not all(bitmaps.values()):
+      return None
+    num = max(int(num_entities_existence), 0)
+    if num > len(bitmaps):
+      # No stat var can have data for more entities than were requested.
+      has_data = 0
+    else:
+      # at_least[k] is the bitmap of stat vars with data for >= k entities.
+      at_least = [-1] + [0] * num
+      for bitmap in bitmaps.values():
+        for k in range(num, 0, -1):
+          at_least[k] |= at_least[k - 1] & bitmap
+      has_data = at_least[num]
+    for sv in result.get('childStatVars', []):
+      sv['hasData'] = bool(has_data >> self._sv_bits[sv['id']] & 1)
+    for child in result.get('childStatVarGroups', []):
+      child['descendentStatVarCount'] = (self._descendents.get(child['id'], 0) &
+                                         has_data).bit_count()
+    return result
+
+
+def load(path: str) -> Optional[StatVarHierarchy]:
+  """Loads the stat var hierarchy snapshot at path (json, optionally gzipped),
+  or returns None if there is no snapshot."""
+  if not path or not os.path.isfile(path):
+    return None
+  open_fn = gzip.open if path.endswith('.gz') else open
+  with open_fn(path, 'rt') as f:
+    svg_info = json.load(f)
+  logging.info(
+      f'Loaded stat var hierarchy snapshot with {len(svg_info)} groups')
+  return StatVarHierarchy(svg_info)
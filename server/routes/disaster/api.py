@@ -14,7 +14,6 @@
 """Endpoints for disaster dashboard"""
 
 import json
-import logging
 
 from flask import Blueprint
 from flask import current_app
@@ -22,19 +21,26 @@ from flask import request
 from flask import Response
 
 from server import cache
+from server.lib.disaster_dashboard import EventTypeIndex
+from server.lib.disaster_dashboard import sync_app_data
 import server.lib.fetch as fetch
 import server.lib.util as lib_util
 
 # Define blueprint
 bp = Blueprint("disaster_api", __name__, url_prefix='/api/disaster-dashboard')
 
-EARTH_DCID = "Earth"
 EVENT_POINT_KEYS = set(
     ["affectedPlaces", "latitude", "longitude", "startDate", "eventId"])
 # Mixer event api takes a date of the format YYYY-MM (length of 7)
 DATA_RETRIEVAL_DATE_LENGTH = 7
 
 
+@bp.before_request
+def sync_disaster_data():
+  # Pick up data refreshed by another server process.
+  sync_app_data(current_app)
+
+
 @bp.route('/event-date-range')
 def event_date_range():
   """Gets the date range of event data for a specific event type
@@ -66,31 +72,20 @@ def event_date_range():
   return Response(json.dumps(result), 200, mimetype='application/json')
 
 
-def keep_event(event, place, filter_prop, filter_unit, filter_upper_limit,
-               filter_lower_limit):
+def get_event_index(event_type):
   """
-  Returns whether or not we should keep an event
+  Returns the EventTypeIndex for an event type, or None if there is no data for
+  that event type.
   """
-  if place != EARTH_DCID and not place in event.get("affectedPlaces", []):
-    # event does not affect the place of interest
-    return False
-  if not filter_prop:
-    # no props to filter by
-    return True
-  if not filter_prop in event:
-    # Event doesn't contain the prop
-    return False
-  try:
-    prop_val = event[filter_prop]
-    val_string = prop_val[len(filter_unit):].strip()
-    val = float(val_string)
-    return val <= filter_upper_limit and val >= filter_lower_limit
-  except:
-    # can't parse the value to filter by into a float
-    logging.info(
-        f'Could not parse filter value for event: {event["eventId"]}, filter prop: {filter_prop}'
-    )
-    return False
+  disaster_index = current_app.config.get('DISASTER_DASHBOARD_INDEX')
+  if disaster_index is None:
+    # The index is built with the data at startup, but the data may have been
+    # set directly (e.g., in tests).
+    disaster_data = current_app.config['DISASTER_DASHBOARD_DATA']
+    if event_type not in disaster_data:
+      return None
+    return EventTypeIndex(disaster_data[event_type])
+  return disaster_index.get(event_type)
 
 
 def get_date_list(min_date: str, max_date: str):
@@ -168,30 +163,32 @@ def json_event_data():
   filter_lower_limit = float(request.args.get('filterLowerLimit',
                                               -float("inf")))
   event_points = []
-  disaster_data = current_app.config['DISASTER_DASHBOARD_DATA']
+  event_index = get_event_index(event_type)
   date_list = get_date_list(min_date, max_date)
-  for date in date_list:
-    for event in disaster_data.get(event_type, {}).get(date, []):
-      if (keep_event(event, place, filter_prop, filter_unit, filter_upper_limit,
-                     filter_lower_limit)):
-        event_formatted = {
-            "dcid": event["eventId"],
-            "dates": [event["startDate"]],
-            "places": event["affectedPlaces"],
-            "geoLocations": [{
-                "point": {
-                    "latitude": event["latitude"],
-                    "longitude": event["longitude"]
-                }
-            }],
-            "provenanceId": "",
-            "propVals": {}
-        }
-        for eventKey in event.keys():
-          if eventKey in EVENT_POINT_KEYS:
-            continue
-          event_formatted["propVals"][eventKey] = {"vals": [event[eventKey]]}
-        event_points.append(event_formatted)
+  events = []
+  if event_index and date_list:
+    events = event_index.query(place, date_list[0], date_list[-1], filter_prop,
+                               filter_unit, filter_upper_limit,
+                               filter_lower_limit)
+  for event in events:
+    event_formatted = {
+        "dcid": event["eventId"],
+        "dates": [event["startDate"]],
+        "places": event["affectedPlaces"],
+        "geoLocations": [{
+            "point": {
+                "latitude": event["latitude"],
+                "longitude": event["longitude"]
+            }
+        }],
+        "provenanceId": "",
+        "propVals": {}
+    }
+    for eventKey in event.keys():
+      if eventKey in EVENT_POINT_KEYS:
+        continue
+      event_formatted["propVals"][eventKey] = {"vals": [event[eventKey]]}
+    event_points.append(event_formatted)
   result = {}
   if event_points:
     result = {"eventCollection": {"events": event_points, "provenanceInfo": {}}}
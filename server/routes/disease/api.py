@@ -21,7 +21,7 @@ import flask
 from flask import Response
 
 from server import cache
-from server.lib import fetch
+from server.lib import hierarchy
 import server.services.datacommons as dc
 
 bp = flask.Blueprint('api_disease', __name__, url_prefix='/api/disease')
@@ -54,22 +54,13 @@ def get_node(dcid):
 @bp.route('/disease-parent/<path:dcid>')
 def get_disease_parents(dcid):
   """Returns a list of parent nodes for a given disease node."""
-  # list to store parent node
-  list_parent = []
-  curr_dcid = dcid
   # dcid of the biggest parent node where iteration stops
-  while (curr_dcid != FINAL_PARENT_DISEASE_DCID):
-    node_dcids = fetch.property_values([curr_dcid],
-                                       "specializationOf").get(curr_dcid, [])
-    if not node_dcids:
-      break
-    node_dcid = node_dcids[0]
-    node_names = fetch.property_values([node_dcid], "name").get(node_dcid, [])
-    node_name = node_dcid
-    if node_names:
-      node_name = node_names[0]
-    list_parent.append(DiseaseParent(node_dcid, node_name))
-    curr_dcid = node_dcid
+  ancestors = hierarchy.DISEASES.ancestors([dcid], FINAL_PARENT_DISEASE_DCID)
+  # list to store parent node
+  list_parent = [
+      DiseaseParent(node_dcid, node_name)
+      for node_dcid, node_name in ancestors.get(dcid, [])
+  ]
   # return a list of dcid and name lists
   return Response(json.dumps(list_parent, cls=DiseaseParentEncoder),
                   200,
@@ -104,6 +104,11 @@ def detect_and_fulfill():
   if dc_name not in set([it.value for it in DCNames]):
     return helpers.abort(f'Invalid Custom Data Commons Name {dc_name}', '', [])
 
+  cache_key = helpers.response_cache_key(request, 'explore')
+  cached_response = helpers.get_cached_response(cache_key, 'explore')
+  if cached_response:
+    return cached_response
+
   utterance, error_json = helpers.parse_query_and_detect(
       request, 'explore', debug_logs)
   if error_json:
@@ -123,7 +128,9 @@ def detect_and_fulfill():
   nl_detector.setup_for_explore(utterance)
   utterance.counters.timeit('setup_for_explore', start)
 
-  return _fulfill_with_chart_config(utterance, debug_logs)
+  data_dict = _fulfill_with_chart_config(utterance, debug_logs)
+  helpers.cache_response(cache_key, data_dict)
+  return data_dict
 
 
 #
@@ -37,6 +37,11 @@ bp = Blueprint('nl_api', __name__, url_prefix='/api/nl')
 @bp.route('/data', methods=['POST'])
 def data():
   """Data handler."""
+  cache_key = helpers.response_cache_key(request, 'nl')
+  cached_response = helpers.get_cached_response(cache_key, 'nl')
+  if cached_response:
+    return cached_response
+
   debug_logs = {}
   utterance, error_json = helpers.parse_query_and_detect(
       request, 'nl', debug_logs)
@@ -44,7 +49,9 @@ def data():
     return error_json
   if not utterance:
     return helpers.abort('Failed to process!', '', [])
-  return helpers.fulfill_with_chart_config(utterance, debug_logs)
+  data_dict = helpers.fulfill_with_chart_config(utterance, debug_logs)
+  helpers.cache_response(cache_key, data_dict)
+  return data_dict
 
 
 @bp.route('/history')
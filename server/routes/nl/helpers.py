@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio
+import hashlib
 import json
 import logging
 import os
@@ -24,7 +24,9 @@ from flask import current_app
 from google.protobuf.json_format import MessageToJson
 from markupsafe import escape
 
+from server import cache
 from server.config.subject_page_pb2 import SubjectPageConfig
+from server.lib.explore.params import Params
 from server.lib.nl.common import bad_words
 from server.lib.nl.common import commentary
 from server.lib.nl.common import serialize
@@ -48,9 +50,17 @@ import server.lib.nl.fulfillment.fulfiller as fulfillment
 import server.lib.nl.fulfillment.utils as futils
 from server.lib.util import get_nl_disaster_config
 from server.routes.nl import helpers
-import server.services.bigtable as bt
+from server.services import datacommons as dc
 import shared.lib.utils as shared_utils
 
+# Responses are keyed by the data versions, so can be cached for a while.
+RESPONSE_CACHE_TIMEOUT = 3600 * 24
+
+# How long to reuse the mixer and embeddings versions for response cache keys.
+_DATA_VERSIONS_TIMEOUT = 300
+
+_RESPONSE_CACHE_PREFIX = 'nl_response:'
+
 
 #
 # Given a request parses the query and other params and
@@ -265,13 +275,94 @@ def prepare_response_common(data_dict: Dict, status_str: str,
                                          dbg_counters, debug_logs)
   # Convert data_dict to pure json.
   data_dict = utils.to_dict(data_dict)
+  _log_query(data_dict, dbg_counters, has_data)
+  return data_dict
+
+
+def _log_query(data_dict: Dict, dbg_counters: Dict, has_data: bool):
   if current_app.config['LOG_QUERY']:
-    # Asynchronously log as bigtable write takes O(100ms)
-    loop = asyncio.new_event_loop()
     session_info = futils.get_session_info(data_dict['context'], has_data)
     data_dict['session'] = session_info
-    loop.run_until_complete(bt.write_row(session_info, data_dict, dbg_counters))
+    # The row is written in the background, as bigtable write takes O(100ms).
+    query_logger = current_app.config.get('NL_QUERY_LOGGER')
+    if query_logger:
+      query_logger.log(session_info, data_dict, dbg_counters)
+
+
+#
+# Returns the response cache key for the request, or '' if its response
+# should not be cached.
+#
+# Only queries without context are cached, since their response is determined
+# by the request params and the versions of the data and embeddings.
+#
+def response_cache_key(request: Dict, app: str) -> str:
+  if not current_app.config['USE_MEMCACHE']:
+    return ''
+  req_json = request.get_json() or {}
+  if not request.args.get('q') or req_json.get('contextHistory'):
+    return ''
+  try:
+    versions = _data_versions()
+  except Exception as e:
+    logging.warning(f'Not caching response, failed to get versions: {e}')
+    return ''
+  args = dict(request.args)
+  args['q'] = ' '.join(args['q'].split())
+  params = {k: v for k, v in req_json.items() if k != 'contextHistory'}
+  parts = [app, args, params, versions]
+  digest = hashlib.sha256(
+      json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+  return _RESPONSE_CACHE_PREFIX + digest.hexdigest()
+
+
+@cache.cache.memoize(timeout=_DATA_VERSIONS_TIMEOUT)
+def _data_versions() -> Dict:
+  mixer_version = dc.version()
+  return {
+      'website_hash': os.environ.get("WEBSITE_HASH"),
+      'mixer_hash': mixer_version.get('gitHash', ''),
+      'table': mixer_version.get('tables', ''),
+      'embeddings': dc.nl_embeddings_version_map()
+  }
+
+
+#
+# Caches a response with charts.  Failures and empty results are not cached,
+# since they could be transient.
+#
+def cache_response(key: str, data_dict: Dict):
+  if not key or not data_dict.get('config') or data_dict.get('failure'):
+    return
+  data_dict = {k: v for k, v in data_dict.items() if k != 'session'}
+  cache.cache.set(key, data_dict, timeout=RESPONSE_CACHE_TIMEOUT)
+
 
+#
+# Returns the cached response for the key with a new session, or None if
+# there is none.  The query is logged just like an uncached one.
+#
+def get_cached_response(key: str, app: str) -> Dict:
+  if not key:
+    return None
+  data_dict = cache.cache.get(key)
+  if not data_dict:
+    return None
+
+  if current_app.config['LOG_QUERY']:
+    session_id = utils.new_session_id(app)
+  else:
+    session_id = constants.TEST_SESSION_ID
+  # A context-free response has a single utterance in its context.
+  for u in data_dict.get('context', []):
+    u['session_id'] = session_id
+    if u.get('insightCtx', {}).get(Params.SESSION_ID.value):
+      u['insightCtx'][Params.SESSION_ID.value] = session_id
+
+  dbg_counters = data_dict.get('debug', {}).get('counters', {})
+  if dbg_counters:
+    dbg_counters.setdefault('INFO', {})['info_response_cache_hit'] = 1
+  _log_query(data_dict, dbg_counters, has_data=True)
   return data_dict
 
 
@@ -22,7 +22,7 @@ from flask import Response
 from markupsafe import escape
 
 from server import cache
-from server.lib import fetch
+from server.lib import protein_graph
 import server.services.datacommons as dc
 
 BIO_DCID_PREFIX = 'bio/'
@@ -113,6 +113,33 @@ def _extract_intactmi(score_dcids):
   return DEFAULT_INTERACTION_SCORE
 
 
+# Shared cache of the interaction graph, filled in as proteins are browsed.
+_INTERACTION_GRAPH = protein_graph.InteractionGraph(_extract_intactmi)
+
+
+def _layer_interactors_and_scores(protein_dcids):
+  '''
+    Returns the interactors of a BFS layer, as a dict of form {'bio/P53_HUMAN': ['bio/P53_HUMAN_CBP_HUMAN', ...], ...},
+    and the scores of those interactions, as a dict of form {'P53_HUMAN_CBP_HUMAN': 0.97, ...}
+    (interactions without any confidence score are left out of the scores)
+    '''
+  layer_adjacency = _INTERACTION_GRAPH.interactors(protein_dcids)
+  layer_interactors = {}
+  layer_scores = {}
+  for source_dcid, adjacency in layer_adjacency.items():
+    layer_interactors[source_dcid] = []
+    for interaction_dcid, score in adjacency:
+      layer_interactors[source_dcid].append(interaction_dcid)
+      if score is None:
+        continue
+      try:
+        interaction_id = _id(interaction_dcid)
+      except ValueError:
+        continue
+      layer_scores[interaction_id] = score
+  return layer_interactors, layer_scores
+
+
 def _interactors(interaction_id_or_dcid):
   '''
     Parse and return ids of two interactors from interaction DCID of the form 'bio/{protein1 id}_{protein2 id}'
@@ -208,16 +235,6 @@ def _symmetrized_scores(scores):
   return scores_sym
 
 
-def _flatten(nested_list):
-  '''
-    Given a list of lists, return a depth-1 flattened version
-    '''
-  flat = []
-  for L in nested_list:
-    flat.extend(L)
-  return flat
-
-
 def _partition_expansion_cross(target_ids, node_set):
   '''
     Return two lists expansion_targets, cross_targets such that
@@ -329,21 +346,8 @@ def protein_protein_interaction():
   # each iteration k retrieves the nodes and interactions at depth k
   # the last iteration is solely for finding the cross-links of the last layer
   for depth in range(1, max_depth + 2):
-    # retrieve interactor dict of form {'bio/P53_HUMAN': ['bio/CBP_HUMAN', ...], 'bio/FGFR1_HUMAN': [...], ...}
-    layer_interactors = fetch.property_values(last_layer_node_dcids,
-                                              "interactingProtein", False)
-    # retrieve score dict of form {'bio/P53_HUMAN_CBP_HUMAN': ['IntactMiScore0.97', 'AuthorScore3.0'], ...}
-    layer_score_lists = fetch.property_values(
-        _flatten(layer_interactors.values()), "confidenceScore")
-
-    # convert score dict to form {'P53_HUMAN_CBP_HUMAN': 0.97} (keep only IntactMi scores)
-    layer_scores = {}
-    for interaction_dcid, score_list in layer_score_lists.items():
-      try:
-        interaction_id = _id(interaction_dcid)
-      except ValueError:
-        continue
-      layer_scores[interaction_id] = _extract_intactmi(score_list)
+    layer_interactors, layer_scores = _layer_interactors_and_scores(
+        last_layer_node_dcids)
     layer_scores = _symmetrized_scores(layer_scores)
     scores.update(layer_scores)
     # used to request the next layer of interactors
@@ -18,6 +18,7 @@ from flask import Blueprint
 from flask import request
 from markupsafe import escape
 
+from server.lib import hierarchy
 import server.services.datacommons as dc
 
 bp = Blueprint("variable", __name__, url_prefix='/api/variable')
@@ -27,7 +28,7 @@ bp = Blueprint("variable", __name__, url_prefix='/api/variable')
 def get_variable_path():
   """Gets the path of a stat var to the root of the stat var hierarchy."""
   dcid = escape(request.args.get("dcid"))
-  return json.dumps([dcid] + dc.get_variable_ancestors(dcid)), 200
+  return json.dumps([dcid] + hierarchy.variable_ancestors(dcid)), 200
 
 
 @bp.route('/info')
@@ -36,8 +36,13 @@ def get_variable_group_info():
     dcid = request.json.get("dcid")
     entities = request.json.get("entities")
     numEntitiesExistence = request.json.get("numEntitiesExistence", 1)
-  resp = dc.get_variable_group_info([dcid], entities, numEntitiesExistence)
-  result = resp.get("data", [{}])[0].get("info", {})
+  result = None
+  sv_hierarchy = current_app.config.get("SV_HIERARCHY")
+  if sv_hierarchy:
+    result = sv_hierarchy.info(dcid, entities or [], numEntitiesExistence)
+  if result is None:
+    resp = dc.get_variable_group_info([dcid], entities, numEntitiesExistence)
+    result = resp.get("data", [{}])[0].get("info", {})
   if current_app.config["BLOCKLIST_SVG"]:
     blocklist_svgs = set(current_app.config["BLOCKLIST_SVG"])
     childSVG = result.get("childStatVarGroups", [])
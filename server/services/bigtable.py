@@ -12,11 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 from datetime import datetime
 from datetime import timedelta
 import json
+import logging
 import os
-from typing import Dict
+import queue
+import threading
+import time
+from typing import Dict, List
 
 from flask import current_app
 import google.auth
@@ -39,6 +44,20 @@ _COL_FEEDBACK = 'feedback'
 
 _SPAN_IN_DAYS = 3
 
+# Rows waiting to be written, beyond which rows are dropped.
+DEFAULT_MAX_QUEUE_SIZE = 1000
+# Rows written with one mutate_rows call.
+DEFAULT_MAX_BATCH_SIZE = 100
+# How long to wait for more rows before writing a batch.
+DEFAULT_FLUSH_SECONDS = 1.0
+# How long to wait for the queued rows to be written on close.
+DEFAULT_CLOSE_SECONDS = 5.0
+
+# How long to reuse the mixer and embeddings versions written with the rows.
+_VERSION_CACHE_SECONDS = 600
+
+_LOG_DROPPED_EVERY = 100
+
 
 def get_row_key(session_id, project_id):
   # The session_id starts with a rand to avoid hotspots.
@@ -68,23 +87,11 @@ def write_feedback(session_id: str, data: Dict):
   table.mutate_rows([row])
 
 
-async def write_row(session_info: Dict, data: Dict, ctr: Dict):
-  if not session_info.get('id', None):
-    return
-  table = current_app.config['NL_TABLE']
-  if not table:
-    return
-  project_id = get_project_id()
+def _make_row(table, project_id: str, version: Dict, session_info: Dict,
+              data: Dict, ctr: Dict):
   # The session_id starts with a rand to avoid hotspots.
   row_key = get_row_key(session_info['id'], project_id)
   row = table.direct_row(row_key)
-  mixer_version = dc.version()
-  version = {
-      'website_hash': os.environ.get("WEBSITE_HASH"),
-      'mixer_hash': mixer_version.get('gitHash', ''),
-      'table': mixer_version.get('tables', ''),
-      'embeddings': dc.nl_embeddings_version_map()
-  }
   # Rely on timestamp in BT server
   row.set_cell(_COLUMN_FAMILY, _COL_PROJECT.encode(), project_id)
   row.set_cell(_COLUMN_FAMILY, _COL_VERSION.encode(), json.dumps(version))
@@ -95,7 +102,159 @@ async def write_row(session_info: Dict, data: Dict, ctr: Dict):
     ctr['ERROR']['FAILED_unserializable_data_dict'] = f'{e}'
     row.set_cell(_COLUMN_FAMILY, _COL_DATA.encode(),
                  json.dumps({'FATAL': f'{e}'}))
-  table.mutate_rows([row])
+  return row
+
+
+def _get_version() -> Dict:
+  mixer_version = dc.version()
+  return {
+      'website_hash': os.environ.get("WEBSITE_HASH"),
+      'mixer_hash': mixer_version.get('gitHash', ''),
+      'table': mixer_version.get('tables', ''),
+      'embeddings': dc.nl_embeddings_version_map()
+  }
+
+
+class QueryLogger:
+  """Writes NL query rows to the table in the background.
+
+  Rows are queued by log(), which does not block, and a worker thread writes
+  them in batches, with one mutate_rows call per batch. When the queue is
+  full (e.g. the table is slow or unavailable), rows are dropped.
+  """
+
+  def __init__(self,
+               app,
+               table,
+               max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+               max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+               flush_seconds: float = DEFAULT_FLUSH_SECONDS):
+    self.app = app
+    self.table = table
+    self.max_queue_size = max_queue_size
+    self.max_batch_size = max_batch_size
+    self.flush_seconds = flush_seconds
+    self.num_dropped = 0
+    self._lock = threading.Lock()
+    self._queue = None
+    self._pid = None
+    # The version metadata, and when it was fetched.
+    self._version = None
+    self._version_time = 0
+    self._project_id = None
+
+  def log(self, session_info: Dict, data: Dict, ctr: Dict) -> bool:
+    """Queues a row for the query, and returns False if it was dropped."""
+    if not session_info.get('id', None):
+      return False
+    try:
+      self._get_queue().put_nowait((session_info, data, ctr))
+      return True
+    except queue.Full:
+      with self._lock:
+        self.num_dropped += 1
+        num_dropped = self.num_dropped
+      if num_dropped % _LOG_DROPPED_EVERY == 1:
+        logging.warning(f'Dropped {num_dropped} NL query log rows so far')
+      return False
+
+  def close(self, timeout: float = DEFAULT_CLOSE_SECONDS):
+    """Stops the worker thread once the rows queued so far are written.
+
+    Waits up to `timeout` seconds for that (e.g. the table may be unavailable),
+    and then drops the rows that are still queued.
+    """
+    with self._lock:
+      q = self._queue if self._pid == os.getpid() else None
+      self._queue = None
+      self._pid = None
+    if not q:
+      return
+    deadline = time.time() + timeout
+    done = threading.Event()
+    try:
+      q.put(done, timeout=timeout)
+      if done.wait(timeout=max(deadline - time.time(), 0)):
+        return
+    except queue.Full:
+      pass
+    num_dropped = 0
+    while True:
+      try:
+        item = q.get_nowait()
+      except queue.Empty:
+        break
+      if not isinstance(item, threading.Event):
+        num_dropped += 1
+    with self._lock:
+      self.num_dropped += num_dropped
+    logging.warning(f'Dropped {num_dropped} NL query log rows not written '
+                    f'within {timeout}s of closing')
+
+  def _get_queue(self) -> queue.Queue:
+    # The worker thread is started on first use, and again in a process forked
+    # after that (i.e. a gunicorn worker of the preloaded app), since threads
+    # do not survive a fork.
+    with self._lock:
+      if self._pid != os.getpid():
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, args=(self._queue,),
+                         daemon=True).start()
+        # Write the queued rows when the process exits.
+        atexit.register(self.close)
+      return self._queue
+
+  def _run(self, q: queue.Queue):
+    while True:
+      batch = []
+      closed = None
+      deadline = None
+      while len(batch) < self.max_batch_size:
+        # Wait as long as it takes for the first row of a batch.
+        remaining = deadline - time.time() if deadline else None
+        if remaining is not None and remaining <= 0:
+          break
+        try:
+          item = q.get(timeout=remaining)
+        except queue.Empty:
+          break
+        if isinstance(item, threading.Event):
+          closed = item
+          break
+        if not deadline:
+          deadline = time.time() + self.flush_seconds
+        batch.append(item)
+      self._write(batch)
+      if closed:
+        closed.set()
+        return
+
+  def _write(self, batch: List):
+    if not batch:
+      return
+    try:
+      with self.app.app_context():
+        version = self._get_version()
+        if self._project_id is None:
+          self._project_id = get_project_id()
+        rows = [
+            _make_row(self.table, self._project_id, version, session_info, data,
+                      ctr) for session_info, data, ctr in batch
+        ]
+        for status in self.table.mutate_rows(rows) or []:
+          if status.code != 0:
+            logging.error(f'Failed to write NL query log row: {status}')
+    except Exception as e:
+      logging.exception(f'Failed to write {len(batch)} NL query log rows: {e}')
+
+  def _get_version(self) -> Dict:
+    # The versions rarely change, so they are only fetched once in a while.
+    if (self._version is None or
+        time.time() - self._version_time > _VERSION_CACHE_SECONDS):
+      self._version = _get_version()
+      self._version_time = time.time()
+    return self._version
 
 
 def read_success_rows():
@@ -55,7 +55,12 @@ def post(url: str, req: Dict):
 
 @cache.cache.memoize(timeout=cache.TIMEOUT)
 def post_wrapper(url, req_str: str):
-  req = json.loads(req_str)
+  return post_uncached(url, json.loads(req_str))
+
+
+def post_uncached(url: str, req: Dict):
+  """Like post(), but always sends the request, e.g. for responses that
+  change more often than the cache timeout."""
   headers = {'Content-Type': 'application/json'}
   mixer_api_key = current_app.config.get('MIXER_API_KEY', '')
   if mixer_api_key:
@@ -331,14 +336,28 @@ def resolve(nodes, prop):
 
 def nl_search_sv(query, index_type):
   """Search sv from NL server."""
-  url = f'{current_app.config["NL_ROOT"]}/api/search_sv?q={query}&sz={index_type}'
-  return get(url)
+  return nl_search_sv_many([query], index_type)[0]
+
+
+def nl_search_sv_many(queries, index_type):
+  """Search svs for each of the queries from NL server, in one request."""
+  url = f'{current_app.config["NL_ROOT"]}/api/search_sv_batch/'
+  # Not cached, since the results change when the NL server swaps in new
+  # embeddings, and detections are cached (for less time) by the caller.
+  return post_uncached(url, {'queries': queries, 'sz': index_type})['results']
 
 
 def nl_detect_place_ner(query):
   """Detect places from NL server."""
-  url = f'{current_app.config["NL_ROOT"]}/api/search_places?q={query}'
-  return get(url).get('places', [])
+  return nl_detect_place_ner_many([query])[0]
+
+
+def nl_detect_place_ner_many(queries):
+  """Detect places in each of the queries from NL server, in one request."""
+  url = f'{current_app.config["NL_ROOT"]}/api/search_places_batch/'
+  return post_uncached(url, {
+      'queries': queries
+  }).get('places', [[] for _ in queries])
 
 
 def nl_embeddings_version_map():
@@ -0,0 +1,215 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import server.lib.disaster_dashboard as disaster_dashboard
+
+EVENT_1 = {
+    "eventId": "event1",
+    "startDate": "2020-01-01",
+    "affectedPlaces": ["Earth", "country/USA", "geoId/06"],
+    "magnitude": "M 5",
+}
+EVENT_2 = {
+    "eventId": "event2",
+    "startDate": "2020-01-20",
+    "affectedPlaces": ["Earth", "country/IND"],
+    "magnitude": "M10",
+}
+EVENT_3 = {
+    "eventId": "event3",
+    "startDate": "2020-03-05",
+    "affectedPlaces": ["Earth", "country/USA", "geoId/06", "geoId/06"],
+    "magnitude": "M 7",
+}
+EVENT_4 = {
+    "eventId": "event4",
+    "startDate": "2021-06-01",
+    "affectedPlaces": ["Earth", "country/USA"],
+    "magnitude": "unknown",
+}
+EVENT_5 = {
+    "eventId": "event5",
+    "startDate": "2021",
+    "affectedPlaces": ["Earth", "country/USA"],
+}
+TEST_DATA = {
+    "EarthquakeEvent": {
+        # Keys are intentionally out of order.
+        "2021-06": [EVENT_4],
+        "2020-03": [EVENT_3],
+        "2020-01": [EVENT_1, EVENT_2],
+        "2021": [EVENT_5],
+    }
+}
+
+
+class TestEventTypeIndex(unittest.TestCase):
+
+  def setUp(self):
+    self.index = disaster_dashboard.build_disaster_dashboard_index(
+        TEST_DATA)["EarthquakeEvent"]
+
+  def test_date_range(self):
+    self.assertEqual(self.index.query("Earth", "2020-01", "2020-12"),
+                     [EVENT_1, EVENT_2, EVENT_3])
+    self.assertEqual(self.index.query("Earth", "2020-02", "2021-12"),
+                     [EVENT_3, EVENT_4])
+    self.assertEqual(self.index.query("Earth", "2019-01", "2019-12"), [])
+
+  def test_place(self):
+    self.assertEqual(self.index.query("country/USA", "2020-01", "2021-12"),
+                     [EVENT_1, EVENT_3, EVENT_4])
+    self.assertEqual(self.index.query("geoId/06", "2020-02", "2021-12"),
+                     [EVENT_3])
+    self.assertEqual(self.index.query("country/IND", "2020-02", "2021-12"), [])
+    self.assertEqual(self.index.query("country/FRA", "2020-01", "2021-12"), [])
+
+  def test_filter(self):
+    self.assertEqual(
+        self.index.query("Earth", "2020-01", "2021-12", "magnitude", "M", 8, 1),
+        [EVENT_1, EVENT_3])
+    self.assertEqual(
+        self.index.query("country/USA", "2020-01", "2021-12", "magnitude", "M",
+                         float("inf"), 6), [EVENT_3])
+    self.assertEqual(
+        self.index.query("Earth", "2020-01", "2021-12", "depth", "km", 8, 1),
+        [])
+
+
+class TestDisasterDataLoader(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.data_dir = os.path.join(self.tmp_dir.name, "data")
+    os.makedirs(
+        os.path.join(self.data_dir, disaster_dashboard.DISASTER_DATA_FOLDER))
+    self.snapshot_dir = os.path.join(self.tmp_dir.name, "snapshots")
+    self._write("fire_event.json", [EVENT_1, EVENT_2])
+    self._write("flood_event.json", [EVENT_3])
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _write(self, file_name, events, mtime_ns=None):
+    path = os.path.join(self.data_dir, disaster_dashboard.DISASTER_DATA_FOLDER,
+                        file_name)
+    with open(path, "w") as f:
+      json.dump(events, f)
+    if mtime_ns:
+      os.utime(path, ns=(mtime_ns, mtime_ns))
+
+  def _loader(self, data_dir=None):
+    return disaster_dashboard.DisasterDataLoader(
+        disaster_dashboard.LocalEventSource(data_dir or self.data_dir),
+        self.snapshot_dir)
+
+  def _snapshots(self):
+    return [
+        f for f in os.listdir(self.snapshot_dir) if f.startswith("snapshot_")
+    ]
+
+  def test_load(self):
+    data = self._loader().load()
+    self.assertEqual(
+        data, {
+            "FireEvent": {
+                "2020-01": [EVENT_1, EVENT_2]
+            },
+            "FloodEvent": {
+                "2020-03": [EVENT_3]
+            }
+        })
+    snapshots = self._snapshots()
+    self.assertEqual(len(snapshots), 1)
+    self.assertTrue(snapshots[0].endswith(".json"))
+    self.assertEqual(os.stat(self.snapshot_dir).st_mode & 0o777, 0o700)
+
+  def test_load_from_snapshot(self):
+    expected = self._loader().load()
+    # Remove the source data, so the data can only come from the snapshot.
+    os.remove(
+        os.path.join(self.data_dir, disaster_dashboard.DISASTER_DATA_FOLDER,
+                     "fire_event.json"))
+    loader = self._loader()
+    self.assertEqual(loader.load(), expected)
+    # The refresh notices the removed file.
+    self.assertTrue(loader.refresh())
+    self.assertEqual(list(loader.data.keys()), ["FloodEvent"])
+
+  def test_refresh(self):
+    loader = self._loader()
+    loader.load()
+    self.assertFalse(loader.refresh())
+    self._write("flood_event.json", [EVENT_3, EVENT_4], mtime_ns=1)
+    self._write("drought_event.json", [EVENT_5])
+    self.assertTrue(loader.refresh())
+    self.assertEqual(loader.data["FloodEvent"], {
+        "2020-03": [EVENT_3],
+        "2021-06": [EVENT_4]
+    })
+    self.assertEqual(loader.data["DroughtEvent"], {"2021": [EVENT_5]})
+    self.assertEqual(loader.data["FireEvent"], {"2020-01": [EVENT_1, EVENT_2]})
+    # The snapshot has the refreshed data.
+    self.assertEqual(self._loader().load(), loader.data)
+
+  def test_snapshot_per_source(self):
+    self._loader().load()
+    other_dir = os.path.join(self.tmp_dir.name, "other")
+    os.makedirs(os.path.join(other_dir,
+                             disaster_dashboard.DISASTER_DATA_FOLDER))
+    # A different source doesn't use the snapshot of the first one.
+    self.assertEqual(self._loader(other_dir).load(), {})
+    self.assertEqual(len(self._snapshots()), 2)
+
+  def test_untrusted_snapshot_dir(self):
+    os.makedirs(self.snapshot_dir)
+    os.chmod(self.snapshot_dir, 0o777)
+    self._loader().load()
+    self.assertEqual(self._snapshots(), [])
+
+  def test_refresh_by_one_process(self):
+    app = Flask(__name__)
+    refresher = self._loader()
+    app.config['DISASTER_DASHBOARD_DATA'] = refresher.load()
+    # The refresh is run by hand below rather than by the thread.
+    mock_refresh = mock.Mock(return_value=False)
+    with mock.patch.object(refresher, 'refresh', mock_refresh):
+      stop = disaster_dashboard.start_background_refresh(app, refresher, 3600)
+      self.addCleanup(stop.set)
+      while not mock_refresh.called:
+        time.sleep(0.01)
+
+    # Another process sharing the snapshot dir doesn't refresh.
+    worker_app = Flask(__name__)
+    worker = self._loader()
+    worker_app.config['DISASTER_DASHBOARD_DATA'] = worker.load()
+    self.assertIsNone(
+        disaster_dashboard.start_background_refresh(worker_app, worker, 3600))
+
+    # But picks up the data refreshed by the first one.
+    self._write("flood_event.json", [EVENT_3, EVENT_4], mtime_ns=1)
+    self.assertTrue(refresher.refresh())
+    disaster_dashboard.sync_app_data(worker_app)
+    self.assertEqual(worker_app.config['DISASTER_DASHBOARD_DATA'],
+                     refresher.data)
+    self.assertIn('FloodEvent', worker_app.config['DISASTER_DASHBOARD_INDEX'])
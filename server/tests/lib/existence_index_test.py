@@ -0,0 +1,229 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import server.lib.existence_index as existence_index
+import server.lib.fetch as fetch
+
+# place -> stat var -> whether its series has a single data point
+PLACE_DATA = {
+    'geoId/06': {
+        'Count_Person': False,
+        'Count_Person_Female': False,
+        'Median_Age_Person': True,
+    },
+    'geoId/07': {
+        'Count_Person': False,
+    },
+    'geoId/08': {},
+}
+
+MIXER_TABLES = ['borgcron_base_cache_2023_06_01']
+
+
+class TestExistenceIndex(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.index = self._write_and_load(PLACE_DATA)
+    patcher = mock.patch('server.services.datacommons.version',
+                         return_value={'tables': MIXER_TABLES})
+    self.mock_version = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _write_and_load(self, place_data):
+    path = os.path.join(self.tmp_dir.name, 'existence_index.bin')
+    existence_index.write(path, place_data, MIXER_TABLES)
+    return existence_index.load(path)
+
+  def test_load_missing(self):
+    self.assertIsNone(existence_index.load(''))
+    self.assertIsNone(existence_index.load('/no/such/existence_index.bin'))
+
+  def test_existence(self):
+    self.assertEqual(
+        self.index.existence(
+            ['Count_Person', 'Median_Age_Person', 'Count_Unknown'],
+            ['geoId/06', 'geoId/07', 'geoId/08', 'geoId/09']), {
+                'Count_Person': {
+                    'geoId/06': True,
+                    'geoId/07': True,
+                    'geoId/08': False
+                },
+                'Median_Age_Person': {
+                    'geoId/06': True,
+                    'geoId/07': False,
+                    'geoId/08': False
+                },
+            })
+
+  def test_single_point(self):
+    self.assertEqual(
+        self.index.single_point(['Count_Person', 'Median_Age_Person'],
+                                ['geoId/06', 'geoId/07']), {
+                                    'Count_Person': {
+                                        'geoId/06': False,
+                                        'geoId/07': False
+                                    },
+                                    'Median_Age_Person': {
+                                        'geoId/06': True
+                                    },
+                                })
+
+  def test_many_places_and_variables(self):
+    rng = random.Random(0)
+    variables = [f'sv_{i}' for i in range(300)]
+    places = [f'geoId/{i}' for i in range(50)]
+    place_data = {
+        p: {
+            sv: rng.random() < 0.5
+            for sv in rng.sample(variables, rng.randint(0, len(variables)))
+        } for p in places
+    }
+    index = self._write_and_load(place_data)
+
+    got_existence = index.existence(variables, places)
+    got_single_point = index.single_point(variables, places)
+    for sv in variables:
+      for p in places:
+        if sv not in got_existence:
+          # Only in the index if some place has data for it.
+          self.assertFalse(any(sv in svs for svs in place_data.values()))
+          continue
+        self.assertEqual(got_existence[sv][p], sv in place_data[p])
+        if sv in place_data[p]:
+          self.assertEqual(got_single_point[sv][p], place_data[p][sv])
+        else:
+          self.assertNotIn(p, got_single_point.get(sv, {}))
+
+  def test_current(self):
+    app = Flask(__name__)
+    app.config['EXISTENCE_INDEX'] = self.index
+    with app.app_context():
+      self.assertIs(existence_index.current(), self.index)
+      # The mixer version is checked at most every _VERSION_CHECK_SECS.
+      self.mock_version.return_value = {'tables': ['other_cache']}
+      self.assertIs(existence_index.current(), self.index)
+      self.mock_version.assert_called_once()
+
+      # Once the mixer serves other tables, the index isn't used.
+      self.index._checked_at -= existence_index._VERSION_CHECK_SECS
+      self.assertIsNone(existence_index.current())
+
+      self.index._checked_at -= existence_index._VERSION_CHECK_SECS
+      self.mock_version.side_effect = ValueError('unavailable')
+      self.assertIsNone(existence_index.current())
+
+      self.index._checked_at -= existence_index._VERSION_CHECK_SECS
+      self.mock_version.side_effect = None
+      self.mock_version.return_value = {'tables': MIXER_TABLES}
+      self.assertIs(existence_index.current(), self.index)
+
+    app.config['EXISTENCE_INDEX'] = None
+    with app.app_context():
+      self.assertIsNone(existence_index.current())
+
+  def test_version_check_unlocked(self):
+
+    def version():
+      # Other callers aren't blocked while the version is fetched, and they use
+      # the last result rather than fetching it too.
+      self.assertFalse(self.index._lock.locked())
+      self.assertFalse(self.index.is_current())
+      return {'tables': MIXER_TABLES}
+
+    self.mock_version.side_effect = version
+    self.assertTrue(self.index.is_current())
+    self.mock_version.assert_called_once()
+    self.assertTrue(self.index.is_current())
+
+  def test_split(self):
+    self.assertEqual(self.index.split(['Count_Person'], ['geoId/06']), ([], []))
+    self.assertEqual(
+        self.index.split(['Count_Person', 'Count_Unknown'], ['geoId/06']),
+        (['Count_Unknown'], ['geoId/06']))
+    self.assertEqual(
+        self.index.split(['Count_Person'], ['geoId/06', 'geoId/09']),
+        (['Count_Person'], ['geoId/09']))
+
+  @mock.patch('server.services.datacommons.v2observation')
+  def test_observation_existence(self, mock_v2observation):
+    mock_v2observation.return_value = {
+        'byVariable': {
+            'Count_Person': {
+                'byEntity': {
+                    'geoId/09': {}
+                }
+            }
+        }
+    }
+    app = Flask(__name__)
+    app.config['EXISTENCE_INDEX'] = self.index
+    with app.app_context():
+      self.assertEqual(
+          fetch.observation_existence(['Count_Person', 'Median_Age_Person'],
+                                      ['geoId/07', 'geoId/09']), {
+                                          'Count_Person': {
+                                              'geoId/07': True,
+                                              'geoId/09': True
+                                          },
+                                          'Median_Age_Person': {
+                                              'geoId/07': False,
+                                              'geoId/09': False
+                                          },
+                                      })
+      # Only the place that is not indexed is fetched.
+      mock_v2observation.assert_called_once_with(
+          select=['variable', 'entity'],
+          entity={'dcids': ['geoId/09']},
+          variable={'dcids': ['Count_Person', 'Median_Age_Person']})
+
+      mock_v2observation.reset_mock()
+      fetch.observation_existence(['Count_Person'], ['geoId/06', 'geoId/07'])
+      mock_v2observation.assert_not_called()
+
+  @mock.patch('server.services.datacommons.v2observation')
+  def test_observation_existence_other_tables(self, mock_v2observation):
+    self.mock_version.return_value = {'tables': ['other_cache']}
+    mock_v2observation.return_value = {
+        'byVariable': {
+            'Count_Person': {
+                'byEntity': {
+                    'geoId/07': {}
+                }
+            }
+        }
+    }
+    app = Flask(__name__)
+    app.config['EXISTENCE_INDEX'] = self.index
+    with app.app_context():
+      self.assertEqual(
+          fetch.observation_existence(['Count_Person'],
+                                      ['geoId/06', 'geoId/07']),
+          {'Count_Person': {
+              'geoId/06': False,
+              'geoId/07': True
+          }})
+      mock_v2observation.assert_called_once_with(
+          select=['variable', 'entity'],
+          entity={'dcids': ['geoId/06', 'geoId/07']},
+          variable={'dcids': ['Count_Person']})
@@ -0,0 +1,119 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+import server.lib.hierarchy as hierarchy
+
+# child -> parent
+PARENTS = {
+    'bio/DOID_A': 'bio/DOID_B',
+    'bio/DOID_B': 'bio/DOID_4',
+    'bio/DOID_C': 'bio/DOID_B',
+    'bio/DOID_4': 'bio/DOID_ROOT',
+}
+NAMES = {
+    'bio/DOID_B': 'disease b',
+    'bio/DOID_4': 'disease',
+}
+
+
+def _multiple_property_values(nodes, props, out=True):
+  result = {}
+  for node in nodes:
+    result[node] = {
+        'specializationOf': [PARENTS[node]] if node in PARENTS else [],
+        'name': [NAMES[node]] if node in NAMES else [],
+    }
+  return result
+
+
+class TestHierarchy(unittest.TestCase):
+
+  @mock.patch('server.lib.fetch.multiple_property_values')
+  def test_ancestors(self, mock_values):
+    mock_values.side_effect = _multiple_property_values
+    diseases = hierarchy.Hierarchy('specializationOf')
+    expected = [('bio/DOID_B', 'disease b'), ('bio/DOID_4', 'disease')]
+
+    self.assertEqual(diseases.ancestors(['bio/DOID_A'], 'bio/DOID_4'),
+                     {'bio/DOID_A': expected})
+    # One request per level, rather than two.
+    self.assertEqual(mock_values.call_count, 3)
+
+    # Fully cached.
+    self.assertEqual(diseases.ancestors(['bio/DOID_A'], 'bio/DOID_4'),
+                     {'bio/DOID_A': expected})
+    self.assertEqual(mock_values.call_count, 3)
+
+    # Only the unseen node is fetched, and the rest of the path is cached.
+    self.assertEqual(
+        diseases.ancestors(['bio/DOID_C', 'bio/DOID_B'], 'bio/DOID_4'), {
+            'bio/DOID_C': expected,
+            'bio/DOID_B': expected[1:],
+        })
+    self.assertEqual(mock_values.call_count, 4)
+    mock_values.assert_called_with(['bio/DOID_C'], ['specializationOf', 'name'])
+
+    # Without a stop node, the walk goes to the root. Names default to dcids.
+    self.assertEqual(
+        diseases.ancestors(['bio/DOID_A'])['bio/DOID_A'][-1],
+        ('bio/DOID_ROOT', 'bio/DOID_ROOT'))
+
+  @mock.patch('server.lib.fetch.multiple_property_values')
+  def test_ancestors_batched(self, mock_values):
+    mock_values.side_effect = _multiple_property_values
+    diseases = hierarchy.Hierarchy('specializationOf')
+    result = diseases.ancestors(['bio/DOID_A', 'bio/DOID_C', 'bio/DOID_X'],
+                                'bio/DOID_4')
+    self.assertEqual(result['bio/DOID_A'], result['bio/DOID_C'])
+    self.assertEqual(result['bio/DOID_X'], [])
+    self.assertEqual(mock_values.call_count, 3)
+
+  @mock.patch.object(hierarchy, 'VARIABLES', hierarchy.Hierarchy())
+  @mock.patch('server.services.datacommons.get_variable_ancestors')
+  def test_variable_ancestors(self, mock_ancestors):
+    mock_ancestors.side_effect = lambda dcid: {
+        'Count_Person_Female': ['dc/g/Person_Gender', 'dc/g/Demographics'],
+    }[dcid]
+    self.assertEqual(hierarchy.variable_ancestors('Count_Person_Female'),
+                     ['dc/g/Person_Gender', 'dc/g/Demographics'])
+    # The ancestors of ancestors are cached too.
+    self.assertEqual(hierarchy.variable_ancestors('dc/g/Person_Gender'),
+                     ['dc/g/Demographics'])
+    self.assertEqual(hierarchy.variable_ancestors('Count_Person_Female'),
+                     ['dc/g/Person_Gender', 'dc/g/Demographics'])
+    self.assertEqual(mock_ancestors.call_count, 1)
+
+  def test_add_path_keeps_parent(self):
+    variables = hierarchy.Hierarchy()
+    variables.add_path(['sv', 'dc/g/A', 'dc/g/Root'])
+    # dc/g/A is also under dc/g/B, which must not change the cached path of sv.
+    variables.add_path(['dc/g/A', 'dc/g/B', 'dc/g/Root'])
+    self.assertEqual(variables.cached_path('sv'), ['dc/g/A', 'dc/g/Root'])
+    self.assertEqual(variables.cached_path('dc/g/B'), ['dc/g/Root'])
+
+  @mock.patch('time.monotonic')
+  def test_expiry(self, mock_time):
+    mock_time.return_value = 100
+    variables = hierarchy.Hierarchy(ttl_secs=60)
+    variables.add_path(['sv', 'dc/g/Root'])
+    mock_time.return_value = 150
+    self.assertEqual(variables.cached_path('sv'), ['dc/g/Root'])
+    mock_time.return_value = 161
+    self.assertIsNone(variables.cached_path('sv'))
+    # The cache is usable again after the reset.
+    variables.add_path(['sv', 'dc/g/Root'])
+    self.assertEqual(variables.cached_path('sv'), ['dc/g/Root'])
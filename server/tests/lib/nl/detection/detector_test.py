@@ -0,0 +1,105 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+import unittest
+from unittest import mock
+
+from flask import Flask
+from flask_caching import Cache
+
+from server.lib.nl.common.counters import Counters
+from server.lib.nl.detection import detector
+from server.lib.nl.detection import llm_fallback
+from server.lib.nl.detection.types import Detection
+from server.lib.nl.detection.types import LlmApiType
+from server.lib.nl.detection.types import PlaceDetectorType
+from server.lib.nl.detection.types import RequestedDetectorType
+
+
+def _heuristic_detect(place_detector_type, original_query, no_punct_query,
+                      index_type, debug_logs, counters):
+  debug_logs['sv_detection_query_input'] = no_punct_query
+  return Detection(original_query=original_query,
+                   cleaned_query=no_punct_query,
+                   places_detected=None,
+                   svs_detected=None,
+                   classifications=[])
+
+
+def _context(query):
+  return SimpleNamespace(query=query,
+                         llm_resp={},
+                         svs=['Count_Person'],
+                         places=[],
+                         insight_ctx={},
+                         prev_utterance=None)
+
+
+class TestDetectionCache(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config['PALM_API_KEY'] = 'key'
+    self.app.config['PALM_PROMPT_TEXT'] = 'prompt'
+    self.cache = Cache()
+    self.cache.init_app(self.app, {'CACHE_TYPE': 'SimpleCache'})
+    patcher = mock.patch.object(detector, 'cache', self.cache)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _detect(self, detector_type, query, prev_utterance=None):
+    debug_logs = {}
+    counters = Counters()
+    with self.app.app_context():
+      detection = detector.detect(detector_type, PlaceDetectorType.DC, query,
+                                  query.lower(), prev_utterance, 'medium_ft',
+                                  LlmApiType.Chat, debug_logs, counters)
+    return detection, debug_logs, counters.get()
+
+  @mock.patch.object(detector.heuristic_detector,
+                     'detect',
+                     side_effect=_heuristic_detect)
+  def test_heuristic(self, mock_detect):
+    heuristic = RequestedDetectorType.Heuristic.value
+    detection, debug_logs, _ = self._detect(heuristic, 'Population of  USA')
+    self.assertEqual(mock_detect.call_count, 1)
+
+    # Same query up to whitespace, and the context doesn't matter.
+    cached, cached_debug_logs, counters = self._detect(heuristic,
+                                                       ' Population of USA',
+                                                       _context('obesity'))
+    self.assertEqual(mock_detect.call_count, 1)
+    self.assertEqual(cached, detection)
+    self.assertEqual(cached_debug_logs, debug_logs)
+    self.assertEqual(counters['INFO'], {'info_detection_cache_hit': 1})
+
+    self._detect(heuristic, 'Population of Mexico')
+    self.assertEqual(mock_detect.call_count, 2)
+
+  @mock.patch.object(detector.llm_fallback,
+                     'need_llm',
+                     return_value=llm_fallback.NeedLLM.No)
+  @mock.patch.object(detector.heuristic_detector,
+                     'detect',
+                     side_effect=_heuristic_detect)
+  def test_hybrid_context(self, mock_detect, _):
+    hybrid = RequestedDetectorType.Hybrid.value
+    self._detect(hybrid, 'how about california', _context('obesity'))
+    self._detect(hybrid, 'how about california', _context('obesity'))
+    self.assertEqual(mock_detect.call_count, 1)
+
+    # A different context can change the LLM's detection.
+    self._detect(hybrid, 'how about california', _context('poverty'))
+    self.assertEqual(mock_detect.call_count, 2)
@@ -0,0 +1,157 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from server.lib.nl.common.counters import Counters
+from server.lib.nl.detection import heuristic_detector
+from server.lib.nl.detection import place
+from server.lib.nl.detection import variable
+from server.lib.nl.detection.types import ClassificationType
+from server.lib.nl.detection.types import PlaceDetection
+from server.lib.nl.detection.types import PlaceDetectorType
+
+
+def _place_detection_fn(query_without_places):
+
+  def detect_from_query_ner(cleaned_query, orig_query, debug_logs):
+    debug_logs['query_transformations'] = {
+        'place_detection_input': cleaned_query,
+        'place_detection_with_places_removed': query_without_places,
+    }
+    return PlaceDetection(query_original=orig_query,
+                          query_without_place_substr=query_without_places,
+                          query_places_mentioned=[],
+                          places_found=[],
+                          main_place=None)
+
+  return detect_from_query_ner
+
+
+def _detect_svs(query, index_type, debug_logs):
+  debug_logs['sv_detection_query_input'] = query
+  return {
+      'SV': [f'sv_for_{query}'],
+      'CosineScore': [0.9],
+      'SV_to_Sentences': {},
+      'MultiSV': {}
+  }
+
+
+class _DeferredExecutor:
+  """Runs the submitted calls only when `run` is called, or right away if
+  `run` was already called."""
+
+  def __init__(self, started=False):
+    self.started = started
+    self.calls = []
+
+  def submit(self, fn, *args):
+    future = Future()
+    self.calls.append((future, fn, args))
+    if self.started:
+      self.run()
+    return future
+
+  def run(self):
+    self.started = True
+    calls, self.calls = self.calls, []
+    for future, fn, args in calls:
+      if future.set_running_or_notify_cancel():
+        future.set_result(fn(*args))
+
+
+class TestDetect(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.executor = _DeferredExecutor(started=True)
+    patcher = mock.patch.object(heuristic_detector, '_SPECULATION_EXECUTOR',
+                                self.executor)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _detect(self, cleaned_query):
+    counters = Counters()
+    debug_logs = {}
+    with self.app.app_context():
+      detection = heuristic_detector.detect(PlaceDetectorType.NER,
+                                            cleaned_query, cleaned_query,
+                                            'medium_ft', debug_logs, counters)
+    return detection, debug_logs, counters.get()
+
+  @mock.patch.object(variable, 'detect_svs', side_effect=_detect_svs)
+  @mock.patch.object(place,
+                     'detect_from_query_ner',
+                     side_effect=_place_detection_fn('top states by income'))
+  def test_speculation_hit(self, _, mock_detect_svs):
+    detection, debug_logs, counters = self._detect('top states by income')
+
+    mock_detect_svs.assert_called_once()
+    self.assertEqual(detection.svs_detected.single_sv.svs,
+                     ['sv_for_top states by income'])
+    self.assertEqual(
+        debug_logs['query_transformations']['sv_detection_query_input'],
+        'top states by income')
+    self.assertIn(ClassificationType.RANKING,
+                  [c.type for c in detection.classifications])
+    self.assertEqual(counters['INFO']['heuristic_detector_speculation_hits'], 1)
+    for stage in ['place_detection', 'sv_detection', 'classification']:
+      self.assertIn(f'heuristic_detector_{stage}', counters['TIMING'])
+
+  @mock.patch.object(variable, 'detect_svs', side_effect=_detect_svs)
+  @mock.patch.object(place,
+                     'detect_from_query_ner',
+                     side_effect=_place_detection_fn('income'))
+  def test_speculation_miss(self, _, mock_detect_svs):
+    detection, debug_logs, counters = self._detect('income in california')
+
+    # Speculatively with the original query, then with places removed.
+    self.assertEqual([c.args[0] for c in mock_detect_svs.call_args_list],
+                     ['income in california', 'income'])
+    self.assertEqual(detection.svs_detected.single_sv.svs, ['sv_for_income'])
+    self.assertEqual(
+        debug_logs['query_transformations']['sv_detection_query_input'],
+        'income')
+    self.assertEqual(counters['INFO']['heuristic_detector_speculation_misses'],
+                     1)
+    for step in ['sv_detection', 'classification']:
+      self.assertEqual(
+          counters['INFO'][f'heuristic_detector_speculative_{step}_wasted'], 1)
+      self.assertIn(f'heuristic_detector_speculative_{step}_wasted',
+                    counters['TIMING'])
+
+  @mock.patch.object(variable, 'detect_svs', side_effect=_detect_svs)
+  @mock.patch.object(place,
+                     'detect_from_query_ner',
+                     side_effect=_place_detection_fn('income'))
+  def test_speculation_miss_cancels(self, _, mock_detect_svs):
+    self.executor.started = False
+    detection, _, counters = self._detect('income in california')
+
+    # The speculative SV detection did not start before the miss, so only
+    # runs with places removed.
+    mock_detect_svs.assert_called_once()
+    self.assertEqual(mock_detect_svs.call_args.args[0], 'income')
+    self.assertEqual(detection.svs_detected.single_sv.svs, ['sv_for_income'])
+    for step in ['sv_detection', 'classification']:
+      self.assertEqual(
+          counters['INFO'][f'heuristic_detector_speculative_{step}_cancelled'],
+          1)
+    self.executor.run()
+    mock_detect_svs.assert_called_once()
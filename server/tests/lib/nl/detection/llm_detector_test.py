@@ -12,17 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from types import SimpleNamespace
 import unittest
+from unittest import mock
 
+from flask import Flask
+from flask_caching import Cache
 from parameterized import parameterized
 
+from server.lib.nl.common.counters import Counters
 from server.lib.nl.detection import llm_detector
+from server.lib.nl.detection.llm_prompt import Prompts
 from server.lib.nl.detection.types import ClassificationType
 from server.lib.nl.detection.types import ContainedInClassificationAttributes
 from server.lib.nl.detection.types import ContainedInPlaceType
 from server.lib.nl.detection.types import CorrelationClassificationAttributes
 from server.lib.nl.detection.types import EventClassificationAttributes
 from server.lib.nl.detection.types import EventType
+from server.lib.nl.detection.types import LlmApiType
 from server.lib.nl.detection.types import NLClassifier
 from server.lib.nl.detection.types import QCmpType
 from server.lib.nl.detection.types import Quantity
@@ -33,6 +40,7 @@ from server.lib.nl.detection.types import SuperlativeClassificationAttributes
 from server.lib.nl.detection.types import SuperlativeType
 from server.lib.nl.detection.types import TimeDeltaClassificationAttributes
 from server.lib.nl.detection.types import TimeDeltaType
+from server.tests.lib.nl.detection.palm_stub import PalmStub
 
 
 class TestMergeSV(unittest.TestCase):
@@ -213,3 +221,87 @@ class TestBuildClassifications(unittest.TestCase):
     self.maxDiff = None
     got = llm_detector._build_classifications(llm_resp, filter_type)
     self.assertEqual(got, want)
+
+
+@mock.patch.object(llm_detector.variable, 'detect_svs_many', return_value=[])
+@mock.patch.object(llm_detector.place, 'detect_from_names', return_value=None)
+class TestLLMCache(unittest.TestCase):
+
+  def setUp(self):
+    self.stub = PalmStub().__enter__()
+    self.addCleanup(self.stub.__exit__)
+    self.app = Flask(__name__)
+    self.app.config['PALM_API_KEY'] = 'key'
+    self.app.config['PALM_API_URL_BASE'] = self.stub.url
+    self.app.config['PALM_PROMPT_TEXT'] = Prompts(detection_chat='chat',
+                                                  detection_text='text')
+    self.cache = Cache()
+    self.cache.init_app(self.app, {'CACHE_TYPE': 'SimpleCache'})
+    patcher = mock.patch.object(llm_detector, 'cache', self.cache)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _detect(self, query, prev_utterance=None):
+    ctr = Counters()
+    with self.app.app_context():
+      detection = llm_detector.detect(query, prev_utterance, 'medium_ft',
+                                      LlmApiType.Chat, {}, ctr)
+    return detection, ctr.get()
+
+  def _check_safety(self, query, llm_api_type=LlmApiType.Chat):
+    ctr = Counters()
+    with self.app.app_context():
+      is_safe = llm_detector.check_safety(query, llm_api_type, ctr)
+    return is_safe, ctr.get()
+
+  def test_detect(self, *_):
+    resp = {'PLACES': ['California'], 'METRICS': ['obesity']}
+    self.stub.set_response(resp)
+    detection, _ = self._detect('obesity in  california')
+    self.assertEqual(detection.llm_resp, resp)
+    self.assertEqual(len(self.stub.requests), 1)
+
+    detection, counters = self._detect(' obesity in california')
+    self.assertEqual(detection.llm_resp, resp)
+    self.assertEqual(len(self.stub.requests), 1)
+    self.assertEqual(counters['INFO']['info_llm_detection_cache_hit'], 1)
+
+    # The same request answers the safety check.
+    is_safe, counters = self._check_safety('obesity in california')
+    self.assertTrue(is_safe)
+    self.assertEqual(len(self.stub.requests), 1)
+    self.assertEqual(counters['INFO'], {'info_llm_safety_cache_hit': 1})
+
+    # But not a follow up query.
+    prev = SimpleNamespace(query='obesity in california',
+                           llm_resp=resp,
+                           prev_utterance=None)
+    self._detect('obesity in california', prev)
+    self.assertEqual(len(self.stub.requests), 2)
+
+  def test_check_safety(self, *_):
+    self.stub.set_response({'UNSAFE': True})
+    self.assertFalse(self._check_safety('bad query')[0])
+    self.assertFalse(self._check_safety('bad query')[0])
+    self.assertEqual(len(self.stub.requests), 1)
+
+    # The detection is blocked without another call.
+    detection, _ = self._detect('bad query')
+    self.assertIsNone(detection)
+    self.assertEqual(len(self.stub.requests), 1)
+
+    # The API type is part of the key.
+    self._check_safety('bad query', LlmApiType.Text)
+    self.assertEqual(len(self.stub.requests), 2)
+
+    # So is the prompt.
+    self.app.config['PALM_PROMPT_TEXT'] = Prompts(detection_chat='new chat',
+                                                  detection_text='text')
+    self._check_safety('bad query')
+    self.assertEqual(len(self.stub.requests), 3)
+
+  def test_failure_not_cached(self, *_):
+    self.stub.content = None
+    self.assertTrue(self._check_safety('obesity in california')[0])
+    self.assertTrue(self._check_safety('obesity in california')[0])
+    self.assertEqual(len(self.stub.requests), 2)
@@ -13,11 +13,15 @@
 # limitations under the License.
 
 import unittest
+from unittest import mock
 
+from flask import Flask
 from parameterized import parameterized
 
 from server.lib.nl.common.counters import Counters
 from server.lib.nl.detection import palm_api
+from server.lib.nl.detection.llm_prompt import Prompts
+from server.tests.lib.nl.detection.palm_stub import PalmStub
 
 _INPUT1 = """
 ```
@@ -119,3 +123,50 @@ class TestParseResponse(unittest.TestCase):
     response = {'candidates': [], 'filters': [{'reason': 'OTHER'}]}
     got = palm_api.parse_response('', response, 'output', Counters())
     self.assertEqual(got, {'UNSAFE': True})
+
+
+class TestClient(unittest.TestCase):
+
+  def setUp(self):
+    self.stub = PalmStub().__enter__()
+    self.addCleanup(self.stub.__exit__)
+    self.app = Flask(__name__)
+    self.app.config['PALM_API_KEY'] = 'key'
+    self.app.config['PALM_API_URL_BASE'] = self.stub.url
+    self.app.config['PALM_PROMPT_TEXT'] = Prompts(detection_chat='chat',
+                                                  detection_text='text')
+
+  def test_pooled(self):
+    self.stub.set_response({'PLACES': ['California']})
+    history = [['obesity in USA', {'METRICS': ['obesity']}]]
+    with self.app.app_context():
+      for _ in range(3):
+        got = palm_api.detect_via_chat('how about california', history,
+                                       Counters())
+        self.assertEqual(got, {'PLACES': ['California']})
+        got = palm_api.detect_via_text('how about california', history,
+                                       Counters())
+        self.assertEqual(got, {'PLACES': ['California']})
+
+    self.assertEqual(len(self.stub.requests), 6)
+    # The connection is reused across calls.
+    self.assertEqual(self.stub.num_connections, 1)
+    # The request template isn't modified across calls.
+    self.assertEqual(len(self.stub.requests[-2]['prompt']['examples']), 1)
+
+  def test_error(self):
+    self.stub.content = None
+    ctr = Counters()
+    with self.app.app_context():
+      got = palm_api.detect_via_chat('obesity in USA', [], ctr)
+    self.assertEqual(got, {})
+    self.assertIn('failed_palm_api_empty', ctr.get()['ERROR'])
+
+  @mock.patch.object(palm_api, '_API_TIMEOUT', (1, 0.1))
+  def test_timeout(self):
+    self.stub.delay = 0.5
+    ctr = Counters()
+    with self.app.app_context():
+      got = palm_api.detect_via_text('obesity in USA', [], ctr)
+    self.assertEqual(got, {})
+    self.assertIn('failed_palm_api_timeout', ctr.get()['ERROR'])
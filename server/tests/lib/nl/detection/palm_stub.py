@@ -0,0 +1,93 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A local stub of the PaLM API, for tests."""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import threading
+import time
+from typing import Dict, List
+
+
+class PalmStub:
+  """Serves a canned response to every PaLM API call on a local port.
+
+  Usage:
+    with PalmStub() as stub:
+      app.config['PALM_API_URL_BASE'] = stub.url
+      stub.set_response(...)
+  """
+
+  def __init__(self):
+    # The content of the candidate in the response, or None to respond with
+    # an error.
+    self.content: str = '{}'
+    # The number of seconds to wait before responding.
+    self.delay: float = 0
+    # The JSON bodies of the requests received.
+    self.requests: List[Dict] = []
+    # The number of connections opened by clients.
+    self.num_connections = 0
+
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def setup(self):
+        super().setup()
+        stub.num_connections += 1
+
+      def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        stub.requests.append(json.loads(body))
+        if stub.delay:
+          time.sleep(stub.delay)
+        if stub.content is None:
+          status, resp = 500, {'error': {'code': 500}}
+        else:
+          # The chat API responds with 'content' and the text API with
+          # 'output'.
+          field = 'content' if 'generateMessage' in self.path else 'output'
+          status, resp = 200, {'candidates': [{field: stub.content}]}
+        data = json.dumps(resp).encode('utf-8')
+        try:
+          self.send_response(status)
+          self.send_header('Content-Type', 'application/json')
+          self.send_header('Content-Length', str(len(data)))
+          self.end_headers()
+          self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+          # The client timed out.
+          pass
+
+      def log_message(self, format, *args):
+        pass
+
+    self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self._server.daemon_threads = True
+    self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+
+  def set_response(self, resp: Dict):
+    """Responds with `resp` as the JSON in the candidate's content."""
+    self.content = '```\n' + json.dumps(resp) + '\n```'
+
+  def __enter__(self):
+    threading.Thread(target=self._server.serve_forever, daemon=True).start()
+    return self
+
+  def __exit__(self, *args):
+    self._server.shutdown()
+    self._server.server_close()
@@ -0,0 +1,162 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+import unittest
+from unittest.mock import call
+from unittest.mock import patch
+
+from server.lib.nl.common import utils
+from server.lib.nl.common.counters import Counters
+from server.lib.nl.detection.types import ContainedInPlaceType
+from server.lib.nl.detection.types import Place
+from server.lib.nl.fulfillment import base
+from server.lib.nl.fulfillment import existence
+from server.lib.nl.fulfillment.types import ChartVars
+from server.lib.nl.fulfillment.types import PopulateState
+
+# SV -> Place -> is-single-point
+_EXISTENCE = {
+    'Count_Person': {
+        'geoId/06': False,
+        'country/USA': False
+    },
+    'Median_Age_Person': {
+        'country/USA': True
+    },
+    'Count_Person_Female': {
+        'geoId/06': False
+    },
+}
+
+
+def _sv_existence(places, svs, counters):
+  existing_svs = {}
+  existsv2places = {}
+  for sv in svs:
+    for pl, single_point in _EXISTENCE.get(sv, {}).items():
+      if pl in places:
+        existing_svs[sv] = existing_svs.get(sv, False) | single_point
+        existsv2places.setdefault(sv, {})[pl] = single_point
+  return existing_svs, existsv2places
+
+
+def _state():
+  return PopulateState(uttr=SimpleNamespace(counters=Counters()))
+
+
+@patch.object(utils,
+              'sv_existence_for_places_check_single_point',
+              side_effect=_sv_existence)
+class TestExistenceChecks(unittest.TestCase):
+
+  def test_main_and_extension(self, mock_sv_existence):
+    state = _state()
+    place2keys = {'geoId/06': 'geoId/06'}
+    main = existence.MainExistenceCheckTracker(
+        state, place2keys, {
+            'Count_Person': [ChartVars(svs=['Count_Person'])],
+            'Median_Age_Person': [ChartVars(svs=['Median_Age_Person'])],
+        })
+    main.perform_existence_check()
+    self.assertEqual(main.existing_svs, {'Count_Person': False})
+
+    ext = existence.ExtensionExistenceCheckTracker(
+        state, place2keys, ['Count_Person'],
+        {'Count_Person': ['Count_Person', 'Count_Person_Female']})
+    ext.perform_existence_check()
+    self.assertEqual(ext.existing_svs, {
+        'Count_Person': False,
+        'Count_Person_Female': False
+    })
+
+    # The extension check only fetches the SV that was not checked.
+    self.assertEqual(mock_sv_existence.call_args_list, [
+        call(['geoId/06'], ['Count_Person', 'Median_Age_Person'],
+             state.uttr.counters),
+        call(['geoId/06'], ['Count_Person_Female'], state.uttr.counters),
+    ])
+    self.assertEqual(
+        state.exist_checks, {
+            'Count_Person': {
+                'geoId/06': False
+            },
+            'Count_Person_Female': {
+                'geoId/06': False
+            }
+        })
+
+  def test_prefetch_fallback(self, mock_sv_existence):
+    state = _state()
+    svs = ['Count_Person', 'Median_Age_Person']
+    existence.prefetch_existence(state, ['geoId/06', 'country/USA'], svs)
+
+    self.assertEqual(existence.check_existence(state, ['geoId/06'], svs), ({
+        'Count_Person': False
+    }, {
+        'Count_Person': {
+            'geoId/06': False
+        }
+    }))
+    # Falling back to the parent place is answered from the prefetch.
+    self.assertEqual(existence.check_existence(state, ['country/USA'], svs), ({
+        'Count_Person': False,
+        'Median_Age_Person': True
+    }, {
+        'Count_Person': {
+            'country/USA': False
+        },
+        'Median_Age_Person': {
+            'country/USA': True
+        }
+    }))
+    self.assertEqual(mock_sv_existence.call_count, 1)
+
+
+_SANTA_CLARA = Place(dcid='geoId/06085',
+                     name='Santa Clara County',
+                     place_type='County',
+                     country='country/USA')
+
+
+@patch.object(utils, 'get_immediate_parent_places')
+class TestFallbackPlaces(unittest.TestCase):
+
+  def test_parent_place(self, mock_parent_places):
+    mock_parent_places.return_value = [
+        Place(dcid='geoId/06', name='California', place_type='State')
+    ]
+    state = _state()
+    self.assertEqual(base._get_fallback_place_dcids(state, [_SANTA_CLARA]),
+                     ['geoId/06'])
+    # The fallback reuses the parent places looked up for the prefetch.
+    self.assertEqual(
+        base._get_parent_places(state, _SANTA_CLARA.dcid,
+                                ContainedInPlaceType.STATE),
+        mock_parent_places.return_value)
+    mock_parent_places.assert_called_once_with('geoId/06085',
+                                               ContainedInPlaceType.STATE,
+                                               state.uttr.counters)
+
+  def test_child_place_type(self, mock_parent_places):
+    state = _state()
+    state.place_type = ContainedInPlaceType.CITY
+    self.assertEqual(base._get_fallback_place_dcids(state, [_SANTA_CLARA]), [])
+    mock_parent_places.assert_not_called()
+
+  def test_super_national(self, mock_parent_places):
+    africa = Place(dcid='africa', name='Africa', place_type='Continent')
+    self.assertEqual(base._get_fallback_place_dcids(_state(), [africa]),
+                     ['Earth'])
+    mock_parent_places.assert_not_called()
@@ -45,11 +45,32 @@ class TestPlaceDetector(unittest.TestCase):
           ["berkeley", "mountain view"], ["berkeley"]
       ],
   ])
-  @patch.object(dc, 'nl_detect_place_ner')
+  @patch.object(dc, 'nl_detect_place_ner_many')
   def test_heuristic_detection(self, query_str, expected, api_response,
-                               mock_detect_place_ner):
-    mock_detect_place_ner.return_value = api_response
+                               mock_detect_place_ner_many):
+    mock_detect_place_ner_many.side_effect = lambda queries: [
+        api_response for _ in queries
+    ]
 
     # Covert all detected place string to lower case.
     got = [s.lower() for s in place._detect_places(query_str)]
     self.assertEqual(expected, got)
+    # All the query variants are sent in a single request.
+    mock_detect_place_ner_many.assert_called_once()
+
+  @patch.object(dc, 'nl_detect_place_ner_many')
+  def test_heuristic_detection_failed_version(self, mock_detect_place_ner_many):
+
+    def detect_place_ner_many(queries):
+      # Fails for the lower case version of the query.
+      if 'tell me about chicago' in queries:
+        raise ValueError('Failed to detect places')
+      return [['chicago'] for _ in queries]
+
+    mock_detect_place_ner_many.side_effect = detect_place_ner_many
+
+    got = [s.lower() for s in place._detect_places('Tell me about Chicago')]
+    self.assertEqual(got, ['chicago'])
+    # The batch, then each version on its own.
+    calls = [c.args[0] for c in mock_detect_place_ner_many.call_args_list]
+    self.assertEqual(calls[1:], [[q] for q in calls[0]])
@@ -0,0 +1,140 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+import server.lib.protein_graph as protein_graph
+
+INTERACTORS = {
+    'bio/P53_HUMAN': ['bio/P53_HUMAN_CBP_HUMAN', 'bio/P53_HUMAN_MDM2_HUMAN'],
+    'bio/CBP_HUMAN': ['bio/P53_HUMAN_CBP_HUMAN'],
+    'bio/MDM2_HUMAN': [],
+}
+SCORES = {
+    'bio/P53_HUMAN_CBP_HUMAN': ['IntactMiScore0.9', 'AuthorScore3.0'],
+    'bio/P53_HUMAN_MDM2_HUMAN': ['IntactMiScore0.5'],
+}
+
+
+def _score(score_list):
+  for score in score_list:
+    if score.startswith('IntactMiScore'):
+      return float(score.replace('IntactMiScore', ''))
+  return -1
+
+
+def _property_values(nodes, prop, out=True):
+  if prop == 'interactingProtein':
+    return {n: INTERACTORS[n] for n in nodes if n in INTERACTORS}
+  return {n: SCORES[n] for n in nodes if n in SCORES}
+
+
+class TestInteractionGraph(unittest.TestCase):
+
+  @mock.patch('server.lib.fetch.property_values')
+  def test_interactors(self, mock_property_values):
+    mock_property_values.side_effect = _property_values
+    graph = protein_graph.InteractionGraph(_score)
+
+    expected = {
+        'bio/P53_HUMAN': [('bio/P53_HUMAN_CBP_HUMAN', 0.9),
+                          ('bio/P53_HUMAN_MDM2_HUMAN', 0.5)],
+    }
+    self.assertEqual(graph.interactors(['bio/P53_HUMAN']), expected)
+    # One request for the interactors and one for the scores.
+    self.assertEqual(mock_property_values.call_count, 2)
+
+    # Cached proteins are not fetched again.
+    self.assertEqual(graph.interactors(['bio/P53_HUMAN']), expected)
+    self.assertEqual(mock_property_values.call_count, 2)
+
+    # Only the missing proteins of a frontier are fetched, in one batch.
+    result = graph.interactors(
+        ['bio/MDM2_HUMAN', 'bio/P53_HUMAN', 'bio/CBP_HUMAN', 'bio/MDM2_HUMAN'])
+    self.assertEqual(mock_property_values.call_count, 4)
+    mock_property_values.assert_any_call(['bio/MDM2_HUMAN', 'bio/CBP_HUMAN'],
+                                         'interactingProtein', False)
+    self.assertEqual(
+        result, {
+            'bio/MDM2_HUMAN': [],
+            'bio/P53_HUMAN': expected['bio/P53_HUMAN'],
+            'bio/CBP_HUMAN': [('bio/P53_HUMAN_CBP_HUMAN', 0.9)],
+        })
+    self.assertEqual(list(result.keys()),
+                     ['bio/MDM2_HUMAN', 'bio/P53_HUMAN', 'bio/CBP_HUMAN'])
+
+  @mock.patch('server.lib.fetch.property_values')
+  def test_evict_when_full(self, mock_property_values):
+    mock_property_values.side_effect = _property_values
+    graph = protein_graph.InteractionGraph(_score, max_proteins=4)
+    graph.interactors(['bio/P53_HUMAN', 'bio/CBP_HUMAN'])
+    graph.interactors(['bio/MDM2_HUMAN', 'bio/P53_HUMAN'])
+    self.assertEqual(mock_property_values.call_count, 3)
+    # Adding two more proteins evicts the least recently used half of the
+    # cache, which drops CBP but keeps P53 since it was used last.
+    graph.interactors(['bio/A_HUMAN', 'bio/B_HUMAN'])
+    self.assertEqual(mock_property_values.call_count, 4)
+    self.assertEqual(
+        graph.interactors(['bio/P53_HUMAN'])['bio/P53_HUMAN'][0],
+        ('bio/P53_HUMAN_CBP_HUMAN', 0.9))
+    self.assertEqual(mock_property_values.call_count, 4)
+    self.assertEqual(graph.interactors(['bio/CBP_HUMAN']),
+                     {'bio/CBP_HUMAN': [('bio/P53_HUMAN_CBP_HUMAN', 0.9)]})
+    self.assertEqual(mock_property_values.call_count, 6)
+
+  @mock.patch('time.monotonic')
+  @mock.patch('server.lib.fetch.property_values')
+  def test_expiry(self, mock_property_values, mock_time):
+    mock_property_values.side_effect = _property_values
+    mock_time.return_value = 100
+    graph = protein_graph.InteractionGraph(_score, max_proteins=1, ttl_secs=60)
+    graph.interactors(['bio/P53_HUMAN'])
+    mock_time.return_value = 159
+    graph.interactors(['bio/P53_HUMAN'])
+    self.assertEqual(mock_property_values.call_count, 2)
+
+    # The protein is fetched again once expired, and its old row is dropped.
+    mock_time.return_value = 160
+    expected = {
+        'bio/P53_HUMAN': [('bio/P53_HUMAN_CBP_HUMAN', 0.9),
+                          ('bio/P53_HUMAN_MDM2_HUMAN', 0.5)],
+    }
+    self.assertEqual(graph.interactors(['bio/P53_HUMAN']), expected)
+    self.assertEqual(mock_property_values.call_count, 4)
+    self.assertEqual(graph._num_rows(), 1)
+    self.assertEqual(graph.interactors(['bio/P53_HUMAN']), expected)
+    self.assertEqual(mock_property_values.call_count, 4)
+
+  @mock.patch('server.lib.fetch.property_values')
+  def test_unscored(self, mock_property_values):
+    mock_property_values.side_effect = lambda nodes, prop, out=True: {
+        'interactingProtein': {
+            'bio/P53_HUMAN':
+                ['bio/P53_HUMAN_CBP_HUMAN', 'bio/P53_HUMAN_MDM2_HUMAN']
+        },
+        'confidenceScore': {
+            'bio/P53_HUMAN_CBP_HUMAN': []
+        },
+    }[prop]
+    graph = protein_graph.InteractionGraph(_score)
+    expected = {
+        # An interaction with no score values gets the score of an empty
+        # list, and one without score nodes has no score at all.
+        'bio/P53_HUMAN': [('bio/P53_HUMAN_CBP_HUMAN', -1),
+                          ('bio/P53_HUMAN_MDM2_HUMAN', None)],
+    }
+    self.assertEqual(graph.interactors(['bio/P53_HUMAN']), expected)
+    # Also when read from the cache.
+    self.assertEqual(graph.interactors(['bio/P53_HUMAN']), expected)
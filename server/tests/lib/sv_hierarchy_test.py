@@ -0,0 +1,155 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+import server.lib.sv_hierarchy as sv_hierarchy
+
+SVG_INFO = {
+    'dc/g/Root': {
+        'absoluteName':
+            'Data Commons Variables',
+        'childStatVarGroups': [{
+            'id': 'dc/g/Demographics',
+            'specializedEntity': 'Demographics',
+            'displayName': 'Demographics',
+            'descendentStatVarCount': 3
+        }, {
+            'id': 'dc/g/Economy',
+            'specializedEntity': 'Economy',
+            'displayName': 'Economy',
+            'descendentStatVarCount': 1
+        }]
+    },
+    'dc/g/Demographics': {
+        'absoluteName':
+            'Demographics',
+        'childStatVars': [{
+            'id': 'Count_Person',
+            'displayName': 'Population',
+            'hasData': True
+        }],
+        'childStatVarGroups': [{
+            'id': 'dc/g/Person_Gender',
+            'specializedEntity': 'Gender',
+            'displayName': 'Population By Gender',
+            'descendentStatVarCount': 2
+        }]
+    },
+    'dc/g/Person_Gender': {
+        'absoluteName':
+            'Person With Gender',
+        'childStatVars': [{
+            'id': 'Count_Person_Female',
+            'displayName': 'Female Population',
+            'hasData': True
+        }, {
+            'id': 'Count_Person_Male',
+            'displayName': 'Male Population',
+            'hasData': True
+        }]
+    },
+    'dc/g/Economy': {
+        'absoluteName':
+            'Economy',
+        'childStatVars': [{
+            'id': 'Amount_EconomicActivity_GDP',
+            'displayName': 'GDP',
+            'hasData': True
+        }]
+    },
+}
+
+ENTITY_VARIABLES = {
+    'Count_Person': {
+        'geoId/06': {},
+        'geoId/07': {},
+    },
+    'Count_Person_Female': {
+        'geoId/06': {},
+    },
+    'Amount_EconomicActivity_GDP': {
+        'geoId/06': {},
+        'geoId/07': {},
+    },
+    'Count_NotInHierarchy': {
+        'geoId/07': {},
+    },
+}
+
+
+def _entity_variables(entities):
+  result = {}
+  for sv, sv_entities in ENTITY_VARIABLES.items():
+    result[sv] = {e: {} for e in sv_entities if e in entities}
+  return result
+
+
+class TestStatVarHierarchy(unittest.TestCase):
+
+  def setUp(self):
+    self.hierarchy = sv_hierarchy.StatVarHierarchy(SVG_INFO)
+
+  @mock.patch('server.lib.fetch.entity_variables')
+  def test_unconstrained(self, mock_entity_variables):
+    self.assertEqual(self.hierarchy.info('dc/g/Root', [], 0),
+                     SVG_INFO['dc/g/Root'])
+    self.assertIsNone(self.hierarchy.info('dc/g/Unknown', [], 0))
+    mock_entity_variables.assert_not_called()
+
+  @mock.patch('server.lib.fetch.entity_variables')
+  def test_constrained(self, mock_entity_variables):
+    mock_entity_variables.side_effect = _entity_variables
+
+    result = self.hierarchy.info('dc/g/Root', ['geoId/06'], 1)
+    self.assertEqual(
+        [svg['descendentStatVarCount'] for svg in result['childStatVarGroups']],
+        [2, 1])
+    result = self.hierarchy.info('dc/g/Person_Gender', ['geoId/06'], 1)
+    self.assertEqual([sv['hasData'] for sv in result['childStatVars']],
+                     [True, False])
+    # The snapshot is not modified.
+    self.assertEqual(
+        SVG_INFO['dc/g/Person_Gender']['childStatVars'][1]['hasData'], True)
+
+    result = self.hierarchy.info('dc/g/Root', ['geoId/06', 'geoId/07'], 2)
+    self.assertEqual(
+        [svg['descendentStatVarCount'] for svg in result['childStatVarGroups']],
+        [1, 1])
+    result = self.hierarchy.info('dc/g/Person_Gender', ['geoId/07', 'geoId/06'],
+                                 1)
+    self.assertEqual([sv['hasData'] for sv in result['childStatVars']],
+                     [True, False])
+    # Each place is only fetched once.
+    self.assertEqual(mock_entity_variables.call_count, 2)
+    mock_entity_variables.assert_called_with(['geoId/07'])
+
+  @mock.patch('server.lib.fetch.entity_variables')
+  def test_entity_without_data(self, mock_entity_variables):
+    mock_entity_variables.side_effect = _entity_variables
+    self.assertIsNone(
+        self.hierarchy.info('dc/g/Root', ['geoId/06', 'dc/s/Source'], 2))
+
+  @mock.patch('server.lib.fetch.entity_variables')
+  def test_more_entities_required_than_requested(self, mock_entity_variables):
+    mock_entity_variables.side_effect = _entity_variables
+    # No stat var can have data for 3 of 2 entities.
+    result = self.hierarchy.info('dc/g/Root', ['geoId/06', 'geoId/07'], 3)
+    self.assertEqual(
+        [svg['descendentStatVarCount'] for svg in result['childStatVarGroups']],
+        [0, 0])
+    result = self.hierarchy.info('dc/g/Person_Gender', ['geoId/06'], 2)
+    self.assertEqual([sv['hasData'] for sv in result['childStatVars']],
+                     [False, False])
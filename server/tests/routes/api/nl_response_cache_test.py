@@ -0,0 +1,117 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from flask import Flask
+from flask import request
+from flask_caching import Cache
+
+import server.lib.nl.common.constants as constants
+from server.routes.nl import helpers
+
+_VERSIONS = {'mixer_hash': 'abc', 'embeddings': {'medium_ft': 'v1'}}
+
+
+def _response(session_id):
+  return {
+      'config': {
+          'categories': [{}]
+      },
+      'context': [{
+          'query': 'population of california',
+          'session_id': session_id,
+          'insightCtx': {
+              'sessionId': session_id
+          }
+      }],
+      'debug': {
+          'counters': {
+              'INFO': {},
+              'ERROR': {},
+              'TIMING': {}
+          }
+      },
+      'session': {
+          'id': session_id
+      },
+  }
+
+
+class TestResponseCache(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config['USE_MEMCACHE'] = True
+    self.app.config['LOG_QUERY'] = False
+    test_cache = Cache()
+    test_cache.init_app(self.app, {'CACHE_TYPE': 'SimpleCache'})
+    for patcher in [
+        mock.patch.object(helpers.cache, 'cache', test_cache),
+        mock.patch.object(helpers, '_data_versions', return_value=_VERSIONS)
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def _key(self, url, body):
+    with self.app.test_request_context(url, method='POST', json=body):
+      return helpers.response_cache_key(request, 'explore')
+
+  def test_key(self):
+    key = self._key('/?q=population+of+california&idx=medium_ft', {'dc': ''})
+    self.assertTrue(key)
+    self.assertEqual(
+        self._key('/?q=population++of+california+&idx=medium_ft', {'dc': ''}),
+        key)
+    self.assertNotEqual(
+        self._key('/?q=population+of+california&idx=base_uae_mem', {'dc': ''}),
+        key)
+    self.assertNotEqual(
+        self._key('/?q=population+of+california&idx=medium_ft', {'dc': 'sdg'}),
+        key)
+    # Queries with context are not cached.
+    self.assertEqual(
+        self._key('/?q=population+of+california&idx=medium_ft', {
+            'dc': '',
+            'contextHistory': [{
+                'query': 'poverty'
+            }]
+        }), '')
+
+  def test_hit(self):
+    with self.app.app_context():
+      self.assertIsNone(helpers.get_cached_response('key', 'explore'))
+      helpers.cache_response('key', _response('123_456_explore'))
+
+      got = helpers.get_cached_response('key', 'explore')
+      self.assertEqual(got['context'][0]['session_id'],
+                       constants.TEST_SESSION_ID)
+      self.assertEqual(got['context'][0]['insightCtx']['sessionId'],
+                       constants.TEST_SESSION_ID)
+      self.assertNotIn('session', got)
+      self.assertEqual(got['debug']['counters']['INFO'],
+                       {'info_response_cache_hit': 1})
+
+  def test_not_cached(self):
+    with self.app.app_context():
+      failure = _response('123_456_explore')
+      failure['failure'] = 'Sorry, could not complete your request.'
+      helpers.cache_response('key1', failure)
+      self.assertIsNone(helpers.get_cached_response('key1', 'explore'))
+
+      no_charts = _response('123_456_explore')
+      no_charts['config'] = {}
+      helpers.cache_response('key2', no_charts)
+      self.assertIsNone(helpers.get_cached_response('key2', 'explore'))
@@ -0,0 +1,122 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import random
+import unittest
+from unittest import mock
+
+from server.lib import fetch
+from server.lib import protein_graph
+import server.routes.protein.api as protein_api
+from web_app import app
+
+
+def _random_graph(seed):
+  """Returns a random interaction graph, as the interactingProtein and
+  confidenceScore property values of its proteins and interactions."""
+  rng = random.Random(seed)
+  proteins = [f'P{i}_HUMAN' for i in range(30)]
+  interactors = {f'bio/{p}': [] for p in proteins}
+  scores = {}
+  for _ in range(120):
+    p1, p2 = rng.sample(proteins, 2)
+    interaction_dcid = f'bio/{p1}_{p2}'
+    if interaction_dcid in scores:
+      continue
+    interactors[f'bio/{p1}'].append(interaction_dcid)
+    interactors[f'bio/{p2}'].append(interaction_dcid)
+    kind = rng.random()
+    if kind < 0.6:
+      scores[interaction_dcid] = [f'IntactMiScore{rng.randint(1, 99) / 100}']
+    elif kind < 0.7:
+      scores[interaction_dcid] = ['AuthorScore3.0']
+    elif kind < 0.8:
+      scores[interaction_dcid] = []
+    else:
+      # No confidence score nodes at all.
+      scores[interaction_dcid] = None
+  # Some malformed interactions.
+  interactors['bio/P0_HUMAN'].append('bio/P0_HUMAN')
+  interactors['bio/P1_HUMAN'].append('P1_HUMAN_P2_HUMAN')
+
+  def property_values(nodes, prop, out=True):
+    if prop == 'interactingProtein':
+      return {n: interactors[n] for n in nodes if n in interactors}
+    return {n: scores[n] for n in nodes if scores.get(n) is not None}
+
+  return property_values
+
+
+def _baseline_layer_interactors_and_scores(protein_dcids):
+  """The layer lookup of the PPI endpoint before the interaction graph cache,
+  with a fetch per layer."""
+  layer_interactors = fetch.property_values(protein_dcids, "interactingProtein",
+                                            False)
+  interaction_dcids = []
+  for dcids in layer_interactors.values():
+    interaction_dcids.extend(dcids)
+  layer_score_lists = fetch.property_values(interaction_dcids,
+                                            "confidenceScore")
+  layer_scores = {}
+  for interaction_dcid, score_list in layer_score_lists.items():
+    try:
+      interaction_id = protein_api._id(interaction_dcid)
+    except ValueError:
+      continue
+    layer_scores[interaction_id] = protein_api._extract_intactmi(score_list)
+  return layer_interactors, layer_scores
+
+
+def _normalized(graph):
+  """Sorts the nodes and links of each layer, since their order within a
+  layer comes from set iteration."""
+  return {
+      key: [sorted(layer, key=json.dumps) for layer in layers]
+      for key, layers in graph.items()
+  }
+
+
+class TestProteinProteinInteraction(unittest.TestCase):
+
+  def _ppi(self, center, depth):
+    resp = app.test_client().post('/api/protein/protein-protein-interaction/',
+                                  json={
+                                      'proteinDcid': center,
+                                      'scoreThreshold': 0.3,
+                                      'maxInteractors': 4,
+                                      'maxDepth': depth,
+                                  })
+    self.assertEqual(resp.status_code, 200)
+    return _normalized(json.loads(resp.data))
+
+  def test_matches_baseline(self):
+    for seed in range(10):
+      with mock.patch.object(fetch,
+                             'property_values',
+                             side_effect=_random_graph(seed)):
+        for center, depth in [('bio/P0_HUMAN', 1), ('bio/P1_HUMAN', 3),
+                              ('bio/P5_HUMAN', 2)]:
+          with mock.patch.object(protein_api, '_layer_interactors_and_scores',
+                                 _baseline_layer_interactors_and_scores):
+            want = self._ppi(center, depth)
+          # Run twice with the same graph cache, so that the second run reads
+          # the cache.
+          with mock.patch.object(
+              protein_api, '_INTERACTION_GRAPH',
+              protein_graph.InteractionGraph(protein_api._extract_intactmi)):
+            self.assertEqual(self._ppi(center, depth), want,
+                             f'seed {seed}, {center}')
+            self.assertEqual(self._ppi(center, depth), want,
+                             f'seed {seed}, {center} (cached)')
@@ -0,0 +1,140 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+import unittest
+from unittest import mock
+
+from flask import Flask
+from parameterized import parameterized
+
+import server.services.bigtable as bt
+
+
+class FakeRow:
+
+  def __init__(self, key):
+    self.key = key
+    self.cells = {}
+
+  def set_cell(self, family, column, value):
+    self.cells[column.decode()] = value
+
+
+class FakeTable:
+
+  def __init__(self):
+    self.batches = []
+    # Set to block mutate_rows until it is cleared.
+    self.blocked = threading.Event()
+    self.writing = threading.Event()
+
+  def direct_row(self, key):
+    return FakeRow(key)
+
+  def mutate_rows(self, rows):
+    self.writing.set()
+    while self.blocked.is_set():
+      self.blocked.wait(0.01)
+    self.batches.append(rows)
+    return []
+
+
+def _session(i):
+  return {'id': f'{i}_123_explore', 'items': [{'query': f'query {i}'}]}
+
+
+@mock.patch.object(bt.dc, 'nl_embeddings_version_map',
+                   mock.Mock(return_value={'medium_ft': 'v1'}))
+@mock.patch.object(bt.dc, 'version')
+class TestQueryLogger(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config['LOCAL'] = True
+    self.table = FakeTable()
+
+  def test_batches(self, mock_version):
+    mock_version.return_value = {'gitHash': 'abc', 'tables': 't'}
+    logger = bt.QueryLogger(self.app, self.table, flush_seconds=5)
+    for i in range(3):
+      self.assertTrue(logger.log(_session(i), {'q': i}, {}))
+    # Rows without a session are not logged.
+    self.assertFalse(logger.log({}, {}, {}))
+    logger.close()
+
+    self.assertEqual(len(self.table.batches), 1)
+    rows = self.table.batches[0]
+    self.assertEqual([r.key for r in rows],
+                     [f'{i}_123_explore#'.encode() for i in range(3)])
+    self.assertEqual(json.loads(rows[0].cells['data']), {'q': 0})
+    self.assertEqual(
+        json.loads(rows[0].cells['version'])['embeddings'], {'medium_ft': 'v1'})
+    # The versions are fetched once for the batch.
+    self.assertEqual(mock_version.call_count, 1)
+
+  def test_max_batch_size(self, mock_version):
+    mock_version.return_value = {}
+    logger = bt.QueryLogger(self.app,
+                            self.table,
+                            max_batch_size=2,
+                            flush_seconds=5)
+    for i in range(5):
+      logger.log(_session(i), {}, {})
+    logger.close()
+    self.assertEqual([len(b) for b in self.table.batches], [2, 2, 1])
+    self.assertEqual(mock_version.call_count, 1)
+
+  def test_drops_when_full(self, mock_version):
+    mock_version.return_value = {}
+    logger = bt.QueryLogger(self.app,
+                            self.table,
+                            max_queue_size=2,
+                            max_batch_size=1)
+    self.table.blocked.set()
+    self.assertTrue(logger.log(_session(0), {}, {}))
+    # Wait for the worker to be writing the first row.
+    self.table.writing.wait()
+    self.assertTrue(logger.log(_session(1), {}, {}))
+    self.assertTrue(logger.log(_session(2), {}, {}))
+    self.assertFalse(logger.log(_session(3), {}, {}))
+    self.assertEqual(logger.num_dropped, 1)
+
+    self.table.blocked.clear()
+    logger.close()
+    self.assertEqual(sum(len(b) for b in self.table.batches), 3)
+
+  # With a queue size of 2 the queue is full, so closing can't even queue its
+  # request.
+  @parameterized.expand([(2,), (10,)])
+  def test_close_times_out(self, mock_version, max_queue_size):
+    mock_version.return_value = {}
+    logger = bt.QueryLogger(self.app,
+                            self.table,
+                            max_queue_size=max_queue_size,
+                            max_batch_size=1)
+    self.table.blocked.set()
+    self.addCleanup(self.table.blocked.clear)
+    logger.log(_session(0), {}, {})
+    self.table.writing.wait()
+    # The first row is never written.
+    self.assertTrue(logger.log(_session(1), {}, {}))
+    self.assertTrue(logger.log(_session(2), {}, {}))
+
+    logger.close(timeout=0.1)
+
+    # The queued rows are dropped.
+    self.assertEqual(logger.num_dropped, 2)
+    self.assertEqual(self.table.batches, [])
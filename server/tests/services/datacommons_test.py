@@ -0,0 +1,62 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import server.services.datacommons as dc
+
+
+def _response(status_code, json_data):
+  response = mock.Mock(status_code=status_code, reason='reason', content=b'')
+  response.json.return_value = json_data
+  return response
+
+
+class TestNLBatchCalls(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config['NL_ROOT'] = 'http://nl'
+    self.app.config['MIXER_API_KEY'] = 'key'
+
+  @mock.patch.object(dc, 'post_wrapper')
+  @mock.patch('server.services.datacommons.requests.post')
+  def test_not_cached(self, mock_post, mock_post_wrapper):
+    mock_post.return_value = _response(200, {'results': [{'SV': []}]})
+    with self.app.app_context():
+      for _ in range(2):
+        self.assertEqual(dc.nl_search_sv_many(['income'], 'medium_ft'), [{
+            'SV': []
+        }])
+    self.assertEqual(mock_post.call_count, 2)
+    mock_post.assert_called_with('http://nl/api/search_sv_batch/',
+                                 json={
+                                     'queries': ['income'],
+                                     'sz': 'medium_ft'
+                                 },
+                                 headers={
+                                     'Content-Type': 'application/json',
+                                     'x-api-key': 'key'
+                                 })
+    mock_post_wrapper.assert_not_called()
+
+  @mock.patch('server.services.datacommons.requests.post')
+  def test_error(self, mock_post):
+    mock_post.return_value = _response(500, {})
+    with self.app.app_context():
+      with self.assertRaises(ValueError):
+        dc.nl_detect_place_ner_many(['income in california'])
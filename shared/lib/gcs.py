@@ -29,5 +29,9 @@ def download_file(bucket: str, filename: str) -> str:
   blob = bucket.get_blob(filename)
   # Download
   local_embeddings_path = os.path.join(TEMP_DIR, filename)
-  blob.download_to_filename(local_embeddings_path)
+  # Download to a temporary file and rename it, so that processes downloading
+  # the same file at the same time never read a partial one.
+  tmp_path = f'{local_embeddings_path}.{os.getpid()}.tmp'
+  blob.download_to_filename(tmp_path)
+  os.replace(tmp_path, local_embeddings_path)
   return local_embeddings_path
\ No newline at end of file
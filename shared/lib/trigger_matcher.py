@@ -0,0 +1,82 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Matching of queries against the trigger words of the query classifiers.
+
+The trigger words of a classifier are regex patterns, matched as whole words.
+TriggerMatcher compiles them once, along with a single combined pattern per
+classifier. Since most queries match few classifiers, a query is first checked
+against the combined pattern, and the per-trigger patterns only run for the
+classifiers that match. The result is the same as running every per-trigger
+pattern.
+"""
+
+import re
+from typing import Dict, List, Union
+
+# Matches a trigger as a word, i.e. surrounded by non-word characters or the
+# start/end of the query.
+_WORD_START = r"(^|\W)"
+_WORD_END = r"($|\W)"
+
+# The subtype of classifiers whose triggers are a list rather than a dict.
+NO_SUBTYPE = ''
+
+
+class TriggerMatcher:
+  """Matches queries against the triggers of each classifier in `heuristics`,
+  which are either a list of patterns or a dict of subtype to patterns (like
+  constants.QUERY_CLASSIFICATION_HEURISTICS)."""
+
+  def __init__(self, heuristics: Dict[str, Union[List[str], Dict[str,
+                                                                 List[str]]]]):
+    self._any: Dict[str, re.Pattern] = {}
+    self._triggers: Dict[str, Dict[str, List[re.Pattern]]] = {}
+    for name, triggers in heuristics.items():
+      if not isinstance(triggers, dict):
+        triggers = {NO_SUBTYPE: triggers}
+      self._triggers[name] = {
+          subtype: [re.compile(_WORD_START + t + _WORD_END) for t in ts]
+          for subtype, ts in triggers.items()
+      }
+      alternatives = '|'.join(
+          f'(?:{t})' for ts in triggers.values() for t in ts)
+      self._any[name] = re.compile(_WORD_START + f'(?:{alternatives})' +
+                                   _WORD_END)
+
+  def matches(self, name: str, query: str) -> Dict[str, List[str]]:
+    """Returns the trigger words of classifier `name` found in `query`, by
+    subtype. Only subtypes with matches are included, in the order of the
+    heuristics, and the words of each are in the order of their patterns.
+    """
+    if not self._any[name].search(query):
+      return {}
+    result = {}
+    for subtype, patterns in self._triggers[name].items():
+      words = [m.group() for p in patterns for m in p.finditer(query)]
+      if words:
+        result[subtype] = words
+    return result
+
+  def trigger_words(self, name: str, query: str) -> List[str]:
+    """Returns the trigger words of classifier `name` found in `query`."""
+    return [w for ws in self.matches(name, query).values() for w in ws]
+
+  def match_all(self, query: str) -> Dict[str, Dict[str, List[str]]]:
+    """Returns the matches() of every classifier that has any in `query`."""
+    result = {}
+    for name in self._triggers:
+      matches = self.matches(name, query)
+      if matches:
+        result[name] = matches
+    return result
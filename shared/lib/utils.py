@@ -14,9 +14,10 @@
 """Utility functions shared across servers."""
 
 import copy
+import functools
 import logging
 import re
-from typing import Dict, List, Set, Union
+from typing import Dict, List, Set, Tuple, Union
 
 import shared.lib.constants as constants
 
@@ -52,6 +53,20 @@ def _add_classification_heuristics(set_strings: Set[str]) -> None:
       ]
 
 
+# Characters that make a stop word a regex rather than a literal sequence.
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+_MULTIPLE_SPACES = re.compile(r" +")
+
+
+@functools.lru_cache(maxsize=8192)
+def _stop_word_pattern(words: str) -> Tuple[re.Pattern, bool]:
+  """Returns the compiled pattern for a stop words entry, and whether the
+  entry is literal (i.e. it can only match where it occurs as a substring)."""
+  is_literal = not any(c in _REGEX_SPECIAL_CHARS for c in words)
+  return re.compile(rf"\b{words}\b"), is_literal
+
+
 def remove_stop_words(input_str: str, stop_words: Set[str]) -> str:
   """Remove stop words from a string and return the remaining in lower case."""
 
@@ -64,11 +79,20 @@ def remove_stop_words(input_str: str, stop_words: Set[str]) -> str:
   # Example: if looking for "cat" in sentence "cat is a catty animal. i love a cat  but not cats"
   # the words "citty" and "cats" will not be matched.
   input_str = input_str.lower()
+  collapsed = False
   for words in stop_words:
+    pattern, is_literal = _stop_word_pattern(words)
+    # The stop words set is large and most entries are not in the query, so
+    # skip the regex for literal entries that are not a substring.
+    if collapsed and is_literal and words not in input_str:
+      continue
     # Using regex based replacements.
-    input_str = re.sub(rf"\b{words}\b", "", input_str)
-    # Also replace multiple spaces with a single space.
-    input_str = re.sub(r" +", " ", input_str)
+    input_str, num_removed = pattern.subn("", input_str)
+    # Also replace multiple spaces with a single space (which only changes the
+    # string the first time and after a removal).
+    if num_removed or not collapsed:
+      input_str = _MULTIPLE_SPACES.sub(" ", input_str)
+      collapsed = True
 
   # Return after removing the beginning and trailing white spaces.
   return input_str.strip()
@@ -133,9 +157,11 @@ def place_detection_with_heuristics(query_fn, query: str) -> List[str]:
   string is ignored, i.e. if both "New York" and "New York City" are detected
   then only "New York City" is returned.
   
-  `query_fn` is the function used with every query string to detect places.
-  This function should only expect one required argument: the a query string
-  and returns a list of place strings detected in the provided string.
+  `query_fn` is the function used to detect places in all the query strings at
+  once. This function should only expect one required argument: the list of
+  query strings, and returns, for each of them, the list of place strings
+  detected in it. If it raises an exception, it is called again for each query
+  string on its own, and the strings that still fail are skipped.
   """
   # Run through all heuristics (various query string transforms).
   query = remove_punctuations(query)
@@ -155,44 +181,58 @@ def place_detection_with_heuristics(query_fn, query: str) -> List[str]:
       logging.info(f"Found one of the Special Places: {special_place}")
       places_found.append(special_place)
 
-  # Now try all versions of the query.
-  for q in [
-      query, query_lower, query_without_stop_words, query_title_case,
-      query_without_stop_words_title_case
-  ]:
-    logging.info(f"Trying place detection with: {q}")
-    try:
-      for p in query_fn(q):
-        # remove "the" from the place. This helps where place detection can associate
-        # "the" with some places, e.g. "The United States"
-        # or "the SF Bay Area". Since we are sometimes doing special casing, e.g. for
-        # SF Bay Area, it is desirable to not have place names with these stop words.
-        # It also helps de-dupe where "the US" and "US" could both be detected by the
-        # heuristics above, for example.
-        if "the " in p:
-          p = p.replace("the ", "")
-
-        # If the detected place string needs to be replaced with shorter text,
-        # then do that here.
-        if p.lower() in constants.SHORTEN_PLACE_DETECTION_STRING:
-          p = constants.SHORTEN_PLACE_DETECTION_STRING[p.lower()]
-
-        # Also remove place text detected which is exactly equal to some place types
-        # e.g. "states" etc. This is a shortcoming of place entity recognitiion libraries.
-        # As a specific example, some entity annotation libraries classify "states" as a
-        # place. This is incorrect behavior because "states" on its own is not a place.
-        if (p.lower() in constants.PLACE_TYPE_TO_PLURALS.keys() or
-            p.lower() in constants.PLACE_TYPE_TO_PLURALS.values()):
-          continue
-
-        # Add if not already done. Also check for the special places which get
-        # added with a ", usa" appended.
-        if (p.lower() not in places_found):
-          places_found.append(p.lower())
-    except Exception as e:
-      logging.info(
-          f"query_fn {query_fn} raised an exception for query: '{q}'. Exception: {e}"
-      )
+  # Now try all (distinct) versions of the query.
+  queries = list(
+      dict.fromkeys([
+          query, query_lower, query_without_stop_words, query_title_case,
+          query_without_stop_words_title_case
+      ]))
+  logging.info(f"Trying place detection with: {queries}")
+  try:
+    places_per_query = query_fn(queries)
+  except Exception as e:
+    logging.info(
+        f"query_fn {query_fn} raised an exception for queries: {queries}. Exception: {e}"
+    )
+    # Retry the versions one at a time, so that a version that fails doesn't
+    # drop the places detected in the others.
+    places_per_query = []
+    for q in queries:
+      try:
+        places_per_query.extend(query_fn([q]))
+      except Exception as e:
+        logging.info(
+            f"query_fn {query_fn} raised an exception for query: '{q}'. Exception: {e}"
+        )
+
+  for places in places_per_query:
+    for p in places:
+      # remove "the" from the place. This helps where place detection can associate
+      # "the" with some places, e.g. "The United States"
+      # or "the SF Bay Area". Since we are sometimes doing special casing, e.g. for
+      # SF Bay Area, it is desirable to not have place names with these stop words.
+      # It also helps de-dupe where "the US" and "US" could both be detected by the
+      # heuristics above, for example.
+      if "the " in p:
+        p = p.replace("the ", "")
+
+      # If the detected place string needs to be replaced with shorter text,
+      # then do that here.
+      if p.lower() in constants.SHORTEN_PLACE_DETECTION_STRING:
+        p = constants.SHORTEN_PLACE_DETECTION_STRING[p.lower()]
+
+      # Also remove place text detected which is exactly equal to some place types
+      # e.g. "states" etc. This is a shortcoming of place entity recognitiion libraries.
+      # As a specific example, some entity annotation libraries classify "states" as a
+      # place. This is incorrect behavior because "states" on its own is not a place.
+      if (p.lower() in constants.PLACE_TYPE_TO_PLURALS.keys() or
+          p.lower() in constants.PLACE_TYPE_TO_PLURALS.values()):
+        continue
+
+      # Add if not already done. Also check for the special places which get
+      # added with a ", usa" appended.
+      if (p.lower() not in places_found):
+        places_found.append(p.lower())
 
   places_to_return = []
   # Check if any of the detected place strings are entirely contained inside
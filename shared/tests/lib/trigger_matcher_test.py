@@ -0,0 +1,87 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import unittest
+
+from parameterized import parameterized
+
+import shared.lib.constants as constants
+from shared.lib.trigger_matcher import NO_SUBTYPE
+from shared.lib.trigger_matcher import TriggerMatcher
+
+_HEURISTICS = {
+    "Ranking": {
+        "High": ["most", "top( \\d+)?"],
+        "Low": ["least", "bottom( \\d+)?"],
+    },
+    "Comparison": ["compare(d)?", "vs"],
+}
+
+
+def _per_trigger_matches(triggers, query):
+  if not isinstance(triggers, dict):
+    triggers = {NO_SUBTYPE: triggers}
+  result = {}
+  for subtype, keywords in triggers.items():
+    words = []
+    for keyword in keywords:
+      regex = r"(^|\W)" + keyword + r"($|\W)"
+      words += [w.group() for w in re.finditer(regex, query)]
+    if words:
+      result[subtype] = words
+  return result
+
+
+class TestTriggerMatcher(unittest.TestCase):
+
+  def test_matches(self):
+    matcher = TriggerMatcher(_HEURISTICS)
+    self.assertEqual(matcher.matches("Ranking", "top 10 and least populous"), {
+        "High": ["top 10 "],
+        "Low": [" least "]
+    })
+    self.assertEqual(matcher.trigger_words("Comparison", "compared vs"),
+                     ["compared ", " vs"])
+    self.assertEqual(matcher.match_all("most people vs"), {
+        "Ranking": {
+            "High": ["most "]
+        },
+        "Comparison": {
+            NO_SUBTYPE: [" vs"]
+        }
+    })
+
+  def test_no_match(self):
+    matcher = TriggerMatcher(_HEURISTICS)
+    # Triggers within other words don't match.
+    self.assertEqual(matcher.matches("Ranking", "almost bottomless"), {})
+    self.assertEqual(matcher.trigger_words("Comparison", "versus"), [])
+    self.assertEqual(matcher.match_all("population of california"), {})
+
+  @parameterized.expand([
+      ["top 5 counties with the most people in california"],
+      ["how has the poverty rate changed over the last 10 years"],
+      ["compare obesity vs diabetes in states of the usa"],
+      ["cities with the least income and highest crime"],
+      ["recent earthquakes and fires in california"],
+      ["correlation between unemployment and poverty"],
+      ["what is the median age of women per capita"],
+      ["list of counties in texas by population, smallest first"],
+  ])
+  def test_parity(self, query):
+    matcher = TriggerMatcher(constants.QUERY_CLASSIFICATION_HEURISTICS)
+    for name, triggers in constants.QUERY_CLASSIFICATION_HEURISTICS.items():
+      self.assertEqual(matcher.matches(name, query),
+                       _per_trigger_matches(triggers, query), name)
@@ -0,0 +1,147 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Builds the stat var existence index loaded by server/lib/existence_index.py.
+
+For Earth and its descendent places of the given types, fetches the stat vars
+with data and whether each of their series has a single data point, and writes
+them in the index format, along with the mixer tables they are from.
+"""
+
+import logging
+import os
+
+from absl import app
+from absl import flags
+import requests
+
+from server.lib import existence_index
+
+logging.getLogger().setLevel(logging.INFO)
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('place_types', [
+    'Continent', 'Country', 'State', 'AdministrativeArea1',
+    'AdministrativeArea2', 'County', 'EurostatNUTS1', 'EurostatNUTS2'
+], 'Types of the descendent places of Earth to index')
+flags.DEFINE_string('output', 'existence_index.bin', 'Output index file')
+
+_EARTH = 'Earth'
+API_ROOT = os.environ.get("API_ROOT", "https://api.datacommons.org")
+API_PATH_NODE = API_ROOT + '/v2/node'
+API_PATH_VERSION = API_ROOT + '/version'
+API_PATH_OBSERVATION = API_ROOT + '/v2/observation'
+# Number of places to fetch stat vars for at once.
+_PLACE_BATCH_SIZE = 50
+# Number of stat vars to fetch series facets for at once.
+_SV_BATCH_SIZE = 1000
+
+
+def _headers():
+  headers = {'Content-Type': 'application/json'}
+  mixer_api_key = os.environ.get('MIXER_API_KEY', '')
+  if mixer_api_key:
+    headers['x-api-key'] = mixer_api_key
+  return headers
+
+
+def get(url):
+  response = requests.get(url, headers=_headers())
+  if response.status_code != 200:
+    raise ValueError(
+        'An HTTP {} code ({}) was returned by the mixer: "{}"'.format(
+            response.status_code, response.reason, response.content))
+  return response.json()
+
+
+def post(url, req):
+  # Send the request and verify the request succeeded
+  response = requests.post(url, json=req, headers=_headers())
+  if response.status_code != 200:
+    raise ValueError(
+        'An HTTP {} code ({}) was returned by the mixer: "{}"'.format(
+            response.status_code, response.reason, response.content))
+  return response.json()
+
+
+def get_places():
+  places = [_EARTH]
+  for place_type in FLAGS.place_types:
+    resp = post(
+        API_PATH_NODE, {
+            'nodes': [_EARTH],
+            'property': f'<-containedInPlace+{{typeOf:{place_type}}}'
+        })
+    nodes = resp.get('data', {}).get(_EARTH,
+                                     {}).get('arcs',
+                                             {}).get('containedInPlace+',
+                                                     {}).get('nodes', [])
+    places.extend(n['dcid'] for n in nodes)
+    logging.info('Found %s places of type %s', len(nodes), place_type)
+  return sorted(set(places))
+
+
+def get_place_data(places):
+  """Returns place dcid to the stat vars with data for it, each mapped to
+  whether its series has a single data point."""
+  resp = post(API_PATH_OBSERVATION, {
+      'select': ['variable', 'entity'],
+      'entity': {
+          'dcids': places
+      },
+      'variable': {}
+  })
+  svs = sorted(resp.get('byVariable', {}))
+  place_data = {p: {} for p in places}
+  for i in range(0, len(svs), _SV_BATCH_SIZE):
+    resp = post(
+        API_PATH_OBSERVATION, {
+            'select': ['variable', 'entity', 'facet'],
+            'entity': {
+                'dcids': places
+            },
+            'variable': {
+                'dcids': svs[i:i + _SV_BATCH_SIZE]
+            }
+        })
+    for sv, sv_obs in resp.get('byVariable', {}).items():
+      for place, place_obs in sv_obs.get('byEntity', {}).items():
+        facets = place_obs.get('orderedFacets', [])
+        if not facets:
+          continue
+        # Like the website's check, only the preferred series counts.
+        place_data[place][sv] = facets[0].get('obsCount') == 1
+  return place_data
+
+
+def get_mixer_tables():
+  return get(API_PATH_VERSION).get('tables')
+
+
+def main(_):
+  mixer_tables = get_mixer_tables()
+  places = get_places()
+  place_data = {}
+  for i in range(0, len(places), _PLACE_BATCH_SIZE):
+    place_data.update(get_place_data(places[i:i + _PLACE_BATCH_SIZE]))
+    logging.info('Fetched stat vars for %s of %s places', len(place_data),
+                 len(places))
+  if get_mixer_tables() != mixer_tables:
+    raise ValueError('The mixer tables changed while building the index')
+  existence_index.write(FLAGS.output, place_data, mixer_tables)
+  logging.info('Wrote %s for mixer tables %s', FLAGS.output, mixer_tables)
+
+
+if __name__ == "__main__":
+  app.run(main)
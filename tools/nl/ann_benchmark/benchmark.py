@@ -0,0 +1,118 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures recall and latency of the approximate search backends against
+# exact search over an embeddings index.
+
+import os
+import time
+
+from absl import app
+from absl import flags
+import numpy as np
+import pandas as pd
+
+from nl_server import gcs
+from nl_server import search
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    'embeddings', '', 'Embeddings index. Can be a versioned embeddings file '
+    'name on GCS or a local file with absolute path')
+flags.DEFINE_integer('num_queries', 500,
+                     'Number of index rows held out and used as queries')
+flags.DEFINE_integer('top_k', 40, 'Number of matches per query')
+flags.DEFINE_integer('nlist', 0, 'Number of IVF lists (0 means default)')
+flags.DEFINE_list('nprobes', ['4', '8', '16', '32', '64'],
+                  'Values of IVF nprobe to benchmark')
+flags.DEFINE_list('quantizations', ['float16', 'int8'],
+                  'Quantizations of exact search to benchmark')
+
+
+def _load(embeddings_file):
+  if not os.path.isabs(embeddings_file):
+    embeddings_file = gcs.download_embeddings(embeddings_file)
+  df = pd.read_csv(embeddings_file)
+  df = df.drop(columns=[c for c in ['dcid', 'sentence'] if c in df])
+  return df.to_numpy(dtype=np.float32)
+
+
+def _run(index, queries, top_k):
+  latencies = []
+  hits = []
+  for q in queries:
+    start = time.perf_counter()
+    hits.append(index.search(q, top_k)[0])
+    latencies.append(time.perf_counter() - start)
+  return hits, np.array(latencies) * 1000
+
+
+def _recall(exact_hits, hits):
+  recalls = []
+  for want, got in zip(exact_hits, hits):
+    want_ids = set(h['corpus_id'] for h in want)
+    got_ids = set(h['corpus_id'] for h in got)
+    recalls.append(len(want_ids & got_ids) / len(want_ids))
+  return np.mean(recalls)
+
+
+def _report(name, build_secs, latencies, recall):
+  print(f'{name:<16} build: {build_secs:7.2f}s  '
+        f'p50: {np.percentile(latencies, 50):7.3f}ms  '
+        f'p95: {np.percentile(latencies, 95):7.3f}ms  '
+        f'recall@{FLAGS.top_k}: {recall:.4f}')
+
+
+def main(_):
+  assert FLAGS.embeddings
+  embeddings = _load(FLAGS.embeddings)
+
+  # Hold out some rows to use as queries, so they do not trivially match
+  # themselves.
+  rng = np.random.default_rng(0)
+  held_out = rng.choice(len(embeddings), FLAGS.num_queries, replace=False)
+  queries = embeddings[held_out]
+  embeddings = np.delete(embeddings, held_out, axis=0)
+  print(f'Index: {len(embeddings)} sentences, {len(queries)} queries')
+
+  start = time.perf_counter()
+  exact = search.create(embeddings, {'type': search.EXACT})
+  exact_build = time.perf_counter() - start
+  exact_hits, latencies = _run(exact, queries, FLAGS.top_k)
+  _report('exact', exact_build, latencies, 1.0)
+
+  for quantization in FLAGS.quantizations:
+    start = time.perf_counter()
+    index = search.create(embeddings, {
+        'type': search.EXACT,
+        'quantization': quantization
+    })
+    build_secs = time.perf_counter() - start
+    hits, latencies = _run(index, queries, FLAGS.top_k)
+    _report(f'exact/{quantization}', build_secs, latencies,
+            _recall(exact_hits, hits))
+
+  start = time.perf_counter()
+  ivf = search.create(embeddings, {'type': search.IVF, 'nlist': FLAGS.nlist})
+  ivf_build = time.perf_counter() - start
+  for nprobe in FLAGS.nprobes:
+    ivf.nprobe = min(int(nprobe), ivf.nlist)
+    hits, latencies = _run(ivf, queries, FLAGS.top_k)
+    _report(f'ivf/nprobe={ivf.nprobe}', ivf_build, latencies,
+            _recall(exact_hits, hits))
+
+
+if __name__ == "__main__":
+  app.run(main)
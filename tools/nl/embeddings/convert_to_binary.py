@@ -0,0 +1,61 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Converts an embeddings CSV built by build_embeddings.py into the binary,
+memory-mappable format loaded by the NL server (see
+nl_server/embeddings_file.py)."""
+
+import os
+
+from absl import app
+from absl import flags
+from google.cloud import storage
+
+from nl_server import embeddings_file
+from nl_server import gcs
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    'embeddings', '', 'Embeddings CSV. Can be a versioned embeddings file '
+    'name on GCS or a local file with absolute path')
+flags.DEFINE_enum('dtype', 'float32', ['float32', 'float16'],
+                  'Type to store the embeddings as')
+flags.DEFINE_bool('upload', False,
+                  'Whether to upload the binary file to the GCS bucket')
+
+
+def main(_):
+  assert FLAGS.embeddings
+  csv_path = FLAGS.embeddings
+  if not os.path.isabs(csv_path):
+    csv_path = gcs.download_embeddings(csv_path)
+
+  out_path = embeddings_file.binary_path(csv_path)
+  print(f'Converting {csv_path} to {out_path}')
+  data = embeddings_file.load_csv(csv_path)
+  embeddings_file.write_binary(out_path, data, dtype=FLAGS.dtype)
+  print(f'Wrote {len(data.dcids)} rows')
+
+  if FLAGS.upload:
+    out_filename = os.path.basename(out_path)
+    print(f'Uploading to gs://{gcs.BUCKET}/{out_filename}')
+    bucket = storage.Client().bucket(gcs.BUCKET)
+    # Since the files can be fairly large, use a 10min timeout to be safe.
+    bucket.blob(out_filename).upload_from_filename(out_path, timeout=600)
+    print(f'\t Embeddings Filename: {out_filename}')
+    print('\nNOTE: Please update embeddings.yaml with the Embeddings Filename')
+
+
+if __name__ == "__main__":
+  app.run(main)
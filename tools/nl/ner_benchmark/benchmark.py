@@ -0,0 +1,113 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures place detection accuracy and latency of NER model configurations
+# on the queries of the NL validator place recognition test.
+
+import csv
+import os
+import resource
+import time
+
+from absl import app
+from absl import flags
+import numpy as np
+import spacy
+
+from nl_server import ner_place_model
+
+FLAGS = flags.FLAGS
+
+_GOLDEN_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '../validator/golden/palmplace.csv')
+
+# The full pipeline, as NERPlaces used to load it.
+_FULL = 'full'
+
+flags.DEFINE_string('queries_csv', _GOLDEN_CSV,
+                    'CSV with a "Query" column ending in " in <place name>"')
+flags.DEFINE_integer('num_queries', 2000, 'Max number of queries to use')
+flags.DEFINE_list(
+    'configs', [_FULL, 'en_core_web_lg', 'en_core_web_sm'],
+    f'NER configs to benchmark: "{_FULL}" for the complete '
+    'en_core_web_lg pipeline, or a model name to load via NERPlaces')
+flags.DEFINE_integer('batch_size', 64, 'Queries per batch for batched NER')
+
+
+def _load_queries():
+  with open(FLAGS.queries_csv) as f:
+    queries = [r['Query'] for r in csv.DictReader(f)]
+  return queries[:FLAGS.num_queries]
+
+
+def _expected_place(query):
+  # The validator composes queries as "<SV description> in <place name>".
+  return query.rsplit(' in ', 1)[-1].lower()
+
+
+def _load(config):
+  places = ner_place_model.NERPlaces.__new__(ner_place_model.NERPlaces)
+  if config == _FULL:
+    places.ner_model = spacy.load(ner_place_model.DEFAULT_MODEL_NAME)
+  else:
+    places.ner_model = ner_place_model.load_model(config)
+  return places
+
+
+def _max_rss_mb():
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(_):
+  queries = _load_queries()
+  print(f'Queries: {len(queries)}')
+
+  baseline = None
+  for config in FLAGS.configs:
+    start = time.perf_counter()
+    places = _load(config)
+    load_secs = time.perf_counter() - start
+
+    latencies = []
+    for q in queries:
+      start = time.perf_counter()
+      places.detect_places_ner(q)
+      latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+
+    start = time.perf_counter()
+    results = []
+    for i in range(0, len(queries), FLAGS.batch_size):
+      results.extend(
+          places.detect_places_ner_many(queries[i:i + FLAGS.batch_size]))
+    batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    accuracy = np.mean(
+        [_expected_place(q) in r for q, r in zip(queries, results)])
+    if baseline is None:
+      baseline = results
+    agreement = np.mean([a == b for a, b in zip(baseline, results)])
+
+    print(f'{config:<16} load: {load_secs:6.2f}s  '
+          f'p50: {np.percentile(latencies, 50):7.3f}ms  '
+          f'p95: {np.percentile(latencies, 95):7.3f}ms  '
+          f'batched: {batch_ms:7.3f}ms/query  '
+          f'accuracy: {accuracy:.4f}  '
+          f'agreement with {FLAGS.configs[0]}: {agreement:.4f}  '
+          f'max RSS: {_max_rss_mb():.0f}MB')
+    del places
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -0,0 +1,111 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the query classifier trigger matching and stop word removal with
+# their previous per-word regex implementations, for parity and latency.
+
+import csv
+import os
+import re
+import time
+
+from absl import app
+from absl import flags
+
+import shared.lib.constants as constants
+from shared.lib.trigger_matcher import NO_SUBTYPE
+from shared.lib.trigger_matcher import TriggerMatcher
+import shared.lib.utils as utils
+
+FLAGS = flags.FLAGS
+
+_GOLDEN_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '../validator/golden/palmnl.csv')
+
+flags.DEFINE_string('queries_csv', _GOLDEN_CSV, 'CSV with a "Query" column')
+flags.DEFINE_integer('num_queries', 2000, 'Max number of queries to use')
+flags.DEFINE_integer('repeat', 3, 'Times to run over the queries')
+
+
+def _load_queries():
+  with open(FLAGS.queries_csv) as f:
+    queries = [r['Query'].lower() for r in csv.DictReader(f)]
+  return queries[:FLAGS.num_queries]
+
+
+# The previous trigger matching of heuristic_classifiers.
+def _reference_match_all(query):
+  result = {}
+  for name, triggers in constants.QUERY_CLASSIFICATION_HEURISTICS.items():
+    if not isinstance(triggers, dict):
+      triggers = {NO_SUBTYPE: triggers}
+    matches = {}
+    for subtype, keywords in triggers.items():
+      words = []
+      for keyword in keywords:
+        regex = r"(^|\W)" + keyword + r"($|\W)"
+        words += [w.group() for w in re.finditer(regex, query)]
+      if words:
+        matches[subtype] = words
+    if matches:
+      result[name] = matches
+  return result
+
+
+# The previous utils.remove_stop_words.
+def _reference_remove_stop_words(input_str, stop_words):
+  input_str = input_str.lower()
+  for words in stop_words:
+    input_str = re.sub(rf"\b{words}\b", "", input_str)
+    input_str = re.sub(r" +", " ", input_str)
+  return input_str.strip()
+
+
+def _time_per_query(fn, queries):
+  start = time.perf_counter()
+  for _ in range(FLAGS.repeat):
+    for q in queries:
+      fn(q)
+  return (time.perf_counter() - start) * 1000 / (FLAGS.repeat * len(queries))
+
+
+def _compare(name, reference_fn, fn, queries):
+  mismatches = [q for q in queries if reference_fn(q) != fn(q)]
+  for q in mismatches[:10]:
+    print(f'  MISMATCH: {q}')
+  reference_ms = _time_per_query(reference_fn, queries)
+  ms = _time_per_query(fn, queries)
+  print(f'{name}: {len(mismatches)} mismatches, '
+        f'previous {reference_ms:.3f} ms/query, '
+        f'current {ms:.3f} ms/query ({reference_ms / ms:.1f}x)')
+  return not mismatches
+
+
+def main(_):
+  queries = _load_queries()
+  print(f'{len(queries)} queries')
+
+  triggers = TriggerMatcher(constants.QUERY_CLASSIFICATION_HEURISTICS)
+  stop_words = utils.combine_stop_words()
+  ok = _compare('Trigger matching', _reference_match_all, triggers.match_all,
+                queries)
+  ok &= _compare('Stop word removal',
+                 lambda q: _reference_remove_stop_words(q, stop_words),
+                 lambda q: utils.remove_stop_words(q, stop_words), queries)
+  if not ok:
+    raise SystemExit('Results differ from the previous implementation')
+
+
+if __name__ == "__main__":
+  app.run(main)
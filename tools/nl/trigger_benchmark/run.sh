@@ -0,0 +1,23 @@
+#!/bin/bash
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The tool only uses `shared`, which needs no requirements beyond absl.
+cd ../../..
+python3 -m venv .env
+source .env/bin/activate
+python3 -m pip install --upgrade pip setuptools
+pip3 install -r tools/nl/trigger_benchmark/requirements.txt
+
+python3 -m tools.nl.trigger_benchmark.benchmark "$@"
@@ -0,0 +1,77 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Builds the stat var hierarchy snapshot loaded by server/lib/sv_hierarchy.py.
+
+Walks the stat var hierarchy from the root and writes the unconstrained info of
+every stat var group as a gzipped json object of group dcid to info.
+"""
+
+import gzip
+import json
+import logging
+import os
+
+import requests
+
+logging.getLogger().setLevel(logging.INFO)
+
+_ROOT_SVG = "dc/g/Root"
+API_ROOT = os.environ.get("API_ROOT", "https://api.datacommons.org")
+API_PATH_SVG_INFO = API_ROOT + '/v1/bulk/info/variable-group'
+# Number of stat var groups to request info for at once.
+_BATCH_SIZE = 500
+OUTPUT_FILE = 'sv_hierarchy.json.gz'
+
+
+def post(url, req):
+  headers = {'Content-Type': 'application/json'}
+  mixer_api_key = os.environ.get('MIXER_API_KEY', '')
+  if mixer_api_key:
+    headers['x-api-key'] = mixer_api_key
+  # Send the request and verify the request succeeded
+  response = requests.post(url, json=req, headers=headers)
+  if response.status_code != 200:
+    raise ValueError(
+        'An HTTP {} code ({}) was returned by the mixer: "{}"'.format(
+            response.status_code, response.reason, response.content))
+  return response.json()
+
+
+def build_snapshot():
+  svg_info = {}
+  frontier = [_ROOT_SVG]
+  while frontier:
+    next_frontier = []
+    for i in range(0, len(frontier), _BATCH_SIZE):
+      resp = post(API_PATH_SVG_INFO, {'nodes': frontier[i:i + _BATCH_SIZE]})
+      for item in resp.get('data', []):
+        info = item.get('info', {})
+        svg_info[item['node']] = info
+        for child in info.get('childStatVarGroups', []):
+          if child['id'] not in svg_info:
+            next_frontier.append(child['id'])
+    frontier = sorted(set(next_frontier) - set(svg_info))
+    logging.info('Fetched %s stat var groups', len(svg_info))
+  return svg_info
+
+
+def main():
+  svg_info = build_snapshot()
+  with gzip.open(OUTPUT_FILE, 'wt') as f:
+    json.dump(svg_info, f)
+  logging.info('Wrote %s', OUTPUT_FILE)
+
+
+if __name__ == "__main__":
+  main()